@@ -3,6 +3,7 @@
 import os
 import signal
 import sys
+import threading
 
 from channel import channel_factory
 from common import const
@@ -52,6 +53,26 @@ def resolve_channel_name():
     return channel_name
 
 
+def preload_tokenizer():
+    if not conf().get("tokenizer_preload"):
+        return
+    from bot.chatgpt.chat_gpt_session import preload_tokenizer as preload
+
+    threading.Thread(target=preload, args=(conf().get("model"),), name="tokenizer-preload", daemon=True).start()
+
+
+def resume_jobs(channel):
+    """继续轮询上次退出前未完成的图片/视频生成任务，完成后通过该通道回复"""
+    from common.job_poller import job_poller
+
+    try:
+        count = job_poller.resume(channel)
+        if count:
+            logger.info("[INIT] resumed {} unfinished generation jobs".format(count))
+    except Exception as e:
+        logger.warning("[INIT] resume generation jobs failed: {}".format(e))
+
+
 def bootstrap(register_signals=False):
     global _BOOTSTRAPPED, _BOOTSTRAP_CHANNEL_NAME, _PLUGINS_LOADED
     if not _BOOTSTRAPPED:
@@ -61,6 +82,7 @@ def bootstrap(register_signals=False):
             os.environ["WECHATY_LOG"] = "warn"
             # os.environ['WECHATY_PUPPET_SERVICE_ENDPOINT'] = '127.0.0.1:9001'
         _BOOTSTRAPPED = True
+        preload_tokenizer()
 
     if register_signals:
         sigterm_handler_wrap(signal.SIGINT)
@@ -87,6 +109,7 @@ def create_wsgi_application():
     if not is_feishu_webhook_mode():
         return None
     channel = create_channel(const.FEISHU)
+    resume_jobs(channel)
     return channel.app
 
 
@@ -102,6 +125,7 @@ def run():
             logger.info("For local breakpoint debugging, set DEBUG_FEISHU_WEBHOOK=1 and run python app.py")
             return
 
+        resume_jobs(channel)
         channel.startup()
     except Exception as e:
         logger.error("App startup failed!")
@@ -5,7 +5,9 @@ from PIL import Image
 
 from common import const
 from common.utils import get_ark_sessions
+from common.blob_store import read_media_url, resolve_url
 from common.log import logger
+from common.media_cache import get_image_mime_type, raw_media_items
 from config import conf
 
 
@@ -34,7 +36,7 @@ def process_image_files(file_cache):
         return []
 
     image_contents = []
-    image_files = file_cache["files"]
+    image_files = raw_media_items(file_cache["files"])  # 只需读原文件，不解码图片
     image_paths = file_cache["path"]
     for image_path, image_file in zip(image_paths, image_files):
         image_contents.append(encode_image_content(image_path, image_file))
@@ -107,20 +109,18 @@ def get_image_from_session(session_id):
         if not isinstance(content, list):
             continue
         images = [
-            item["image_url"]["url"]
+            resolve_url(item["image_url"]["url"])
             for item in content
             if item.get("type") == "image_url"
         ]
+        images = [image for image in images if image]  # 已清理的媒体跳过
         if images:
             return images
     return []
 
 
 def _get_image_mime_type(image_file):
-    image_type = type(image_file).__name__
-    if image_type == "PngImageFile":
-        return "image/png"
-    return "image/jpeg"
+    return get_image_mime_type(image_file)
 
 
 def _get_video_mime_type(video_path, video_file):
@@ -132,8 +132,8 @@ def _get_video_mime_type(video_path, video_file):
 
 
 def _decode_image_size(image_url):
-    b64_data = image_url.split(",", 1)[1]
-    img = Image.open(io.BytesIO(base64.b64decode(b64_data)))
+    _, image_bytes = read_media_url(image_url)
+    img = Image.open(io.BytesIO(image_bytes))
     return img.size
 
 
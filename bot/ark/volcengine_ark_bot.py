@@ -26,6 +26,7 @@ from bot.ark.volcengine_ark_session import VolcengineArkSession
 from bridge.context import ContextType, Context
 from bridge.reply import Reply, ReplyType
 from common import const, memory
+from common.blob_store import materialize
 from common.log import logger
 from common.model_status import model_state
 
@@ -128,7 +129,7 @@ class VolcengineArkBot(Bot):
                     session.messages.pop(0)
                 completion = getattr(self.client, client_attr).completions.create(
                     model=self.model,
-                    messages=session.messages,
+                    messages=materialize(session.messages),
                     #thinking={"type": self.thinking}
                 )
                 reply_text = completion.choices[0].message.content
@@ -160,7 +161,7 @@ class VolcengineArkBot(Bot):
                 session.previous_response_id = None
                 session.remote_history_outdated = True
 
-        request_kwargs["input"] = self._to_response_input(session.messages)
+        request_kwargs["input"] = self._to_response_input(materialize(session.messages))
         request_kwargs.pop("previous_response_id", None)
         return self.client.responses.create(**request_kwargs)
 
@@ -22,24 +22,23 @@ class VolcengineArkSession(Session):
     def mark_remote_history_outdated(self):
         self.remote_history_outdated = True
 
-    def calc_tokens(self):
+    def count_message_tokens(self, message):
         """
-        粗略估算当前 session 的 token 数。
+        粗略估算单条消息的 token 数。
         content 可能是字符串或多模态列表，统一提取文本部分计算。
         """
+        content = message.get("content", "")
+        if isinstance(content, str):
+            return len(content) // 2
         total = 0
-        for msg in self.messages:
-            content = msg.get("content", "")
-            if isinstance(content, str):
-                total += len(content) // 2
-            elif isinstance(content, list):
-                for block in content:
-                    if block.get("type") == "text":
-                        total += len(block.get("text", "")) // 2
-                    elif block.get("type") == "image_url":
-                        total += 1500
-                    elif block.get("type") == "video_url":
-                        total += 8000
+        if isinstance(content, list):
+            for block in content:
+                if block.get("type") == "text":
+                    total += len(block.get("text", "")) // 2
+                elif block.get("type") == "image_url":
+                    total += 1500
+                elif block.get("type") == "video_url":
+                    total += 8000
         return total
 
     def discard_exceeding(self, max_tokens, cur_tokens=None):
@@ -48,49 +47,16 @@ class VolcengineArkSession(Session):
         直到 token 数满足要求。
         保证至少保留最后一轮 user 消息，不会把当前消息丢掉。
         """
-        # 第一轮用传入的准确值，后续截断后用估算值
+        # 第一轮用传入的准确值，截断时减去被丢弃消息的估算值
         total = cur_tokens if cur_tokens is not None else (
         self.last_total_tokens + self._calc_last_message_tokens()
         if self.last_total_tokens is not None 
         else self.calc_tokens()
         )
-
-        while True:
-            if total <= max_tokens:
-                return total
-
-            first_non_system = next(
-                (i for i, m in enumerate(self.messages) if m.get("role") != "system"),
-                None
-            )
-            if first_non_system is None:
-                return total
-
-            remaining_non_system = [
-                m for m in self.messages if m.get("role") != "system"
-            ]
-            if len(remaining_non_system) <= 1:
-                return total
-
-            self.messages.pop(first_non_system)
-            total = self.calc_tokens()  # 截断后重新估算
+        return self.trim_messages(max_tokens, total)
     
     def _calc_last_message_tokens(self) -> int:
         """估算最后一条消息即最新query消息的 token 数"""
         if not self.messages:
             return 0
-        msg = self.messages[-1]
-        content = msg.get("content", "")
-        if isinstance(content, str):
-            return len(content) // 2
-        elif isinstance(content, list):
-            total = 0
-            for block in content:
-                if block.get("type") == "text":
-                    total += len(block.get("text", "")) // 2
-                elif block.get("type") == "image_url":
-                    total += 1500
-                elif block.get("type") == "video_url":
-                    total += 8000
-            return total
-        return 0
+        return self.message_tokens(self.messages[-1])
@@ -15,3 +15,10 @@ class Bot(object):
         :return: reply content
         """
         raise NotImplementedError
+
+    def supports_async_reply(self, context: Context) -> bool:
+        """
+        handler_mode 为 asyncio 时，返回True的消息改为调用 async def async_reply(self, query, context) -> Reply，
+        等待模型返回期间不占用线程
+        """
+        return False
@@ -21,7 +21,9 @@ from bot.openai.openai_error import (
 from bot.session_manager import SessionManager
 from bridge.context import ContextType
 from bridge.reply import Reply, ReplyType
+from common.blob_store import materialize
 from common.log import logger
+from common.media_cache import get_image_mime_type, raw_media_items
 from common.model_status import model_state
 from common.token_bucket import TokenBucket
 from common import memory,const
@@ -127,7 +129,7 @@ class ChatGPTBot(Bot):
                     "completion_tokens": 0,
                     "content": f"[{self.model.upper()}] OpenAI 当前请求过多，已触发限流，请稍后重试。",
                 }
-            messages = session.messages
+            messages = materialize(session.messages)  # session 中的媒体引用在这里才还原成 data URL
             if self._should_use_responses_api(args["model"]):
                 try:
                     response = self._create_response(session, messages, args)
@@ -437,7 +439,7 @@ class ChatGPTBot(Bot):
 
         contents = []
         image_paths = image_cache.get("path", [])
-        image_files = image_cache.get("files", [])
+        image_files = raw_media_items(image_cache.get("files", []))  # 只需读原文件，不解码图片
         for image_path, image_file in zip(image_paths, image_files):
             data_url = self._encode_image_file(image_path, image_file)
             if data_url:
@@ -532,8 +534,7 @@ class ChatGPTBot(Bot):
 
     def _encode_image_file(self, image_path, image_file):
         try:
-            image_type = type(image_file).__name__
-            mime_type = "image/png" if image_type == "PngImageFile" else "image/jpeg"
+            mime_type = get_image_mime_type(image_file)
             with open(image_path, "rb") as file:
                 base64_image = base64.b64encode(file.read()).decode("utf-8")
             return f"data:{mime_type};base64,{base64_image}"
@@ -1,6 +1,7 @@
 from bot.session_manager import Session
 from common.log import logger
-from common import const
+from common import const, tokenizer
+from functools import lru_cache
 
 """
     e.g.  [
@@ -40,72 +41,81 @@ class ChatGPTSession(Session):
             else self.calc_tokens()
         )
 
-        while True:
-            if total <= max_tokens:
-                return total
+        total = self.trim_messages(max_tokens, total)
+        if total > max_tokens:
+            logger.warning("user message exceed max_tokens. total_tokens={}".format(total))
+        return total
 
-            first_non_system = next(
-                (i for i, m in enumerate(self.messages) if m.get("role") != "system"),
-                None
-            )
-            if first_non_system is None:
-                return total
+    def count_message_tokens(self, message):
+        return num_tokens_from_message(message, self.model)
 
-            remaining_non_system = [
-                m for m in self.messages if m.get("role") != "system"
-            ]
-            if len(remaining_non_system) <= 1:
-                logger.warning("user message exceed max_tokens. total_tokens={}".format(total))
-                return total
-
-            self.messages.pop(first_non_system)
-            total = self.calc_tokens()
-
-    def calc_tokens(self):
-        return num_tokens_from_messages(self.messages, self.model)
+    def count_base_tokens(self):
+        return 0 if is_estimated_model(self.model) else 3  # every reply is primed with <|start|>assistant<|message|>
 
     def _calc_last_message_tokens(self) -> int:
         if not self.messages:
             return 0
-        return estimate_message_tokens(self.messages[-1])
+        return self.message_tokens(self.messages[-1])
 
 
 # refer to https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
 def num_tokens_from_messages(messages, model):
     """Returns the number of tokens used by a list of messages."""
 
-    if model in ["wenxin", "xunfei", const.GEMINI] or model in const.GPT54_LIST:
+    if is_estimated_model(model):
         return sum(estimate_message_tokens(msg) for msg in messages)
 
-    import tiktoken
+    encoding, tokens_per_message, tokens_per_name = _get_tiktoken_params(model)
+    num_tokens = 0
+    for message in messages:
+        num_tokens += tokens_per_message
+        num_tokens += _count_message_tokens_with_encoding(message, encoding, tokens_per_name)
+    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+    return num_tokens
+
+
+def num_tokens_from_message(message, model):
+    """单条消息的token数，不含回复的引导token"""
+    if is_estimated_model(model):
+        return estimate_message_tokens(message)
+
+    encoding, tokens_per_message, tokens_per_name = _get_tiktoken_params(model)
+    return tokens_per_message + _count_message_tokens_with_encoding(message, encoding, tokens_per_name)
+
+
+def is_estimated_model(model):
+    """这些模型没有对应的tiktoken编码，按字符数估算token"""
+    return model in ["wenxin", "xunfei", const.GEMINI] or model in const.GPT54_LIST
 
+
+@lru_cache(maxsize=None)
+def _get_tiktoken_params(model):
+    """返回(encoding, tokens_per_message, tokens_per_name)，每个模型只解析一次"""
     if model in ["gpt-3.5-turbo-0301", "gpt-35-turbo", "gpt-3.5-turbo-1106"]:
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
+        return _get_tiktoken_params("gpt-3.5-turbo")
     elif model in ["gpt-4-0314", "gpt-4-0613", "gpt-4-32k", "gpt-4-32k-0613", "gpt-3.5-turbo-0613",
                    "gpt-3.5-turbo-16k", "gpt-3.5-turbo-16k-0613", "gpt-35-turbo-16k", 
                    const.GPT4_TURBO_PREVIEW, const.GPT4_VISION_PREVIEW, const.GPT4_TURBO,const.GPT4_OMNI]:
-        return num_tokens_from_messages(messages, model="gpt-4")
+        return _get_tiktoken_params("gpt-4")
 
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.debug("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+    encoding = tokenizer.get_encoding_for_model(model)
     if model == "gpt-3.5-turbo":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
+        return encoding, 4, -1  # every message follows <|start|>{role/name}\n{content}<|end|>\n; if there's a name, the role is omitted
     elif model == "gpt-4":
-        tokens_per_message = 3
-        tokens_per_name = 1
-    else:
-        logger.warning(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo")
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        num_tokens += _count_message_tokens_with_encoding(message, encoding, tokens_per_name)
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-    return num_tokens
+        return encoding, 3, 1
+    logger.warning(f"num_tokens_from_messages() is not implemented for model {model}. Returning num tokens assuming gpt-3.5-turbo.")
+    return _get_tiktoken_params("gpt-3.5-turbo")
+
+
+def preload_tokenizer(model):
+    """提前加载模型对应的编码，避免第一条消息等待BPE文件加载"""
+    if not model or is_estimated_model(model):
+        return
+    try:
+        _get_tiktoken_params(model)
+        logger.info(f"[Tokenizer] encoding preloaded for model {model}")
+    except Exception as e:
+        logger.warning(f"[Tokenizer] failed to preload encoding for model {model}: {e}")
 
 def estimate_message_tokens(message: dict) -> int:
     total = 4
@@ -157,7 +167,7 @@ def _count_message_tokens_with_encoding(message: dict, encoding, tokens_per_name
         if key == "content":
             total += _count_content_tokens_with_encoding(value, encoding)
         else:
-            total += len(encoding.encode(str(value)))
+            total += tokenizer.count_tokens(encoding, str(value))
             if key == "name":
                 total += tokens_per_name
     return total
@@ -165,36 +175,36 @@ def _count_message_tokens_with_encoding(message: dict, encoding, tokens_per_name
 
 def _count_content_tokens_with_encoding(content, encoding) -> int:
     if isinstance(content, str):
-        return len(encoding.encode(content))
+        return tokenizer.count_tokens(encoding, content)
     if isinstance(content, list):
         return sum(_count_content_tokens_with_encoding(block, encoding) for block in content)
     if isinstance(content, dict):
         return _count_content_dict_tokens_with_encoding(content, encoding)
-    return len(encoding.encode(str(content)))
+    return tokenizer.count_tokens(encoding, str(content))
 
 
 def _count_content_dict_tokens_with_encoding(content: dict, encoding) -> int:
     block_type = content.get("type")
     if block_type in {"text", "input_text", "output_text"}:
-        return len(encoding.encode(content.get("text", "")))
+        return tokenizer.count_tokens(encoding, content.get("text", ""))
     if block_type in {"image_url", "input_image", "image"}:
         image_url = content.get("image_url")
         if isinstance(image_url, dict):
             image_url = image_url.get("url", "")
-        return len(encoding.encode(str(image_url))) if image_url else 1500
+        return tokenizer.count_tokens(encoding, str(image_url)) if image_url else 1500
     if block_type in {"video_url", "input_video", "video"}:
         video_url = content.get("video_url")
         if isinstance(video_url, dict):
             url = video_url.get("url", "")
             remote_url = video_url.get("remote_url", "")
             payload = f"{url}{remote_url}"
-            return len(encoding.encode(payload)) if payload else 8000
-        return len(encoding.encode(str(video_url))) if video_url else 8000
+            return tokenizer.count_tokens(encoding, payload) if payload else 8000
+        return tokenizer.count_tokens(encoding, str(video_url)) if video_url else 8000
 
     total = 0
     for value in content.values():
         if isinstance(value, str):
-            total += len(encoding.encode(value))
+            total += tokenizer.count_tokens(encoding, value)
         elif isinstance(value, list):
             total += sum(_count_content_tokens_with_encoding(item, encoding) for item in value)
         elif isinstance(value, dict):
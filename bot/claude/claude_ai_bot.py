@@ -1,13 +1,15 @@
 import io
 import os
+import asyncio
 import base64
 
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
 from bot.bot import Bot
 from bot.claude.claude_ai_session import ClaudeAiSession
 from bot.session_manager import SessionManager
 from bridge.context import Context, ContextType
 from bridge.reply import Reply, ReplyType
+from common.blob_store import materialize
 from common.log import logger
 from common import memory
 from config import conf
@@ -27,6 +29,7 @@ class ClaudeAIBot(Bot):
             api_key=conf().get("anthropic_api_key"),
             base_url=conf().get("anthropic_base_url")
         )
+        self._async_client = None  # handler_mode为asyncio时使用，首次调用时创建
         self.sessions = SessionManager(ClaudeAiSession, model=conf().get("model") or "gpt-3.5-turbo")
         self.system_prompt = conf().get("character_desc")
         self.claude_api_cookie = conf().get("anthropic_api_cookie")
@@ -68,49 +71,12 @@ class ClaudeAIBot(Bot):
             return Reply(ReplyType.ERROR, "请再问我一次吧")
 
         try:
-            # 先构建多模态 content 块（含媒体+文本）
-            current_content = self._build_current_content(query, session_id)
-            logger.info(f"[{self.Model_ID}] query={query}")
+            create_kwargs, current_content, is_searching = self._prepare_chat(query, session_id, self.model)
 
-            # 将多模态 content 块写入 session，而不是纯字符串 query
-            #
-            self.sessions.session_query(current_content, session_id)  # ← 传入列表，保留媒体块
-            
-            # 从 session 获取完整消息历史
-            session = self.sessions.build_session(session_id)
-            claude_message = session.messages
-
-            # 判断联网搜索状态
-            is_searching = tool_state.get_search_state(session_id)
-
-            create_kwargs = dict(
-                model=self.model,
-                max_tokens=1000,
-                temperature=0.0,
-                system=self.system_prompt,
-                messages=claude_message
-            )
-            
-            if is_searching:
-                create_kwargs["tools"] = [
-                    {
-                        "type": "web_search_20250305", 
-                        "name": "web_search",
-                        "max_uses": 5
-                    }
-                ]
             if is_searching and not self.stream:
                 # 搜索开启 + stream 关闭 → IMAGE_URL 模式
                 response = self._create_claude_message(create_kwargs, current_content)
-                # 提取文本回复
-                reply_content = ""
-                for block in response.content:
-                    if hasattr(block, "text"):
-                        reply_content += block.text
-
-                logger.info(f"[{self.Model_ID}] reply={reply_content}, total_tokens=invisible")
-                self.sessions.session_reply(reply_content, session_id, 100)
-                return Reply(ReplyType.IMAGE_URL, response)
+                return self._build_reply(response, session_id, is_searching, self.model)
             
             elif self.stream:
                 # stream 开启 → STREAM 模式
@@ -136,17 +102,87 @@ class ClaudeAIBot(Bot):
             else:
                 # 普通模式
                 response = self._create_claude_message(create_kwargs, current_content)
-                reply_content = ""
-                for block in response.content:
-                    if hasattr(block, "text"):
-                        reply_content += block.text
-                logger.info(f"[{self.Model_ID}] reply={reply_content}")
-                self.sessions.session_reply(reply_content, session_id, 100)
-                return Reply(ReplyType.TEXT, reply_content)
+                return self._build_reply(response, session_id, is_searching, self.model)
 
         except Exception as e:
             logger.error("[{}] fetch reply error, {}".format(self.Model_ID, e))
             return Reply(ReplyType.ERROR, f"[{self.Model_ID}] {e}")
+
+    def supports_async_reply(self, context: Context) -> bool:
+        # 流式回复由通道发送时逐段读取，仍走同步接口
+        return context.type == ContextType.TEXT and not self.stream
+
+    async def async_reply(self, query, context: Context = None) -> Reply:
+        """与_chat的非流式分支一致，通过AsyncAnthropic请求，等待返回期间不占用线程"""
+        session_id = context["session_id"]
+        # 多个会话的协程并发执行，请求用的模型取局部变量，不依赖self.model
+        model = model_state.get_basic_state(session_id)
+        model_id = self.Model_ID = model.upper()
+        try:
+            # 编码图片、读取文档可能较慢，不放在事件循环线程中执行
+            create_kwargs, current_content, is_searching = await asyncio.to_thread(self._prepare_chat, query, session_id, model)
+            response = await self._create_claude_message(create_kwargs, current_content, client=self.async_client)
+            return self._build_reply(response, session_id, is_searching, model)
+        except Exception as e:
+            logger.error("[{}] fetch reply error, {}".format(model_id, e))
+            return Reply(ReplyType.ERROR, f"[{model_id}] {e}")
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            self._async_client = AsyncAnthropic(
+                api_key=conf().get("anthropic_api_key"),
+                base_url=conf().get("anthropic_base_url")
+            )
+        return self._async_client
+
+    def _prepare_chat(self, query, session_id, model):
+        """构建本轮content并写入session，返回(请求参数, 本轮content, 是否联网搜索)"""
+        # 先构建多模态 content 块（含媒体+文本）
+        current_content = self._build_current_content(query, session_id)
+        logger.info(f"[{model.upper()}] query={query}")
+
+        # 将多模态 content 块写入 session，而不是纯字符串 query
+        #
+        self.sessions.session_query(current_content, session_id)  # ← 传入列表，保留媒体块
+        
+        # 从 session 获取完整消息历史
+        session = self.sessions.build_session(session_id)
+        claude_message = materialize(session.messages)
+
+        # 判断联网搜索状态
+        is_searching = tool_state.get_search_state(session_id)
+
+        create_kwargs = dict(
+            model=model,
+            max_tokens=1000,
+            temperature=0.0,
+            system=self.system_prompt,
+            messages=claude_message
+        )
+        
+        if is_searching:
+            create_kwargs["tools"] = [
+                {
+                    "type": "web_search_20250305", 
+                    "name": "web_search",
+                    "max_uses": 5
+                }
+            ]
+        return create_kwargs, current_content, is_searching
+
+    def _build_reply(self, response, session_id, is_searching, model) -> Reply:
+        """提取文本回复写回session；搜索开启时返回IMAGE_URL模式，由通道展示引用"""
+        reply_content = ""
+        for block in response.content:
+            if hasattr(block, "text"):
+                reply_content += block.text
+        self.sessions.session_reply(reply_content, session_id, 100)
+        if is_searching:
+            logger.info(f"[{model.upper()}] reply={reply_content}, total_tokens=invisible")
+            return Reply(ReplyType.IMAGE_URL, response)
+        logger.info(f"[{model.upper()}] reply={reply_content}")
+        return Reply(ReplyType.TEXT, reply_content)
         
     def _build_current_content(self, query: str, session_id: str) -> list:
         """
@@ -284,14 +320,16 @@ class ClaudeAIBot(Bot):
                 return True
         return False
 
-    def _create_claude_message(self, create_kwargs, current_content):
+    def _create_claude_message(self, create_kwargs, current_content, client=None):
+        """client为AsyncAnthropic时返回协程"""
+        client = client or self.client
         session_messages = create_kwargs.get("messages", [])
         if self._requires_files_api(current_content, session_messages):
-            return self.client.beta.messages.create(
+            return client.beta.messages.create(
                 **create_kwargs,
                 betas=[self._CLAUDE_FILES_API_BETA]
             )
-        return self.client.messages.create(**create_kwargs)
+        return client.messages.create(**create_kwargs)
 
     def _stream_claude_message(self, create_kwargs, current_content):
         session_messages = create_kwargs.get("messages", [])
@@ -0,0 +1,141 @@
+"""
+Gemini chat历史压缩：SDK的chat对象每次send_message都会重发完整历史(包括内联的图片、PDF字节)，也不受会话token上限约束，
+长期使用的会话请求越来越大、越来越慢。每轮发送前调用compact_history：
+- 估算历史的token数，超出预算时从最早的轮次开始丢弃，至少保留最近一轮
+- 保留下来的内联媒体上传到Files API，改为file_data引用，之后的请求不再携带原始字节；同一份内容只上传一次
+- Files API的文件48小时后删除，已过期的引用替换为文字说明
+有变化时返回新的历史，由调用方据此重建chat。
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from google.genai import types
+
+from common.expired_dict import ExpiredDict
+from common.log import logger
+
+# 媒体part的token数粗估：Gemini每张图片258 token，PDF每页258 token(按20页估)，音视频按一分钟估
+MEDIA_PART_TOKENS = {"image": 258, "audio": 32 * 60, "video": 263 * 60}
+DOCUMENT_PART_TOKENS = 258 * 20
+INLINE_OFFLOAD_MIN_BYTES = 32 * 1024  # 更小的内联媒体直接保留，不值得多一次上传
+FILE_TTL_SECONDS = 47 * 3600  # Files API保存48小时，留出余量
+EXPIRED_MEDIA_TEXT = "[此前发送的媒体文件已过期]"
+MAX_UPLOAD_RECORDS = 65536
+
+_uploads = ExpiredDict(FILE_TTL_SECONDS, max_entries=4096)  # (api_key, sha256) -> (file_uri, 上传时间)
+# file_uri -> 上传时间；过期后仍要保留记录才能识别出过期的引用，所以不用ExpiredDict，只按数量淘汰最早的记录
+_upload_times = OrderedDict()
+_upload_times_lock = threading.Lock()
+
+
+def register_upload(file_uri, uploaded_at=None):
+    """记录Files API文件的上传时间，用于判断历史中的引用是否过期"""
+    if not file_uri:
+        return
+    with _upload_times_lock:
+        _upload_times[file_uri] = uploaded_at or time.time()
+        _upload_times.move_to_end(file_uri)
+        while len(_upload_times) > MAX_UPLOAD_RECORDS:
+            _upload_times.popitem(last=False)
+
+
+def file_expired(file_uri, now=None):
+    with _upload_times_lock:
+        uploaded_at = _upload_times.get(file_uri)
+    if uploaded_at is None:
+        # 不是本进程上传的文件无从判断
+        return False
+    return (now or time.time()) - uploaded_at >= FILE_TTL_SECONDS
+
+
+def upload_once(api_key, data, mime_type, upload_bytes):
+    """同一个key下相同内容只上传一次，upload_bytes(data, mime_type)返回file_uri"""
+    key = (api_key, hashlib.sha256(data).hexdigest())
+    cached = _uploads.get(key)
+    if cached and time.time() - cached[1] < FILE_TTL_SECONDS:
+        return cached[0]
+    file_uri = upload_bytes(data, mime_type)
+    uploaded_at = time.time()
+    _uploads[key] = (file_uri, uploaded_at)
+    register_upload(file_uri, uploaded_at)
+    return file_uri
+
+
+def part_tokens(part):
+    if part.text:
+        return len(part.text)
+    media = part.inline_data or part.file_data
+    if media is not None:
+        kind = (media.mime_type or "").split("/")[0]
+        return MEDIA_PART_TOKENS.get(kind, DOCUMENT_PART_TOKENS)
+    if part.function_call is not None:
+        return len(str(part.function_call.args or ""))
+    if part.function_response is not None:
+        return len(str(part.function_response.response or ""))
+    return 0
+
+
+def content_tokens(content):
+    return sum(part_tokens(part) for part in content.parts or [])
+
+
+def _turn_starts(history):
+    """每一轮从用户消息开始；函数调用结果也是user角色，但属于上一轮"""
+    return [
+        index for index, content in enumerate(history)
+        if content.role == "user" and not any(part.function_response is not None for part in content.parts or [])
+    ]
+
+
+def trim_history(history, max_tokens):
+    """从最早的轮次开始丢弃，直到不超过max_tokens，至少保留最近一轮；返回(历史, 剩余token数)"""
+    tokens = [content_tokens(content) for content in history]
+    total = sum(tokens)
+    if not max_tokens or total <= max_tokens:
+        return history, total
+    cut = 0
+    for start in _turn_starts(history)[1:] if history else []:
+        if total <= max_tokens:
+            break
+        total -= sum(tokens[cut:start])
+        cut = start
+    return history[cut:], total
+
+
+def _offload_part(part, upload, now):
+    blob = part.inline_data
+    if blob is not None and blob.data and len(blob.data) >= INLINE_OFFLOAD_MIN_BYTES:
+        try:
+            file_uri = upload(blob.data, blob.mime_type)
+        except Exception as e:
+            logger.warning(f"[Gemini] upload history media failed, keep inline, mime_type={blob.mime_type}, error={e}")
+            return part
+        return types.Part(file_data=types.FileData(file_uri=file_uri, mime_type=blob.mime_type))
+    file_data = part.file_data
+    if file_data is not None and file_expired(file_data.file_uri, now):
+        return types.Part(text=EXPIRED_MEDIA_TEXT)
+    return part
+
+
+def offload_media(history, upload):
+    """内联媒体换成Files API引用，过期引用换成文字；返回(历史, 是否有变化)"""
+    now = time.time()
+    changed = False
+    result = []
+    for content in history:
+        parts = [_offload_part(part, upload, now) for part in content.parts or []]
+        if any(new is not old for new, old in zip(parts, content.parts or [])):
+            content = types.Content(role=content.role, parts=parts)
+            changed = True
+        result.append(content)
+    return result, changed
+
+
+def compact_history(history, max_tokens, upload):
+    """先按预算裁剪(丢弃的轮次不必上传)，再处理保留下来的媒体；返回(历史, 是否有变化)"""
+    trimmed, _ = trim_history(history, max_tokens)
+    offloaded, changed = offload_media(trimmed, upload)
+    return offloaded, changed or len(trimmed) != len(history)
@@ -0,0 +1,56 @@
+"""
+进程内共享的genai.Client：按(api_key, base_url, http_options)各保留一个实例，
+对话(bot/gemini)、图片(image/google)、视频(video/google)共用，底层HTTP连接池跨请求复用，不必每条消息都重新创建客户端和握手。
+用法：
+    from bot.gemini.gemini_client import gemini_client
+    client = gemini_client(conf().get("gemini_api_key"))
+"""
+
+import json
+import os
+import threading
+
+from google import genai
+
+from common.log import logger
+from config import conf
+
+_lock = threading.Lock()
+_clients = {}  # (api_key, base_url, http_options的JSON) -> genai.Client
+_clients_pid = None
+
+
+def gemini_client(api_key, base_url=None, http_options=None):
+    """获取共享的genai.Client，首次使用时创建；base_url、http_options默认取配置gemini_base_url、gemini_http_options"""
+    global _clients_pid
+    if base_url is None:
+        base_url = conf().get("gemini_base_url") or None
+    if http_options is None:
+        http_options = conf().get("gemini_http_options") or {}
+    key = (api_key, base_url, json.dumps(http_options, sort_keys=True, default=str))
+    client = _clients.get(key)
+    if client is not None and _clients_pid == os.getpid():
+        return client
+    with _lock:
+        if _clients_pid != os.getpid():
+            # fork出的子进程不能复用父进程的连接
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = _build_client(api_key, base_url, http_options)
+        return client
+
+
+def gemini_client_count():
+    with _lock:
+        return len(_clients)
+
+
+def _build_client(api_key, base_url, http_options):
+    options = dict(http_options)
+    if base_url:
+        options["base_url"] = base_url
+    client = genai.Client(api_key=api_key, http_options=options or None)
+    logger.debug(f"[GeminiClient] client created, base_url={base_url}, http_options={http_options}, clients={len(_clients) + 1}")
+    return client
@@ -1,16 +1,16 @@
 import base64
 import os
 import tempfile
-import time
 from io import BytesIO
 
 from PIL import Image
-from google import genai
 from google.genai import types
 from google.genai.types import Part, GenerateContentConfig
 
+from bot.gemini.gemini_client import gemini_client
 from bot.gemini.google_gemini_session import _gemini_sessions
 from common import const
+from common.blob_store import read_media_url
 from common.log import logger
 from common.model_status import model_state
 from common.utils import get_chat_session_manager
@@ -53,7 +53,7 @@ class DownloadedGeminiVideo(BytesIO):
 
 
 def get_paid_client(api_key):
-    return genai.Client(api_key=api_key)
+    return gemini_client(api_key)
 
 
 def get_user_image_chat(session_id, image_model, *, paid_client, safety_settings, aspect_ratio=None):
@@ -139,14 +139,13 @@ def clear_image_context_marker(session_id):
 
 
 def data_url_to_part(image_url):
-    header, b64_data = image_url.split(",", 1)
-    mime_type = header.split(":", 1)[1].split(";", 1)[0]
-    return Part.from_bytes(data=base64.b64decode(b64_data), mime_type=mime_type)
+    mime_type, image_bytes = read_media_url(image_url)
+    return Part.from_bytes(data=image_bytes, mime_type=mime_type)
 
 
 def data_url_to_pil_image(image_url):
-    _, b64_data = image_url.split(",", 1)
-    image = Image.open(BytesIO(base64.b64decode(b64_data)))
+    _, image_bytes = read_media_url(image_url)
+    image = Image.open(BytesIO(image_bytes))
     image.load()
     return image
 
@@ -183,7 +182,7 @@ def build_ref_images_obj(ref_images):
     return ref_images_obj
 
 
-def generate_video(
+def submit_video_generation(
     *,
     paid_client,
     session_id,
@@ -243,16 +242,17 @@ def generate_video(
     else:
         logger.info(f"[{video_model}] Text-to-video mode.")
 
-    operation = paid_client.models.generate_videos(**request_kwargs)
+    return paid_client.models.generate_videos(**request_kwargs)
 
-    poll_interval_seconds = 10
-    logger.info(f"[{video_model}] Waiting for video generation to complete...")
-    while not operation.done:
-        logger.info(f"[{video_model}] Polling task status, retry after {poll_interval_seconds} seconds")
-        time.sleep(poll_interval_seconds)
-        operation = paid_client.operations.get(operation)
-    logger.info(f"[{video_model}] Video generation completed successfully.")
 
+def get_video_operation(paid_client, operation_name):
+    """按名称查询视频生成任务，重启后也可以用保存的名称继续查询"""
+    return paid_client.operations.get(types.GenerateVideosOperation(name=operation_name))
+
+
+def download_generated_video(paid_client, video_model, operation):
+    """下载已完成任务生成的视频"""
+    logger.info(f"[{video_model}] Video generation completed successfully.")
     response_payload = getattr(operation, "response", None)
     generated_videos = getattr(response_payload, "generated_videos", None)
     if not generated_videos and isinstance(response_payload, dict):
@@ -287,6 +287,7 @@ def extract_inline_image(response):
 
 
 def _build_image_context_signature(images, prompt):
+    # session 中的图片是 blob 引用，签名只包含很短的内容哈希
     return f"{len(images)}|{images[0] if images else ''}|{prompt}"
 
 
@@ -7,11 +7,11 @@ Google gemini bot
 # encoding:utf-8
 
 import base64
+import io
 import os, time
 import shutil
 import tempfile
 
-from google import genai
 from google.genai import types
 from google.genai.types import Tool, GenerateContentConfig, GoogleSearch, Part, FunctionDeclaration, Type, FileData
 
@@ -23,13 +23,17 @@ from bot.gemini.gemini_common import (
     mark_image_context_injected,
     should_inject_image_context,
 )
+from bot.gemini.gemini_client import gemini_client
+from bot.gemini.gemini_chat_history import compact_history, content_tokens, register_upload, upload_once
 from bot.gemini.gemini_error import format_gemini_error, is_gemini_sdk_error
 from bot.gemini.google_gemini_session import _gemini_sessions
 
 from bridge.context import ContextType, Context
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.media_cache import LazyFileItem, MediaHandle, raw_media_items
 from common import const, memory
+from common.expired_dict import ExpiredDict
 from common.tool_button import tool_state
 from common.model_status import model_state
 
@@ -85,7 +89,7 @@ class GoogleGeminiBot(Bot):
         self.tool_config={'function_calling_config': 'AUTO'}
 
         # Default client; paid models will switch to the paid key dynamically.
-        self.client = genai.Client(api_key=self.api_key)
+        self.client = gemini_client(self.api_key)
          # schema for screenplay_scenes_breakdown need to be updated
         self.screenplay_scenes_breakdown_schema = FunctionDeclaration(
             name="screenplay_scenes_breakdown",
@@ -351,34 +355,73 @@ class GoogleGeminiBot(Bot):
             response_modalities=['TEXT'],
             **self.generation_config
         )
-        # 用字典存储用户会话实例
-        self.user_chats = {}
+        # 用户会话的chat实例：与会话一同过期，数量超过上限时淘汰最久未使用的
+        self.user_chats = ExpiredDict(
+            conf().get("expires_in_seconds") or 3600,
+            max_entries=conf().get("gemini_max_chats", 1000),
+        )
+
+    def _get_api_key_by_model(self, model):
+        return self.api_key_paid if model in const.GEMINI_PAID else self.api_key
 
     def _get_client_by_model(self, model):
-        api_key = self.api_key_paid if model in const.GEMINI_PAID else self.api_key
-        return genai.Client(api_key=api_key)
+        return gemini_client(self._get_api_key_by_model(model))
+
+    def _create_chat(self, model, history=None):
+        return self.client.chats.create(
+            model=model,
+            config=GenerateContentConfig(
+                system_instruction=self.system_prompt,
+                safety_settings=self.safety_settings,
+                tools=[self.function_declarations],
+                tool_config={
+                    'function_calling_config': {
+                        'mode': 'NONE'
+                    }
+                },
+                response_modalities=['TEXT'],
+                **self.generation_config
+            ),
+            history=history,
+        )
 
     def _get_user_chat(self, session_id, model):
-        """获取指定用户的chat实例,如果不存在则创建新的"""
+        """获取指定用户的chat实例,如果不存在则创建新的；会话过期或被清除后chat也重新创建"""
         chat_key = f"{session_id}:{model}"
         self.client = self._get_client_by_model(model)
-        if chat_key not in self.user_chats:
-            self.user_chats[chat_key] = self.client.chats.create(
-                model=model,
-                config=GenerateContentConfig(
-                    system_instruction=self.system_prompt,
-                    safety_settings=self.safety_settings,
-                    tools=[self.function_declarations],
-                    tool_config={
-                        'function_calling_config': {
-                            'mode': 'NONE'
-                        }
-                    },
-                    response_modalities=['TEXT'],
-                    **self.generation_config
-                )
-            )
-        return self.user_chats[chat_key]
+        session = self.sessions.build_session(session_id)
+        cached = self.user_chats.get(chat_key)
+        if cached is not None and cached[1] is session:
+            user_chat = self._compact_chat(cached[0], model)
+        else:
+            user_chat = self._create_chat(model)
+        self.user_chats[chat_key] = (user_chat, session)
+        return user_chat
+
+    def _compact_chat(self, user_chat, model):
+        """chat历史超出token预算或带有内联媒体时，用压缩后的历史重建chat"""
+        history = user_chat.get_history(curated=True)
+        if not history:
+            return user_chat
+        api_key = self._get_api_key_by_model(model)
+        max_tokens = conf().get("gemini_chat_max_tokens", 128000)
+        compacted, changed = compact_history(
+            history,
+            max_tokens,
+            lambda data, mime_type: upload_once(api_key, data, mime_type, self._upload_bytes),
+        )
+        if not changed:
+            return user_chat
+        logger.info(
+            f"[{model.upper()}] chat history compacted, contents={len(history)}->{len(compacted)}, "
+            f"tokens={sum(map(content_tokens, history))}->{sum(map(content_tokens, compacted))}, max_tokens={max_tokens}"
+        )
+        return self._create_chat(model, compacted)
+
+    def _upload_bytes(self, data, mime_type):
+        file = self.client.files.upload(file=io.BytesIO(data), config={"mime_type": mime_type})
+        self.wait_for_files_active(file)
+        return file.uri
 
     def _build_request_contents(self, query: str, session_id: str):
         """
@@ -399,11 +442,18 @@ class GoogleGeminiBot(Bot):
         
         image_cache = memory.USER_IMAGE_CACHE.get(session_id)
         if image_cache:
-            first_data = image_cache['files'][0]
+            image_files = raw_media_items(image_cache['files'])
+            first_data = image_files[0]
             data_type = type(first_data).__name__
 
-            if data_type in ['JpegImageFile', 'PngImageFile', 'File']:
-                request_contents.extend(image_cache['files'])
+            if isinstance(first_data, MediaHandle):
+                # 直接发送原文件字节，不在本地解码图片
+                request_contents.extend(
+                    Part.from_bytes(data=handle.read_bytes(), mime_type=handle.mime_type)
+                    for handle in image_files
+                )
+            elif data_type in ['JpegImageFile', 'PngImageFile', 'File']:
+                request_contents.extend(image_files)
             elif data_type in ['FileData']:
                 request_contents.append({'fileData': first_data})
 
@@ -417,14 +467,14 @@ class GoogleGeminiBot(Bot):
                     continue
 
                 mime_type = cached_file.get("mime_type")
-                raw_data = cached_file.get("data", "")
                 file_path = cached_file.get("path", "")
 
                 if mime_type in ['application/docx', 'application/doc', 'application/plain']:
+                    raw_data = cached_file.get("data", "")
                     request_contents.insert(0, Part.from_text(text=raw_data))
                     logger.debug(f"[{self.Model_ID}] document text part added, mime_type={mime_type}")
                 elif mime_type == 'application/pdf':
-                    file_content = self._build_pdf_part(file_path, raw_data, request_warnings)
+                    file_content = self._build_pdf_part(file_path, cached_file, request_warnings)
                     if file_content is not None:
                         request_contents.insert(0, file_content)
                 else:
@@ -448,7 +498,7 @@ class GoogleGeminiBot(Bot):
         
         return request_contents, request_warnings
 
-    def _build_pdf_part(self, file_path: str, raw_data: str, request_warnings=None):
+    def _build_pdf_part(self, file_path: str, cached_file: dict, request_warnings=None):
         file_size = os.path.getsize(file_path) if file_path and os.path.exists(file_path) else 0
         if file_size > self._GEMINI_MAX_PDF_LIMIT_BYTES:
             warning = "Gemini 官方目前只支持 50MB 以内的 PDF，请压缩或拆分后再试。"
@@ -464,8 +514,12 @@ class GoogleGeminiBot(Bot):
             return self.upload_to_gemini(file_path, mime_type='application/pdf')
 
         logger.debug(f"[{self.Model_ID}] PDF document part added")
+        if isinstance(cached_file, LazyFileItem):
+            pdf_bytes = cached_file.read_bytes()
+        else:
+            pdf_bytes = base64.b64decode(cached_file.get("data", ""))
         return Part.from_bytes(
-            data=base64.b64decode(raw_data),
+            data=pdf_bytes,
             mime_type='application/pdf'
         )
 
@@ -681,6 +735,7 @@ class GoogleGeminiBot(Bot):
             os.remove(temp_path)
 
         self.wait_for_files_active(file)
+        register_upload(file.uri)
         print(f"Uploaded file '{file.display_name}' as: {file.uri}")
         return file
 
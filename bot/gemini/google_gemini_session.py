@@ -9,25 +9,24 @@ class GoogleGeminiSession(Session):
         self.last_total_tokens = None
         self.reset()
 
-    def calc_tokens(self):
+    def count_message_tokens(self, message):
         """
-        粗略估算当前 session 的 token 数。
+        粗略估算单条消息的 token 数。
         content 可能是字符串或多模态列表，统一提取文本部分计算。
         """
+        content = message.get("content", "")
+        if isinstance(content, str):
+            return len(content)
         total = 0
-        for msg in self.messages:
-            content = msg.get("content", "")
-            if isinstance(content, str):
-                total += len(content)
-            elif isinstance(content, list):
-                for block in content:
-                    block_type = block.get("type")
-                    if block_type == "text":
-                        total += len(block.get("text", ""))
-                    elif block_type == "image_url":
-                        total += 1500
-                    elif block_type == "video_url":
-                        total += 8000
+        if isinstance(content, list):
+            for block in content:
+                block_type = block.get("type")
+                if block_type == "text":
+                    total += len(block.get("text", ""))
+                elif block_type == "image_url":
+                    total += 1500
+                elif block_type == "video_url":
+                    total += 8000
         return total
 
     def discard_exceeding(self, max_tokens, cur_tokens=None):
@@ -41,48 +40,13 @@ class GoogleGeminiSession(Session):
             if self.last_total_tokens is not None
             else self.calc_tokens()
         )
-
-        while True:
-            if total <= max_tokens:
-                return total
-
-            first_non_system = next(
-                (i for i, msg in enumerate(self.messages) if msg.get("role") != "system"),
-                None
-            )
-            if first_non_system is None:
-                return total
-
-            remaining_non_system = [
-                msg for msg in self.messages if msg.get("role") != "system"
-            ]
-            if len(remaining_non_system) <= 1:
-                return total
-
-            self.messages.pop(first_non_system)
-            total = self.calc_tokens()
+        return self.trim_messages(max_tokens, total)
 
     def _calc_last_message_tokens(self):
         """估算最后一条消息即最新 query 消息的 token 数。"""
         if not self.messages:
             return 0
-
-        msg = self.messages[-1]
-        content = msg.get("content", "")
-        if isinstance(content, str):
-            return len(content)
-        if isinstance(content, list):
-            total = 0
-            for block in content:
-                block_type = block.get("type")
-                if block_type == "text":
-                    total += len(block.get("text", ""))
-                elif block_type == "image_url":
-                    total += 1500
-                elif block_type == "video_url":
-                    total += 8000
-            return total
-        return 0
+        return self.message_tokens(self.messages[-1])
 
 
 _gemini_sessions = SessionManager(GoogleGeminiSession, model=const.GEMINI_25_FLASH)
@@ -25,7 +25,7 @@ class GrokSession(Session):
     def add_query(self, query):
         local_content = self._normalize_local_content(query)
         user_item = {"role": "user", "content": local_content}
-        self.messages.append(user_item)
+        self.append_message(user_item)
 
         if isinstance(query, list):
             blocks = []
@@ -42,7 +42,7 @@ class GrokSession(Session):
 
     def add_reply(self, reply):
         assistant_item = {"role": "assistant", "content": reply}
-        self.messages.append(assistant_item)
+        self.append_message(assistant_item)
         self.sdk_messages.append(assistant(reply))
 
     def append_media_message(self, media_type, source_model):
@@ -96,41 +96,35 @@ class GrokSession(Session):
 
         return None
 
-    def calc_tokens(self):
+    def count_message_tokens(self, message):
         total = 0
-        for msg in self.messages:
-            content = msg.get("content", "")
-            if isinstance(content, str):
-                total += len(content) // 2
-            elif isinstance(content, list):
-                for block in content:
-                    if isinstance(block, str):
-                        total += len(block) // 2
-                    elif isinstance(block, dict):
-                        if block.get("type") == "text":
-                            total += len(block.get("text", "")) // 2
-                        elif block.get("type") in ("image_url", "image", "file"):
-                            total += 1500
-                    else:
-                        # xAI SDK block对象，按多模态块做粗估，避免session_manager计数时报错
+        content = message.get("content", "")
+        if isinstance(content, str):
+            total += len(content) // 2
+        elif isinstance(content, list):
+            for block in content:
+                if isinstance(block, str):
+                    total += len(block) // 2
+                elif isinstance(block, dict):
+                    if block.get("type") == "text":
+                        total += len(block.get("text", "")) // 2
+                    elif block.get("type") in ("image_url", "image", "file"):
                         total += 1500
+                else:
+                    # xAI SDK block对象，按多模态块做粗估，避免session_manager计数时报错
+                    total += 1500
         return total
 
+    def drop_messages(self, indexes):
+        # sdk_messages与messages一一对应，需要同步删除
+        for index in sorted(set(indexes), reverse=True):
+            if index < len(self.sdk_messages):
+                self.sdk_messages.pop(index)
+        return super().drop_messages(indexes)
+
     def discard_exceeding(self, max_tokens=None, cur_tokens=None):
         if max_tokens is None:
             return self.calc_tokens()
 
         total = cur_tokens if cur_tokens is not None else self.calc_tokens()
-        while total > max_tokens:
-            first_non_system = next((i for i, msg in enumerate(self.messages) if msg.get("role") != "system"), None)
-            if first_non_system is None:
-                return total
-
-            remaining_non_system = [msg for msg in self.messages if msg.get("role") != "system"]
-            if len(remaining_non_system) <= 1:
-                return total
-
-            self.messages.pop(first_non_system)
-            self.sdk_messages.pop(first_non_system)
-            total = self.calc_tokens()
-        return total
+        return self.trim_messages(max_tokens, total)
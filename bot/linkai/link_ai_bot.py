@@ -396,17 +396,18 @@ class LinkAISessionManager(SessionManager):
 
 
 class LinkAISession(ChatGPTSession):
-    def calc_tokens(self):
-        if not self.messages:
-            return 0
-        return len(str(self.messages))
+    def count_message_tokens(self, message):
+        # 与len(str(self.messages))一致：每条消息再加上列表中的分隔符
+        return len(str(message)) + 2
+
+    def count_base_tokens(self):
+        return 0
 
     def discard_exceeding(self, max_tokens, cur_tokens=None):
         cur_tokens = self.calc_tokens()
         if cur_tokens > max_tokens:
             for i in range(0, len(self.messages)):
                 if i > 0 and self.messages[i].get("role") == "assistant" and self.messages[i - 1].get("role") == "user":
-                    self.messages.pop(i)
-                    self.messages.pop(i - 1)
+                    self.drop_messages([i - 1, i])
                     return self.calc_tokens()
         return cur_tokens
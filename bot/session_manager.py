@@ -1,9 +1,16 @@
+from common.blob_store import blob_store, register_ref_source
 from common.expired_dict import ExpiredDict
 from common.log import logger
 from config import conf
 
 
 class Session(object):
+    """
+    会话消息及token计数。
+    子类实现count_message_tokens后，每条消息的token数在追加时计算一次并缓存，
+    同时维护累计值，截断历史时只需减去被丢弃消息的token数，不必重新计算整个会话。
+    """
+
     def __init__(self, session_id, system_prompt=None):
         self.session_id = session_id
         self.messages = []
@@ -11,11 +18,13 @@ class Session(object):
             self.system_prompt = conf().get("character_desc", "")
         else:
             self.system_prompt = system_prompt
+        self._clear_token_cache()
 
     # 重置会话
     def reset(self):
         system_item = {"role": "system", "content": self.system_prompt}
         self.messages = [system_item]
+        self._clear_token_cache()
 
     def set_system_prompt(self, system_prompt):
         self.system_prompt = system_prompt
@@ -23,18 +32,138 @@ class Session(object):
 
     def add_query(self, query):
         user_item = {"role": "user", "content": query}
-        self.messages.append(user_item)
+        self.append_message(user_item)
 
     def add_reply(self, reply):
         assistant_item = {"role": "assistant", "content": reply}
-        self.messages.append(assistant_item)
+        self.append_message(assistant_item)
+
+    def append_message(self, message):
+        """追加一条消息，累计值有效时顺带计入这条消息的token数"""
+        synced = self._token_synced()
+        self.messages.append(message)
+        if not synced:
+            return
+        try:
+            self._token_total += self.message_tokens(message)
+            self._token_snapshot = self._messages_snapshot()
+        except Exception as e:
+            logger.debug("Exception when counting message tokens: {}".format(e))
+            self._token_total = None
+
+    def pop_message(self, index=-1):
+        """删除并返回一条消息，同时从累计值中扣除它的token数"""
+        return self.drop_messages([index % len(self.messages)])[0]
+
+    def drop_messages(self, indexes):
+        """按下标删除多条消息，累计值只减去被删除消息的缓存token数"""
+        synced = self._token_synced()
+        dropped = []
+        for index in sorted(set(indexes), reverse=True):
+            message = self.messages.pop(index)
+            entry = self._token_cache.pop(id(message), None)
+            if synced:
+                if entry is not None and entry[0] is message:
+                    self._token_total -= entry[2]
+                else:
+                    synced = False
+            dropped.append(message)
+        dropped.reverse()
+        if synced:
+            self._token_snapshot = self._messages_snapshot()
+        else:
+            self._token_total = None
+        return dropped
 
     def discard_exceeding(self, max_tokens=None, cur_tokens=None):
         raise NotImplementedError
 
     def calc_tokens(self):
+        return self.token_total()
+
+    def count_message_tokens(self, message):
+        """计算单条消息的token数，由子类实现"""
         raise NotImplementedError
 
+    def count_base_tokens(self):
+        """与消息无关的固定token数，如回复的引导token"""
+        return 0
+
+    def message_tokens(self, message):
+        """单条消息的token数，content未被替换时直接使用缓存"""
+        content = message.get("content")
+        entry = self._token_cache.get(id(message))
+        if entry is not None and entry[0] is message and entry[1] is content:
+            return entry[2]
+        tokens = self.count_message_tokens(message)
+        self._token_cache[id(message)] = (message, content, tokens)
+        return tokens
+
+    def token_total(self):
+        """
+        当前会话的token总数。
+        消息都经由append_message/drop_messages修改时直接返回累计值；
+        若messages被外部直接修改过，则按缓存重新求和，只有新消息需要重新计算
+        """
+        if self._token_synced():
+            return self._token_total
+        old_cache = self._token_cache
+        self._token_cache = {}
+        total = self.count_base_tokens()
+        for message in self.messages:
+            entry = old_cache.get(id(message))
+            if entry is not None and entry[0] is message and entry[1] is message.get("content"):
+                self._token_cache[id(message)] = entry
+                total += entry[2]
+            else:
+                total += self.message_tokens(message)
+        self._token_total = total
+        self._token_snapshot = self._messages_snapshot()
+        return total
+
+    def trim_messages(self, max_tokens, total=None):
+        """
+        从最早的非system消息开始丢弃，直到token数不超过max_tokens，至少保留最后一条非system消息。
+        total为当前的token数(如接口返回的准确值)，为空时使用累计值；
+        丢弃时按缓存的单条token数递减，复杂度与丢弃的消息数成正比。
+        """
+        if total is None:
+            total = self.token_total()
+        if total <= max_tokens:
+            return total
+        last_non_system = next(
+            (i for i in range(len(self.messages) - 1, -1, -1) if self.messages[i].get("role") != "system"),
+            None
+        )
+        if last_non_system is None:
+            return total
+        indexes = []
+        for i in range(last_non_system):
+            if total <= max_tokens:
+                break
+            message = self.messages[i]
+            if message.get("role") == "system":
+                continue
+            total -= self.message_tokens(message)
+            indexes.append(i)
+        if indexes:
+            self.drop_messages(indexes)
+        return total
+
+    def _clear_token_cache(self):
+        self._token_cache = {}  # id(message) -> (message, content, tokens)
+        self._token_total = None
+        self._token_snapshot = None
+
+    def _messages_snapshot(self):
+        messages = self.messages
+        if not messages:
+            return id(messages), 0, None, None
+        return id(messages), len(messages), id(messages[0]), id(messages[-1])
+
+    def _token_synced(self):
+        return self._token_total is not None and self._token_snapshot == self._messages_snapshot()
+
 
 class SessionManager(object):
     def __init__(self, sessioncls, **session_args):
@@ -45,6 +174,17 @@ class SessionManager(object):
         self.sessions = sessions
         self.sessioncls = sessioncls
         self.session_args = session_args
+        register_ref_source(self.live_messages)
+
+    def live_messages(self):
+        """未过期会话的消息，blob_store清理时跳过其中引用的媒体"""
+        while True:
+            try:
+                sessions = list(self.sessions.values())
+                break
+            except RuntimeError:  # 普通dict在遍历时被其他线程修改，重试
+                continue
+        return [list(session.messages) for session in sessions]
 
     def build_session(self, session_id, system_prompt=None):
         """
@@ -91,21 +231,27 @@ class SessionManager(object):
 
         :param session_id:   目标会话 ID
         :param media_type:   'image' | 'video'
-        :param data:         base64 编码字符串，或视频链接 URL
+        :param data:         base64 编码字符串或二进制内容
         :param source_model: 生成来源，如 const.KLING_V3_OMNI
         :param mime_type:    如 'image/jpeg' 'video/mp4'，None 时自动推断
         :param fps:          视频抽帧频率，取值范围 [0.2, 5]，仅 video 时生效，默认 1
+
+        媒体内容存入 blob_store，session 中只保存 blob:// 引用，发请求时再还原成 data URL
         """
         session = self.build_session(session_id)
 
         if mime_type is None:
             mime_type = 'video/mp4' if media_type == 'video' else 'image/jpeg'
+        if isinstance(data, (bytes, bytearray)):
+            media_ref = blob_store.put(bytes(data), mime_type)
+        else:
+            media_ref = blob_store.put_base64(data, mime_type)
 
         if media_type == 'video':
             media_content = {
                 "type": "video_url",
                 "video_url": {
-                    "url": f"data:{mime_type};base64,{data}",
+                    "url": media_ref,
                     "fps": fps
                 }
             }
@@ -115,7 +261,7 @@ class SessionManager(object):
             media_content = {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:{mime_type};base64,{data}"
+                    "url": media_ref
                 }
             }
 
@@ -130,7 +276,7 @@ class SessionManager(object):
             ]
         }
 
-        session.messages.append(media_block)
+        session.append_message(media_block)
         if hasattr(session, "append_media_message"):
             session.append_media_message(media_type, source_model)
         elif hasattr(session, "mark_remote_history_outdated"):
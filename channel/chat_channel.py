@@ -1,18 +1,23 @@
 import os
-import re
-import base64
+import asyncio
+import inspect
 import threading
 import time
-import docx
+from functools import partial
 from PIL import Image
 from asyncio import CancelledError
 from concurrent.futures import Future, ThreadPoolExecutor
 
+from bridge.bridge import Bridge
 from bridge.context import *
 from bridge.reply import *
 from channel.channel import Channel
-from common.dequeue import Dequeue
+from channel.trigger_index import remove_mention, trigger_index
 from common import memory, const
+from common.handler_lane import HandlerLane
+from common.media_cache import LazyFileItem, MediaHandle, image_cache_entry
+from common.media_prefetch import resolve_media
+from common.session_scheduler import SessionScheduler
 from common.tmp_dir import create_user_dir
 from common.tool_button import tool_state
 from common.model_status import model_state
@@ -22,6 +27,7 @@ from config import conf
 
 try:
     from voice.audio_convert import any_to_wav
+    from voice.chunked_asr import ChunkedTranscription
 except Exception as e:
     pass
 
@@ -31,12 +37,17 @@ class ChatChannel(Channel):
     name = None  # 登录的用户名
     user_id = None  # 登录的用户id
     futures = {}  # 记录每个session_id提交到线程池的future对象, 用于重置会话时把没执行的future取消掉，正在执行的不会被取消
-    sessions = {}  # 用于控制并发，每个session_id同时只能有一个context在处理
-    lock = threading.Lock()  # 用于控制对sessions的访问
-    handler_pool = ThreadPoolExecutor(max_workers=16)  # 处理消息的线程池
+    scheduler = SessionScheduler()  # 用于控制并发，每个session_id同时最多有concurrency_in_session个context在处理
+    lock = threading.Lock()  # 用于控制对futures的访问
+    lanes = {}  # 处理消息的通道，按消息类型分为chat/image/video/voice，各自有独立的线程池和排队上限
     cache_locks = {}  # 为每个session添加缓存锁
     _consumer_thread = None
     _consumer_pid = None
+    _lanes_pid = None
+    _async_loop = None  # asyncio模式下处理消息的事件循环
+    _async_loop_pid = None
+    _async_executors = {}  # asyncio模式下每类请求执行同步步骤的线程池，互不占用
+    _async_budgets = {}  # asyncio模式下每类请求的并发信号量
 
     def __init__(self):
         self.ensure_consumer_thread()
@@ -45,12 +56,43 @@ class ChatChannel(Channel):
         current_pid = os.getpid()
         thread = self.__class__._consumer_thread
         if self.__class__._consumer_pid != current_pid or thread is None or not thread.is_alive():
+            self.ensure_lanes()
             thread = threading.Thread(target=self.consume, name=f"{self.__class__.__name__}-consumer", daemon=True)
             thread.start()
             self.__class__._consumer_thread = thread
             self.__class__._consumer_pid = current_pid
             logger.info("%s consumer thread started in pid=%s", self._get_channel(), current_pid)
 
+    def ensure_lanes(self):
+        current_pid = os.getpid()
+        if self.__class__._lanes_pid != current_pid or not self.__class__.lanes:
+            lanes_conf = conf().get("handler_lanes") or {}
+            lanes = {}
+            for name, default in DEFAULT_HANDLER_LANES.items():
+                options = {**default, **(lanes_conf.get(name) or {})}
+                lanes[name] = HandlerLane(name, options.get("workers"), options.get("max_queue"))
+            self.__class__.lanes = lanes
+            self.__class__._lanes_pid = current_pid
+        return self.__class__.lanes
+
+    def get_lane_stats(self):
+        """各通道的排队数、处理中数量和排队等待时间(秒)"""
+        return {name: lane.stats() for name, lane in self.ensure_lanes().items()}
+
+    def ensure_async_loop(self):
+        current_pid = os.getpid()
+        loop = self.__class__._async_loop
+        if self.__class__._async_loop_pid != current_pid or loop is None or loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name=f"{self.__class__.__name__}-asyncio", daemon=True)
+            thread.start()
+            self.__class__._async_loop = loop
+            self.__class__._async_executors = {}
+            self.__class__._async_budgets = {}
+            self.__class__._async_loop_pid = current_pid
+            logger.info("%s asyncio handler loop started in pid=%s", self._get_channel(), current_pid)
+        return loop
+
     # 根据消息构造context，消息内容相关的触发项写在这里
     def _compose_context(self, ctype: ContextType, content, **kwargs):
         context = Context(ctype, content)
@@ -65,31 +107,18 @@ class ChatChannel(Channel):
         # 群名匹配过程，设置session_id和receiver
         if first_in:  # context首次传入时，receiver是None，根据类型设置receiver
             config = conf()
+            triggers = trigger_index()
             cmsg = context["msg"]
-            user_data = conf().get_user_data(cmsg.from_user_id)
+            user_data = config.get_user_data(cmsg.from_user_id)
             context["openai_api_key"] = user_data.get("openai_api_key")
             context["gpt_model"] = user_data.get("gpt_model")
             if context.get("isgroup", False):
                 group_name = cmsg.other_user_nickname
                 group_id = cmsg.other_user_id
 
-                group_name_white_list = config.get("group_name_white_list", [])
-                group_name_keyword_white_list = config.get("group_name_keyword_white_list", [])
-                if any(
-                    [
-                        group_name in group_name_white_list,
-                        "ALL_GROUP" in group_name_white_list,
-                        check_contain(group_name, group_name_keyword_white_list),
-                    ]
-                ):
-                    group_chat_in_one_session = conf().get("group_chat_in_one_session", [])
+                if triggers.group_allowed(group_name):
                     session_id = cmsg.actual_user_id
-                    if any(
-                        [
-                            group_name in group_chat_in_one_session,
-                            "ALL_GROUP" in group_chat_in_one_session,
-                        ]
-                    ):
+                    if triggers.group_in_one_session(group_name):
                         session_id = group_id
                 else:
                     return None
@@ -113,20 +142,19 @@ class ChatChannel(Channel):
                 logger.debug("%s reference query skipped", self._get_channel(context))
                 return None
 
-            nick_name_black_list = conf().get("nick_name_black_list", [])
+            triggers = trigger_index()
             if context.get("isgroup", False):  # 群聊
                 # 校验关键字
-                match_prefix = check_prefix(content, conf().get("group_chat_prefix"))
-                match_contain = check_contain(content, conf().get("group_chat_keyword"))
                 flag = False
                 if context["msg"].to_user_id != context["msg"].actual_user_id:
-                    if match_prefix is not None or match_contain is not None:
+                    matched, match_prefix = triggers.match_group_trigger(content)
+                    if matched:
                         flag = True
                         if match_prefix:
                             content = content.replace(match_prefix, "", 1).strip()
                     if context["msg"].is_at:
                         nick_name = context["msg"].actual_user_nickname
-                        if nick_name and nick_name in nick_name_black_list:
+                        if triggers.nick_name_blocked(nick_name):
                             # 黑名单过滤
                             logger.warning("%s Nickname %s in In BlackList, ignore", self._get_channel(context), nick_name)
                             return None
@@ -134,16 +162,13 @@ class ChatChannel(Channel):
                         logger.info("%s receive group at", self._get_channel(context))
                         if not conf().get("group_at_off", False):
                             flag = True
-                        pattern = f"@{re.escape(self.name)}(\u2005|\u0020)"
-                        subtract_res = re.sub(pattern, r"", content)
+                        subtract_res = remove_mention(self.name, content)
                         if isinstance(context["msg"].at_list, list):
                             for at in context["msg"].at_list:
-                                pattern = f"@{re.escape(at)}(\u2005|\u0020)"
-                                subtract_res = re.sub(pattern, r"", subtract_res)
+                                subtract_res = remove_mention(at, subtract_res)
                         if subtract_res == content and context["msg"].self_display_name:
                             # 前缀移除后没有变化，使用群昵称再次移除
-                            pattern = f"@{re.escape(context['msg'].self_display_name)}(\u2005|\u0020)"
-                            subtract_res = re.sub(pattern, r"", content)
+                            subtract_res = remove_mention(context["msg"].self_display_name, content)
                         content = subtract_res
                 if not flag:
                     if context["origin_ctype"] == ContextType.VOICE:
@@ -151,12 +176,12 @@ class ChatChannel(Channel):
                     return None
             else:  # 单聊
                 nick_name = context["msg"].from_user_nickname
-                if nick_name and nick_name in nick_name_black_list:
+                if triggers.nick_name_blocked(nick_name):
                     # 黑名单过滤
                     logger.warning("%s Nickname '%s' in In BlackList, ignore", self._get_channel(context), nick_name)
                     return None
 
-                match_prefix = check_prefix(content, conf().get("single_chat_prefix", [""]))
+                match_prefix = triggers.match_single_prefix(content)
                 if match_prefix is not None:  # 判断如果匹配到自定义前缀，则返回过滤掉前缀+空格后的内容
                     content = content.replace(match_prefix, "", 1).strip()
                 elif context["origin_ctype"] == ContextType.VOICE:  # 如果源消息是私聊的语音消息，允许不匹配前缀，放宽条件
@@ -164,8 +189,7 @@ class ChatChannel(Channel):
                 else:
                     return None
             content = content.strip()
-            video_match_prefix = check_prefix(content, conf().get("video_create_prefix", ["//"])) 
-            img_match_prefix = check_prefix(content, conf().get("image_create_prefix"))
+            video_match_prefix, img_match_prefix = triggers.match_create_prefix(content)
             if video_match_prefix:
                 content = content.replace(video_match_prefix, "", 1)
                 context.type = ContextType.VIDEO_CREATE
@@ -197,32 +221,121 @@ class ChatChannel(Channel):
         # reply的发送步骤
         self._send_reply(context, reply)
 
+    def send_async_reply(self, context: Context, reply: Reply):
+        """后台任务(如job_poller轮询的视频生成)完成后回复，与_handle中的包装、发送步骤一致"""
+        reply = self._decorate_reply(context, reply)
+        self._send_reply(context, reply)
+
+    async def _handle_async(self, context: Context, ticket=None):
+        if context is None or not context.content:
+            return
+        async with self._get_async_budget(self._get_lane(context)):
+            if ticket:
+                ticket.start()
+            try:
+                logger.debug("%s ready to handle context in asyncio mode: %s", self._get_channel(context), context)
+                lane_name = self._get_lane(context)
+                reply = await self._generate_reply_async(lane_name, context)
+                reply = await self._run_in_async_executor(lane_name, self._decorate_reply, context, reply)
+                await self._run_in_async_executor(lane_name, self._send_reply, context, reply)
+            finally:
+                if ticket:
+                    ticket.finish()
+
+    async def _generate_reply_async(self, lane_name, context: Context) -> Reply:
+        bot = await self._run_in_async_executor(lane_name, self._get_async_bot, context)
+        if bot is None:  # 同步bot，整个生成步骤在线程池中执行
+            return await self._run_in_async_executor(lane_name, self._generate_reply, context, Reply())
+        e_context = await self._run_in_async_executor(lane_name, self._prepare_async_reply, context)
+        if e_context.is_pass():
+            return e_context["reply"]
+        # 等待模型返回期间只占用协程，不占用线程
+        return await bot.async_reply(context.content, context)
+
+    def _get_async_bot(self, context: Context):
+        """返回可以用async_reply协程处理该消息的bot，没有则返回None；目前只有文字消息走协程"""
+        if context.type != ContextType.TEXT:
+            return None
+        try:
+            bot = Bridge(context["session_id"]).get_bot("chat")
+        except Exception as e:
+            logger.warning("%s get bot for asyncio mode failed: %s", self._get_channel(context), e)
+            return None
+        if inspect.iscoroutinefunction(getattr(bot, "async_reply", None)) and bot.supports_async_reply(context):
+            return bot
+        return None
+
+    def _prepare_async_reply(self, context: Context) -> EventContext:
+        """调用异步bot前的插件和引用媒体缓存，与_generate_reply中文字消息的分支一致"""
+        e_context = self._emit_handle_context(context, Reply())
+        if not e_context.is_pass():
+            with self._get_cache_lock(context["session_id"]):  # 等待图片缓存完成后再处理文本
+                self._cache_quoted_image(context)
+                self._cache_quoted_file(context)
+                context["channel"] = e_context["channel"]
+        return e_context
+
+    def _get_lane(self, context: Context):
+        if context.type == ContextType.VOICE:
+            return "voice"
+        if context.type == ContextType.IMAGE_CREATE:
+            return "image"
+        if context.type == ContextType.VIDEO_CREATE:
+            return "video"
+        return "chat"
+
+    def _get_async_budget(self, lane_name):
+        # 只在事件循环线程中调用，无需加锁
+        budget = self._async_budgets.get(lane_name)
+        if budget is None:
+            budget = asyncio.Semaphore(self._get_async_limit(lane_name))
+            self._async_budgets[lane_name] = budget
+        return budget
+
+    def _get_async_limit(self, lane_name):
+        limits = conf().get("async_concurrency") or {}
+        return max(int(limits.get(lane_name, ASYNC_DEFAULT_CONCURRENCY[lane_name])), 1)
+
+    def _get_async_executor(self, lane_name):
+        # 每类请求使用各自的线程池，图片、视频任务排满时不会占用文字消息的线程；
+        # 线程数等于该类请求的并发上限，文字消息另受async_executor_workers限制。
+        # 异步bot的文字消息只在线程池中执行插件、缓存、发送等短步骤，同时处理的数量可以超过线程数
+        executor = self._async_executors.get(lane_name)
+        if executor is None:
+            workers = self._get_async_limit(lane_name)
+            if lane_name == "chat":
+                workers = min(workers, max(int(conf().get("async_executor_workers", 64)), 1))
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{self.__class__.__name__}-async-{lane_name}")
+            self._async_executors[lane_name] = executor
+        return executor
+
+    def _run_in_async_executor(self, lane_name, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._get_async_executor(lane_name), partial(func, *args))
+
     def _get_channel(self, context: Context = None):
         channel = context.get("channel") if context else None
         channel_type = getattr(channel, "channel_type", None) or getattr(self, "channel_type", None) or conf().get("channel_type", "wx")
         return f"[{str(channel_type).upper()}]"
 
     def _cache_quoted_image(self, context: Context):
-        quoted_image_path = context.get("quoted_image_path")
+        quoted_image_path = resolve_media(context, "quoted_image_path")
         session_id = context.get("session_id")
         if not quoted_image_path or not session_id:
             return
         channel = self._get_channel(context)
         try:
-            img = Image.open(quoted_image_path)
-            memory.USER_QUOTED_IMAGE_CACHE[session_id] = {
-                "path": [quoted_image_path],
-                "files": [img]
-            }
+            # 只缓存路径，构建请求时才解码图片
+            memory.USER_QUOTED_IMAGE_CACHE[session_id] = image_cache_entry([quoted_image_path], cache_type="quoted_image")
+            file_size = os.path.getsize(quoted_image_path) if os.path.exists(quoted_image_path) else 0
             logger.info(
                 f"{channel} quoted image cached, session_id={session_id}, "
-                f"path={quoted_image_path}, size={getattr(img, 'size', None)}, mode={getattr(img, 'mode', None)}"
+                f"path={quoted_image_path}, file_size={file_size}"
             )
         except Exception as e:
             logger.warning(f"{channel} failed to cache quoted image: {e}")
 
     def _cache_quoted_video(self, context: Context):
-        quoted_video_path = context.get("quoted_video_path")
+        quoted_video_path = resolve_media(context, "quoted_video_path")
         session_id = context.get("session_id")
         if not quoted_video_path or not session_id:
             return
@@ -230,7 +343,7 @@ class ChatChannel(Channel):
         try:
             video_cache_item = {
                 "path": quoted_video_path,
-                "public_url": context.get("quoted_video_public_url"),
+                "public_url": resolve_media(context, "quoted_video_public_url"),
                 "mime_type": f"video/{os.path.splitext(quoted_video_path)[1].lstrip('.').lower() or 'mp4'}",
             }
             memory.USER_QUOTED_VIDEO_CACHE[session_id] = {"files": [video_cache_item]}
@@ -239,7 +352,7 @@ class ChatChannel(Channel):
             logger.warning(f"{channel} failed to cache quoted video: {e}")
 
     def _cache_quoted_file(self, context: Context):
-        quoted_file_path = context.get("quoted_file_path")
+        quoted_file_path = resolve_media(context, "quoted_file_path")
         session_id = context.get("session_id")
         if not quoted_file_path or not session_id:
             return
@@ -251,57 +364,53 @@ class ChatChannel(Channel):
                 logger.warning(f"{channel} unsupported quoted file type: {suffix}")
                 return
 
-            if normalized_suffix == "pdf":
-                with open(quoted_file_path, 'rb') as file:
-                    encoded_data = base64.b64encode(file.read()).decode('utf-8')
-            elif normalized_suffix == "docx":
-                doc = docx.Document(quoted_file_path)
-                encoded_data = '\n'.join(paragraph.text for paragraph in doc.paragraphs)
-            else:
-                with open(quoted_file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                    encoded_data = file.read()
-
+            # data字段在构建请求时才读取
             memory.USER_QUOTED_FILE_CACHE[session_id] = {
                 "path": quoted_file_path,
                 "msg": context.get("msg"),
-                "files": [{
-                    "path": quoted_file_path,
-                    "msg": context.get("msg"),
-                    "mime_type": f"application/{normalized_suffix}",
-                    "data": encoded_data,
-                }],
+                "files": [LazyFileItem(
+                    quoted_file_path,
+                    f"application/{normalized_suffix}",
+                    cache_type="quoted_file",
+                    msg=context.get("msg"),
+                )],
             }
             file_size = os.path.getsize(quoted_file_path) if os.path.exists(quoted_file_path) else 0
             logger.info(
                 f"{channel} quoted file cached, session_id={session_id}, "
                 f"path={quoted_file_path}, mime_type=application/{normalized_suffix}, "
-                f"size={file_size}, content_length={len(encoded_data)}"
+                f"size={file_size}"
             )
         except Exception as e:
             logger.warning(f"{channel} failed to cache quoted file: {e}")
 
-    def _generate_reply(self, context: Context, reply: Reply = Reply()) -> Reply:
-        session_id = context["session_id"]
-                
+    def _get_cache_lock(self, session_id):
         # 确保session有对应的锁
         if session_id not in self.cache_locks:
             self.cache_locks[session_id] = threading.Lock()
-            
-        # 获取该session的缓存锁
-        cache_lock = self.cache_locks[session_id]
+        return self.cache_locks[session_id]
 
-        e_context = PluginManager().emit_event(
+    def _emit_handle_context(self, context: Context, reply: Reply) -> EventContext:
+        return PluginManager().emit_event(
             EventContext(
                 Event.ON_HANDLE_CONTEXT,
                 {"channel": self, "context": context, "reply": reply},
             )
         )
+
+    def _generate_reply(self, context: Context, reply: Reply = Reply()) -> Reply:
+        session_id = context["session_id"]
+        # 获取该session的缓存锁
+        cache_lock = self._get_cache_lock(session_id)
+
+        e_context = self._emit_handle_context(context, reply)
         reply = e_context["reply"]
         model = model_state.get_basic_state(session_id)
         if not e_context.is_pass():
             logger.debug("%s ready to handle context: type=%s, content=%s", self._get_channel(context), context.type, context.content)
             if context.type in (ContextType.IMAGE_CREATE, ContextType.VIDEO_CREATE):
                 self._cache_quoted_image(context)
+                context["channel"] = e_context["channel"]  # 生成任务提交后由job_poller通过通道回复
             if context.type == ContextType.VIDEO_CREATE:
                 self._cache_quoted_video(context)
             if context.type == ContextType.VOICE:  # 语音消息
@@ -314,8 +423,8 @@ class ChatChannel(Channel):
                 except Exception as e:  # 转换失败，直接使用mp3，对于某些api，mp3也可以识别
                     logger.warning("%s any to wav error, use raw path. %s", self._get_channel(context), e)
                     wav_path = file_path
-                # 语音识别
-                reply = super().build_voice_to_text(wav_path)
+                # 语音识别，长语音分段并行识别
+                reply = self._voice_to_text(context, wav_path)
                 # 删除临时文件
                 try:
                     os.remove(file_path)
@@ -360,18 +469,17 @@ class ChatChannel(Channel):
                 if mime_type in const.IMAGE or channel_type == 'feishu':
                     with cache_lock: # 使用锁确保缓存完成
                         context['msg'].prepare()
-                        img = Image.open(image_path)
-                        image_file = img
-                        # check if the image has an alpha channel
-                        if img.mode in ('RGBA','LA') or (img.mode == 'P' and 'transparency' in img.info):
-                            # Convert the image to RGB mode,whick removes the alpha channel
-                            img = img.convert('RGB')
-                            # Save the converted image
-                            img_path_no_alpha = image_path + '.jpg' if channel_type == 'feishu' else image_path[:len(image_path)-3] + 'jpg'
-                            img.save(img_path_no_alpha)
-                            # Update img_path with the path to the converted image
-                            image_path = img_path_no_alpha
-                        cache_media(image_path, image_file, context)
+                        with Image.open(image_path) as img:
+                            # check if the image has an alpha channel
+                            if img.mode in ('RGBA','LA') or (img.mode == 'P' and 'transparency' in img.info):
+                                # Convert the image to RGB mode,whick removes the alpha channel
+                                # Save the converted image
+                                img_path_no_alpha = image_path + '.jpg' if channel_type == 'feishu' else image_path[:len(image_path)-3] + 'jpg'
+                                img.convert('RGB').save(img_path_no_alpha)
+                                # Update img_path with the path to the converted image
+                                image_path = img_path_no_alpha
+                        # 缓存中只保存路径，构建请求时才解码
+                        cache_media(image_path, MediaHandle(image_path), context)
                 else:
                     logger.warning(f'[{model.upper()}] query with unsupported image type:{mime_type}') 
             elif context.type == ContextType.SHARING and model in const.GEMINI_GENAI_SDK:  
@@ -392,7 +500,7 @@ class ChatChannel(Channel):
                         context["msg"].prepare()
                         video_cache_item = {
                             "path": file_path,
-                            "public_url": context.get("video_public_url"),
+                            "public_url": resolve_media(context, "video_public_url"),
                             "mime_type": f"video/{mime_type}",
                         }
                         existing_cache = memory.USER_VIDEO_CACHE.get(session_id)
@@ -404,25 +512,8 @@ class ChatChannel(Channel):
                 elif mime_type in const.DOCUMENT:
                     with cache_lock:
                         context["msg"].prepare()
-                        if mime_type == 'pdf':
-                            with open(file_path, 'rb') as file:
-                                file_data = file.read()
-                                encoded_data = base64.b64encode(file_data).decode('utf-8')
-                        elif mime_type == 'docx':
-                            doc = docx.Document(file_path)
-                            full_text = []
-                            for paragraph in doc.paragraphs:
-                                full_text.append(paragraph.text)
-                            encoded_data = '\n'.join(full_text)
-                        else:
-                            with open(file_path, 'r', encoding='utf-8', errors='ignore') as file:
-                                encoded_data = file.read()
-                        file_cache_item = {
-                            "path": file_path,
-                            "msg": context.get("msg"),
-                            "mime_type": f'{type_id}/{mime_type}',
-                            "data": encoded_data,
-                        }
+                        # pdf的base64、docx的文本在构建请求时才生成
+                        file_cache_item = LazyFileItem(file_path, f'{type_id}/{mime_type}', msg=context.get("msg"))
                         existing_cache = memory.USER_FILE_CACHE.get(session_id)
                         if existing_cache and isinstance(existing_cache.get("files"), list):
                             existing_cache["files"].append(file_cache_item)
@@ -453,7 +544,7 @@ class ChatChannel(Channel):
                     context["msg"].prepare()
                     video_cache_item = {
                         "path": file_path,
-                        "public_url": context.get("video_public_url"),
+                        "public_url": resolve_media(context, "video_public_url"),
                         "mime_type": "video/mp4",
                     }
                     existing_cache = memory.USER_VIDEO_CACHE.get(session_id)
@@ -519,6 +610,13 @@ class ChatChannel(Channel):
                 )
             return reply
 
+    def _voice_to_text(self, context: Context, wav_path) -> Reply:
+        transcription = ChunkedTranscription(wav_path, super().build_voice_to_text)
+        if transcription.chunked and conf().get("stream") and conf().get("voice_asr_partial_reply", True):
+            # 各段按顺序识别完成就先流式发给用户，全部完成后再用完整文本继续对话
+            self._send_reply(context, Reply(ReplyType.STREAM, transcription.iter_text(prefix=VOICE_TRANSCRIPT_PREFIX)))
+        return transcription.result()
+
     def _send_reply(self, context: Context, reply: Reply):
         if reply and reply.type:
             e_context = PluginManager().emit_event(
@@ -563,71 +661,92 @@ class ChatChannel(Channel):
             except Exception as e:
                 logger.exception("Worker raise exception: {}".format(e))
             with self.lock:
-                self.sessions[session_id][1].release()
+                session_futures = self.futures.get(session_id)
+                if session_futures and worker in session_futures:
+                    session_futures.remove(worker)
+                if not session_futures:
+                    self.futures.pop(session_id, None)
+            self.scheduler.task_done(session_id)  # 释放并发名额，唤醒消费者
 
         return func
 
     def produce(self, context: Context):
         self.ensure_consumer_thread()
         session_id = context["session_id"]
-        with self.lock:
-            if session_id not in self.sessions:
-                self.sessions[session_id] = [
-                    Dequeue(),
-                    threading.BoundedSemaphore(conf().get("concurrency_in_session", 4)),
-                ]
-            if context.type == ContextType.TEXT and context.content.startswith("#"):
-                self.sessions[session_id][0].putleft(context)  # 优先处理管理命令
-            else:
-                self.sessions[session_id][0].put(context)
+        self.scheduler.put(
+            session_id,
+            context,
+            left=context.type == ContextType.TEXT and context.content.startswith("#"),  # 优先处理管理命令
+            limit=conf().get("concurrency_in_session", 4),
+        )
 
-    # 消费者函数，单独线程，用于从消息队列中取出消息并处理
+    # 消费者函数，单独线程，阻塞等待有消息的session，取出消息提交到线程池处理
     def consume(self):
         while True:
+            session_id, context = self.scheduler.get()
+            ticket = None
             try:
+                logger.debug("%s consume context: %s", self._get_channel(context), context)
+                lanes = self.ensure_lanes()
+                lane_name = self._get_lane(context)
+                ticket = lanes[lane_name].enter()
+                if ticket is None:  # 该通道排队已满，直接回复繁忙，不占用处理线程
+                    logger.warning("%s %s lane is full, stats=%s", self._get_channel(context), lane_name, lanes[lane_name].stats())
+                    future: Future = lanes["chat"].pool.submit(self._reject_context, context, lane_name)
+                elif conf().get("handler_mode", "thread") == "asyncio":
+                    future: Future = asyncio.run_coroutine_threadsafe(self._handle_async(context, ticket), self.ensure_async_loop())
+                    future.add_done_callback(lambda f, t=ticket: t.cancel())
+                else:
+                    future: Future = lanes[lane_name].submit(ticket, self._handle, context)
                 with self.lock:
-                    session_ids = list(self.sessions.keys())
-                    for session_id in session_ids:
-                        context_queue, semaphore = self.sessions[session_id]
-                        if semaphore.acquire(blocking=False):  # 等线程处理完毕才能删除
-                            if not context_queue.empty():
-                                context = context_queue.get()
-                                logger.debug("%s consume context: %s", self._get_channel(context), context)
-                                future: Future = self.handler_pool.submit(self._handle, context)
-                                future.add_done_callback(self._thread_pool_callback(session_id, context=context))
-                                self.futures.setdefault(session_id, []).append(future)
-                            elif semaphore._initial_value == semaphore._value + 1:  # 除了当前，没有任务再申请到信号量，说明所有任务都处理完毕
-                                session_futures = [t for t in self.futures.get(session_id, []) if not t.done()]
-                                self.futures[session_id] = session_futures
-                                assert len(session_futures) == 0, "thread pool error"
-                                del self.sessions[session_id]
-                                self.futures.pop(session_id, None)
-                            else:
-                                semaphore.release()
+                    self.futures.setdefault(session_id, []).append(future)
+                future.add_done_callback(self._thread_pool_callback(session_id, context=context))
             except Exception as e:
                 logger.exception("%s consume loop error: %s", self._get_channel(), e)
-            time.sleep(0.1)
+                if ticket:
+                    ticket.cancel()
+                self.scheduler.task_done(session_id)
+
+    def _reject_context(self, context: Context, lane_name):
+        reply = Reply(ReplyType.ERROR, LANE_BUSY_TIPS.get(lane_name, LANE_BUSY_TIPS["chat"]))
+        self._send_reply(context, self._decorate_reply(context, reply))
 
     # 取消session_id对应的所有任务，只能取消排队的消息和已提交线程池但未执行的任务
     def cancel_session(self, session_id):
         with self.lock:
-            if session_id in self.sessions:
-                for future in self.futures[session_id]:
-                    future.cancel()
-                cnt = self.sessions[session_id][0].qsize()
-                if cnt > 0:
-                    logger.info("Cancel {} messages in session {}".format(cnt, session_id))
-                self.sessions[session_id][0] = Dequeue()
+            session_futures = list(self.futures.get(session_id, []))
+        for future in session_futures:  # 取消时会同步触发回调，回调中需要获取self.lock，所以不能持锁取消
+            future.cancel()
+        cnt = self.scheduler.cancel(session_id)
+        if cnt > 0:
+            logger.info("Cancel {} messages in session {}".format(cnt, session_id))
 
     def cancel_all_session(self):
         with self.lock:
-            for session_id in self.sessions:
-                for future in self.futures[session_id]:
-                    future.cancel()
-                cnt = self.sessions[session_id][0].qsize()
-                if cnt > 0:
-                    logger.info("Cancel {} messages in session {}".format(cnt, session_id))
-                self.sessions[session_id][0] = Dequeue()
+            all_futures = [future for session_futures in self.futures.values() for future in session_futures]
+        for future in all_futures:
+            future.cancel()
+        for session_id, cnt in self.scheduler.cancel_all().items():
+            if cnt > 0:
+                logger.info("Cancel {} messages in session {}".format(cnt, session_id))
+
+
+ASYNC_DEFAULT_CONCURRENCY = {"chat": 256, "image": 16, "video": 64, "voice": 16}
+# 处理通道默认配置，max_queue为0表示不限制排队数量
+DEFAULT_HANDLER_LANES = {
+    "chat": {"workers": 16, "max_queue": 0},
+    "image": {"workers": 8, "max_queue": 32},
+    "video": {"workers": 8, "max_queue": 32},
+    "voice": {"workers": 4, "max_queue": 16},
+}
+LANE_BUSY_TIPS = {
+    "chat": "当前消息较多，请稍后再试",
+    "image": "当前图片生成任务排队较多，请稍后再试",
+    "video": "当前视频生成任务排队较多，请稍后再试",
+    "voice": "当前语音消息排队较多，请稍后再试",
+}
+# 长语音分段识别时先发给用户的识别文字的开头
+VOICE_TRANSCRIPT_PREFIX = "[语音识别]\n"
 
 
 def check_prefix(content, prefix_list):
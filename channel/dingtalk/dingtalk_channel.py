@@ -8,7 +8,6 @@
 # -*- coding=utf-8 -*-
 import uuid
 
-import requests
 import web
 from channel.dingtalk.dingtalk_message import DingTalkMessage
 from bridge.context import Context
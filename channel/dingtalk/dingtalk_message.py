@@ -1,7 +1,6 @@
 from bridge.context import ContextType
 from channel.chat_message import ChatMessage
 import json
-import requests
 from common.log import logger
 from common.tmp_dir import TmpDir
 from common import utils
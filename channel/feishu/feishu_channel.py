@@ -7,7 +7,8 @@
 
 # -*- coding=utf-8 -*-
 import cv2
-import io, json, os, uuid, requests, threading, re, time
+import io, json, os, uuid, threading, re, time
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from flask import Flask, send_file, abort
 from urllib.parse import urlparse, quote
@@ -16,10 +17,13 @@ from channel.feishu.feishu_message import FeishuMessage
 from bridge.context import Context
 from bridge.reply import Reply, ReplyType
 from common.log import logger
+from common.media_prefetch import media_prefetcher
 from common.media_store import build_public_media_url
 from common.singleton import singleton
+from common.stream_renderer import StreamRenderer
 from common import const
-from common.expired_dict import ExpiredDict
+from common.shared_state import shared_state
+from common.worker_affinity import WorkerAffinity
 from common.tool_button import tool_state
 from common.model_status import model_state
 from common.tmp_dir import TmpDir
@@ -31,6 +35,9 @@ import lark_oapi as lark
 from lark_oapi.api.im.v1 import *
 from lark_oapi.adapter.flask import *
 from common.tmp_dir import TmpDir, create_user_dir
+from common.http_client import http_client
+
+FEISHU_CARD_MAX_CHARS = 8000  # 单张卡片的最大字数，超出后另起一张卡片
 
 
 @singleton
@@ -72,8 +79,20 @@ class FeiShuChanel(ChatChannel):
         )
         # Feishu can retry webhook events after a long-running image/video request.
         # Keep message ids long enough to cover delayed retries from async generation.
-        self._recent_message_events = ExpiredDict(conf().get("feishu_event_dedupe_seconds", 60 * 60 * 24))
-        self._recent_message_events_lock = threading.Lock()
+        # 去重键保存在共享状态中，多worker部署时重投到其他worker的事件同样会被忽略
+        self._event_dedupe_seconds = conf().get("feishu_event_dedupe_seconds", 60 * 60 * 24)
+        # 单线程接收队列：事件回调只做去重和入队，保证同一会话的消息顺序
+        self._ingest_executor = (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="lark-ingest")
+            if conf().get("feishu_async_ingest", True) else None
+        )
+        # 会话→worker亲和：同一会话的消息转发给固定的worker，媒体缓存、对话上下文留在该worker内存中
+        self._affinity = None
+        if not self.websocket and conf().get("feishu_worker_affinity"):
+            if shared_state().local:
+                logger.warning("[Lark] feishu_worker_affinity requires shared_state_backend sqlite or redis, ignored")
+            else:
+                self._affinity = WorkerAffinity("lark", self._ingest_forwarded).start()
 
     def _get_current_image_model_id(self, user_id):
         return model_state.get_image_model(user_id).upper()
@@ -116,22 +135,21 @@ class FeiShuChanel(ChatChannel):
                 )
         dedupe_key = event_id or getattr(message, "message_id", None)
         if dedupe_key:
-            with self._recent_message_events_lock:
-                if dedupe_key in self._recent_message_events:
-                    logger.warning(
-                        "[Lark-event] duplicate event ignored, event_id=%s, message_id=%s, create_time=%s, open_id=%s",
-                        event_id,
-                        message.message_id,
-                        message.create_time,
-                        toUserName,
-                    )
-                    return
-                self._recent_message_events[dedupe_key] = {
-                    "event_id": event_id,
-                    "message_id": message.message_id,
-                    "create_time": message.create_time,
-                    "open_id": toUserName,
-                }
+            dedupe_value = json.dumps({
+                "event_id": event_id,
+                "message_id": message.message_id,
+                "create_time": message.create_time,
+                "open_id": toUserName,
+            })
+            if not shared_state().set_if_absent(f"lark-event:{dedupe_key}", dedupe_value, self._event_dedupe_seconds):
+                logger.warning(
+                    "[Lark-event] duplicate event ignored, event_id=%s, message_id=%s, create_time=%s, open_id=%s",
+                    event_id,
+                    message.message_id,
+                    message.create_time,
+                    toUserName,
+                )
+                return
         logger.info(
             "[Lark-event] event_id=%s, message_id=%s, parent_id=%s, create_time=%s, chat_type=%s, chat_id=%s, open_id=%s, message_type=%s",
             event_id,
@@ -152,11 +170,13 @@ class FeiShuChanel(ChatChannel):
             [Lark-breakdown] is {tool_state.get_breakdown_state(toUserName)},\
             requester={toUserName}'
         )
-        if data.event.message.chat_type == "p2p":
-            self.handler_single_msg(data.event)
-
-        elif data.event.message.chat_type == "group":
-            self.handler_group_msg(data.event)
+        if self._affinity is not None and not self._affinity.route(message.chat_id, lark.JSON.marshal(data)):
+            return
+        if self._ingest_executor is not None:
+            # 立即返回确认事件，避免飞书因超时重投；解析消息、组装context在接收线程中按到达顺序进行
+            self._ingest_executor.submit(self._ingest_message, data.event)
+        else:
+            self._ingest_message(data.event)
             """request: ReplyMessageRequest = (
                 ReplyMessageRequest.builder()
                 .message_id(data.event.message.message_id)
@@ -175,6 +195,25 @@ class FeiShuChanel(ChatChannel):
                 raise Exception(
                     f"client.im.v1.message.reply failed, code: {response.code}, msg: {response.msg}, log_id: {response.get_log_id()}"
                 )"""
+    def _ingest_forwarded(self, payload):
+        """处理其他worker按会话亲和转发来的事件，去重已在接收的worker完成"""
+        data = lark.JSON.unmarshal(payload, P2ImMessageReceiveV1)
+        if self._ingest_executor is not None:
+            self._ingest_executor.submit(self._ingest_message, data.event)
+        else:
+            self._ingest_message(data.event)
+
+    def _ingest_message(self, event):
+        try:
+            if event.message.chat_type == "p2p":
+                self.handler_single_msg(event)
+            elif event.message.chat_type == "group":
+                self.handler_group_msg(event)
+        except Exception:
+            if self._ingest_executor is None:
+                raise
+            logger.exception("[Lark-event] ingest failed, message_id=%s", event.message.message_id)
+
     # Register event handler to handle bot menu.
     # https://open.feishu.cn/document/client-docs/bot-v3/events/menu
     def do_p2_application_bot_menu_v6(self, data: lark.application.v6.P2ApplicationBotMenuV6) -> None:
@@ -400,31 +439,8 @@ class FeiShuChanel(ChatChannel):
                 getattr(cmsg, "from_user_id", None),
             )
             raise
-        if context and cmsg.ctype == ContextType.VIDEO:
-            public_url = self.build_public_media_url(cmsg.content)
-            if public_url:
-                context["video_public_url"] = public_url
-        if context and hasattr(cmsg, "get_quoted_image_path"):
-            quoted_image_path = cmsg.get_quoted_image_path()
-            if quoted_image_path:
-                context["quoted_image_path"] = quoted_image_path
-        if context and hasattr(cmsg, "get_quoted_video_path"):
-            quoted_video_path = cmsg.get_quoted_video_path()
-            if quoted_video_path:
-                context["quoted_video_path"] = quoted_video_path
-                quoted_video_public_url = self.build_public_media_url(quoted_video_path)
-                if quoted_video_public_url:
-                    context["quoted_video_public_url"] = quoted_video_public_url
-        if context and hasattr(cmsg, "get_quoted_file_path"):
-            quoted_file_path = cmsg.get_quoted_file_path()
-            if quoted_file_path:
-                context["quoted_file_path"] = quoted_file_path
-        if context and cmsg.ctype == ContextType.FILE:
-            suffix = os.path.splitext(cmsg.content)[1].lstrip(".").lower()
-            if suffix in const.VIDEO:
-                public_url = self.build_public_media_url(cmsg.content)
-                if public_url:
-                    context["video_public_url"] = public_url
+        if context:
+            self._prefetch_media(context, cmsg)
         if context:
             try:
                 self.produce(context)
@@ -455,34 +471,34 @@ class FeiShuChanel(ChatChannel):
         else:
             logger.debug("[Lark]receive group msg: {}".format(cmsg.content))
         context = self._compose_context(cmsg.ctype, cmsg.content, isgroup=True, msg=cmsg)
-        if context and cmsg.ctype == ContextType.VIDEO:
-            public_url = self.build_public_media_url(cmsg.content)
-            if public_url:
-                context["video_public_url"] = public_url
-        if context and hasattr(cmsg, "get_quoted_image_path"):
-            quoted_image_path = cmsg.get_quoted_image_path()
-            if quoted_image_path:
-                context["quoted_image_path"] = quoted_image_path
-        if context and hasattr(cmsg, "get_quoted_video_path"):
-            quoted_video_path = cmsg.get_quoted_video_path()
-            if quoted_video_path:
-                context["quoted_video_path"] = quoted_video_path
-                quoted_video_public_url = self.build_public_media_url(quoted_video_path)
-                if quoted_video_public_url:
-                    context["quoted_video_public_url"] = quoted_video_public_url
-        if context and hasattr(cmsg, "get_quoted_file_path"):
-            quoted_file_path = cmsg.get_quoted_file_path()
-            if quoted_file_path:
-                context["quoted_file_path"] = quoted_file_path
-        if context and cmsg.ctype == ContextType.FILE:
-            suffix = os.path.splitext(cmsg.content)[1].lstrip(".").lower()
-            if suffix in const.VIDEO:
-                public_url = self.build_public_media_url(cmsg.content)
-                if public_url:
-                    context["video_public_url"] = public_url
+        if context:
+            self._prefetch_media(context, cmsg)
         if context:
             self.produce(context)
 
+    def _prefetch_media(self, context: Context, cmsg: ChatMessage):
+        """消息本身和引用的图片/视频/文件交给I/O线程池并行下载，视频下载完成后再生成公网地址(可能上传TOS)；
+        context中先保存Future，_generate_reply真正用到时才等待"""
+        prefetcher = media_prefetcher()
+        cmsg.prefetch(prefetcher)
+        is_video = cmsg.ctype == ContextType.VIDEO or (
+            cmsg.ctype == ContextType.FILE and os.path.splitext(cmsg.content)[1].lstrip(".").lower() in const.VIDEO
+        )
+        if is_video:
+            def video_public_url():
+                cmsg.prepare()  # 等待下载完成，TOS需要上传完整文件
+                return self.build_public_media_url(cmsg.content)
+            context["video_public_url"] = prefetcher.submit(video_public_url)
+        if not cmsg.parent_id:
+            return
+        context["quoted_image_path"] = prefetcher.submit(cmsg.get_quoted_image_path)
+        quoted_video = prefetcher.submit(cmsg.get_quoted_video_path)
+        context["quoted_video_path"] = quoted_video
+        context["quoted_video_public_url"] = prefetcher.then(
+            quoted_video, lambda path: self.build_public_media_url(path) if path else None
+        )
+        context["quoted_file_path"] = prefetcher.submit(cmsg.get_quoted_file_path)
+
     # 统一的发送函数，每个Channel自行实现，根据reply的type字段发送不同类型的消息
     def send(self, reply: Reply, context: Context):
         receiver = context["receiver"]
@@ -549,7 +565,7 @@ class FeiShuChanel(ChatChannel):
                 # 下载图片
                 file_name = self.extract_image_filename(response)
                 logger.debug(f"[Lark] start download image, img_url={response}")
-                pic_res = requests.get(response, stream=True)
+                pic_res = http_client("media").get(response, stream=True)
                 image_storage = io.BytesIO()
                 size = 0
                 for block in pic_res.iter_content(1024):
@@ -643,7 +659,7 @@ class FeiShuChanel(ChatChannel):
             video_url = reply.content[1]
             file_name = self.extract_image_filename(video_url)
             logger.debug(f"[Lark_{video_model_id}] start download video, video_url={video_url}")
-            video_res = requests.get(video_url, stream=True)
+            video_res = http_client("media").get(video_url, stream=True)
             video_storage = io.BytesIO()
             size = 0
             for block in video_res.iter_content(1024):
@@ -654,6 +670,118 @@ class FeiShuChanel(ChatChannel):
             video_path = self.save_media_file(receiver, video_storage, file_name)
             self.send_video(video_duration, video_path, receiver)
             logger.info("[Lark_{}] sendVideo url={}, receiver={}".format(video_model_id, video_path, receiver))
+        elif reply.type == ReplyType.STREAM:
+            try:
+                full_text = self.send_stream(reply.content, receiver)
+                logger.info("[Lark_STREAM] stream 发送完成, sendMsg={}, receiver={}".format(full_text, receiver))
+            except Exception as e:
+                logger.error("[Lark_STREAM] sendMsg error, receiver={}, error={}".format(receiver, e))
+                self.send_text(error_response, toUserName=receiver)
+
+    def send_stream(self, generator, receiver):
+        """
+        流式回复：先发一张可更新的消息卡片，随后按节流频率更新卡片内容。
+        卡片写满后另起一张；创建或更新卡片失败时不再增量更新，结束后把剩余内容一次性发出。
+        """
+        renderer = StreamRenderer(receiver, max_chars=FEISHU_CARD_MAX_CHARS)
+        message_id = None  # 当前正在更新的卡片
+        streaming = True
+        full_text = ""
+
+        def finalize(text):
+            nonlocal message_id, streaming
+            if message_id and streaming:
+                try:
+                    self.patch_card(message_id, text)
+                    message_id = None
+                    return
+                except Exception as e:
+                    logger.warning(f"[Lark_STREAM] patch card failed, fallback to send text: {e}")
+                    streaming = False
+            message_id = None
+            self.send_text(text, toUserName=receiver)
+
+        for chunk in generator:
+            text = self._get_stream_chunk_text(chunk)
+            full_text += text
+            renderer.feed(text)
+            for segment in renderer.take_segments():
+                finalize(segment)
+            if streaming and renderer.should_flush():
+                try:
+                    if message_id is None:
+                        message_id = self.send_card(renderer.pending_text() + " ▍", receiver)
+                    else:
+                        self.patch_card(message_id, renderer.pending_text() + " ▍")
+                except Exception as e:
+                    logger.warning(f"[Lark_STREAM] stream card update failed, fallback to final send: {e}")
+                    streaming = False
+                renderer.mark_flushed()
+
+        for segment in renderer.finish():
+            finalize(segment)
+        renderer.log_stats("[Lark_STREAM]")
+        return full_text
+
+    def _get_stream_chunk_text(self, chunk):
+        if isinstance(chunk, str):
+            return chunk
+        # 判断是 Gemini response 还是 Claude final_message
+        if hasattr(chunk, "candidates"):
+            grounding_metadata = getattr(chunk.candidates[0], "grounding_metadata", None) if chunk.candidates else None
+            inline_url = self.get_search_sources(grounding_metadata) if grounding_metadata and grounding_metadata.grounding_chunks else None
+        else:
+            inline_url = self._get_claude_search_sources(chunk)
+        return f"\n\n{inline_url}" if inline_url else ""
+
+    def _build_markdown_card(self, text):
+        return json.dumps(
+            {
+                "config": {"wide_screen_mode": True, "update_multi": True},
+                "elements": [{"tag": "markdown", "content": text}],
+            },
+            ensure_ascii=False,
+        )
+
+    def send_card(self, text, toUserName):
+        """发送一张markdown消息卡片，返回message_id用于后续更新"""
+        request = (
+            CreateMessageRequest.builder()
+            .receive_id_type("open_id")
+            .request_body(
+                CreateMessageRequestBody.builder()
+                .receive_id(toUserName)
+                .msg_type("interactive")
+                .content(self._build_markdown_card(text))
+                .build()
+            )
+            .build()
+        )
+        response = self.client.im.v1.message.create(request)
+        if not response.success():
+            raise Exception(
+                f"client.im.v1.message.create failed, code: {response.code}, msg: {response.msg}, log_id: {response.get_log_id()}"
+            )
+        return response.data.message_id
+
+    def patch_card(self, message_id, text):
+        """更新已发送的消息卡片内容"""
+        # https://open.feishu.cn/document/server-docs/im-v1/message-card/patch
+        request = (
+            PatchMessageRequest.builder()
+            .message_id(message_id)
+            .request_body(
+                PatchMessageRequestBody.builder()
+                .content(self._build_markdown_card(text))
+                .build()
+            )
+            .build()
+        )
+        response = self.client.im.v1.message.patch(request)
+        if not response.success():
+            raise Exception(
+                f"client.im.v1.message.patch failed, code: {response.code}, msg: {response.msg}, log_id: {response.get_log_id()}"
+            )
     
     def save_media_file(self, receiver, media_storage, file_name):
         """将网页链接中的图片或视频文件存储到本地硬盘"""
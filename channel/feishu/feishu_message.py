@@ -222,7 +222,19 @@ class FeishuMessage(ChatMessage):
                         self._prepare_fn = lambda: get_message_resource(message_id=self.msg_id, file_key=image_key, type='image', file_path=self.content)
         else:
             raise NotImplementedError("Unsupported message type: Type:{} MsgType:{}".format(event.message["Type"], event.message["MsgType"]))
-
+        self._prepare_future = None
+
+    def prefetch(self, prefetcher):
+        """在I/O线程池中提前下载消息本身的媒体，之后prepare()只等待下载完成"""
+        if self._prepare_fn and self._prepare_future is None:
+            self._prepare_future = prefetcher.submit(super().prepare)
+        return self._prepare_future
+
+    def prepare(self):
+        if self._prepare_future is not None:
+            self._prepare_future.result()
+            return
+        super().prepare()
 
     def get_quoted_image_path(self):
         if not self.parent_id:
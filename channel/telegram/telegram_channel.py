@@ -1,5 +1,4 @@
 import io
-import requests
 import logging
 import asyncio
 import html
@@ -18,6 +17,8 @@ from common.model_status import model_state
 from common.tool_button import tool_state
 from common.log import logger
 from common.singleton import singleton
+from common.stream_renderer import StreamRenderer
+from common.http_client import http_client
 from config import conf
 from channel.telegram.telegram_text_util import escape
 
@@ -26,6 +27,8 @@ from telegram.error import BadRequest
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackContext, CallbackQueryHandler
 from telegram.request import HTTPXRequest
 
+TELEGRAM_MAX_MESSAGE_CHARS = 4096
+
 @singleton
 class TelegramChannel(ChatChannel):
     _MEDIA_MODEL_DICT = {
@@ -792,7 +795,7 @@ class TelegramChannel(ChatChannel):
                 if isinstance(response, list):
                     for img_url in response:
                         logger.debug(f"[TELEGRAMBOT] start download image, img_url={img_url}")
-                        pic_res = requests.get(img_url, stream=True)
+                        pic_res = http_client("media").get(img_url, stream=True)
                         image_storage = io.BytesIO()
                         size = 0
                         for block in pic_res.iter_content(1024):
@@ -829,7 +832,7 @@ class TelegramChannel(ChatChannel):
                 elif isinstance(response, str):
                     img_url = response
                     logger.debug(f"[TELEGRAMBOT] start download image, img_url={img_url}")
-                    pic_res = requests.get(img_url, stream=True)
+                    pic_res = http_client("media").get(img_url, stream=True)
                     image_storage = io.BytesIO()
                     size = 0
                     for block in pic_res.iter_content(1024):
@@ -938,6 +941,8 @@ class TelegramChannel(ChatChannel):
             elif reply.type == ReplyType.STREAM:
                 generator = reply.content
                 draft_id = abs(hash(str(receiver))) % (10**9) + 1
+                # 按时间窗口和增量合并更新，超过 4096 字自动拆成续写消息
+                renderer = StreamRenderer(receiver, max_chars=TELEGRAM_MAX_MESSAGE_CHARS - 2)
                 full_text = ""
                 for chunk in generator:
                     if not isinstance(chunk, str):
@@ -947,37 +952,48 @@ class TelegramChannel(ChatChannel):
                             grounding_metadata = getattr(
                                 chunk.candidates[0], "grounding_metadata", None
                             ) if chunk.candidates else None
+                            inline_url = None
                             if grounding_metadata and grounding_metadata.grounding_chunks:
                                 inline_url = self.get_search_sources(grounding_metadata)
-                                if inline_url:
-                                    full_text += f"\n\n{inline_url}"
                         else:
                             # Claude final_message citations
                             inline_url = self._get_claude_search_sources(chunk)
-                            if inline_url:
-                                full_text += f"\n\n{inline_url}"
+                        text = f"\n\n{inline_url}" if inline_url else ""
                     else:
-                        full_text += chunk
+                        text = chunk
+                    full_text += text
+                    renderer.feed(text)
 
-                    try:
-                        await self.application.bot.send_message_draft(
+                    for segment in renderer.take_segments():
+                        await self.application.bot.send_message(
                             chat_id=receiver,
-                            draft_id=draft_id,
-                            text=full_text + " ▍",
-                            parse_mode='HTML'
+                            text=segment,
+                            parse_mode='HTML',
+                            disable_web_page_preview=True,
+                            **_reply_kwargs(),
                         )
-
-                    except Exception as draft_err:
-                        logger.warning(f"[TELEGRAMBOT_STREAM] send_message_draft 失败（忽略）: {draft_err}")
+                    if renderer.should_flush():
+                        try:
+                            await self.application.bot.send_message_draft(
+                                chat_id=receiver,
+                                draft_id=draft_id,
+                                text=renderer.pending_text() + " ▍",
+                                parse_mode='HTML'
+                            )
+                        except Exception as draft_err:
+                            logger.warning(f"[TELEGRAMBOT_STREAM] send_message_draft 失败（忽略）: {draft_err}")
+                        renderer.mark_flushed()
 
                 # 流结束，finalize：发最终完整消息，draft 自动消失
-                await self.application.bot.send_message(
-                    chat_id=receiver,
-                    text=full_text,
-                    parse_mode='HTML',
-                    disable_web_page_preview=True,
-                    **_reply_kwargs(),
-                )
+                for segment in renderer.finish():
+                    await self.application.bot.send_message(
+                        chat_id=receiver,
+                        text=segment,
+                        parse_mode='HTML',
+                        disable_web_page_preview=True,
+                        **_reply_kwargs(),
+                    )
+                renderer.log_stats("[TELEGRAMBOT_STREAM]")
                 logger.info(f"[TELEGRAMBOT_STREAM] stream 发送完成, sendMsg={full_text}, receiver={receiver}")
         except Exception as e:
             logger.error("[TELEGRAMBOT] sendMsg error, reply={}, receiver={}, error={}".format(reply, receiver, e))
@@ -5,6 +5,7 @@ from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel, check_prefix
 from channel.chat_message import ChatMessage
 from common.log import logger
+from common.http_client import http_client
 from config import conf
 
 
@@ -42,12 +43,11 @@ class TerminalChannel(ChatChannel):
         elif reply.type == ReplyType.IMAGE_URL:  # 从网络下载图片
             import io
 
-            import requests
             from PIL import Image
 
             image_urls = reply.content if isinstance(reply.content, list) else [reply.content]
             for img_url in image_urls:
-                pic_res = requests.get(img_url, stream=True)
+                pic_res = http_client("media").get(img_url, stream=True)
                 image_storage = io.BytesIO()
                 for block in pic_res.iter_content(1024):
                     image_storage.write(block)
@@ -0,0 +1,213 @@
+"""
+_compose_context 使用的触发项索引：把群名白名单、昵称黑名单、群聊/私聊前缀、关键词、画图/视频前缀
+预先编译成集合和正则，每条消息只做集合查询和一次正则匹配，不再逐项遍历配置列表。
+索引按配置对象和Config.version缓存，load_config重新加载或修改配置项后自动重建。
+"""
+
+import re
+import threading
+from functools import lru_cache
+
+from config import conf
+
+ALL_GROUP = "ALL_GROUP"
+
+
+def _alternation(items):
+    """按配置中的顺序组成正则分支；re依次尝试各分支，结果与逐个startswith/find的顺序一致"""
+    return "|".join(re.escape(item) for item in items)
+
+
+def _compile_prefix(prefix_list):
+    if not prefix_list:
+        return None
+    return re.compile(_alternation(prefix_list))
+
+
+class TriggerIndex:
+    def __init__(self, config):
+        group_name_white_list = config.get("group_name_white_list", []) or []
+        self.group_names = frozenset(group_name_white_list)
+        self.all_group = ALL_GROUP in self.group_names
+        group_name_keywords = config.get("group_name_keyword_white_list", []) or []
+        self.group_name_keyword = re.compile(_alternation(group_name_keywords)) if group_name_keywords else None
+        self.one_session_groups = frozenset(config.get("group_chat_in_one_session", []) or [])
+        self.all_group_one_session = ALL_GROUP in self.one_session_groups
+        self.nick_name_black_list = frozenset(config.get("nick_name_black_list", []) or [])
+
+        # 群聊前缀和关键词合并为一个正则：开头先尝试前缀分支(分组1)，不匹配时再在全文中查找关键词
+        group_prefixes = config.get("group_chat_prefix") or []
+        group_keywords = config.get("group_chat_keyword") or []
+        branches = []
+        if group_prefixes:
+            branches.append(f"^({_alternation(group_prefixes)})")
+        if group_keywords:
+            branches.append(_alternation(group_keywords))
+        self.group_trigger = re.compile("|".join(branches)) if branches else None
+
+        self.single_prefix = _compile_prefix(config.get("single_chat_prefix", [""]))
+
+        # 视频前缀优先于画图前缀，空前缀匹配结果为空串、不会触发，直接去掉
+        video_prefixes = [p for p in config.get("video_create_prefix", ["//"]) or [] if p]
+        image_prefixes = [p for p in config.get("image_create_prefix") or [] if p]
+        branches = [f"({_alternation(prefixes)})" if prefixes else "(?!)" for prefixes in (video_prefixes, image_prefixes)]
+        self.create_prefix = re.compile("|".join(branches)) if video_prefixes or image_prefixes else None
+
+    def group_allowed(self, group_name):
+        if self.all_group or group_name in self.group_names:
+            return True
+        return bool(self.group_name_keyword and group_name and self.group_name_keyword.search(group_name))
+
+    def group_in_one_session(self, group_name):
+        return self.all_group_one_session or group_name in self.one_session_groups
+
+    def nick_name_blocked(self, nick_name):
+        return bool(nick_name) and nick_name in self.nick_name_black_list
+
+    def match_group_trigger(self, content):
+        """返回(是否触发, 匹配到的前缀)"""
+        if self.group_trigger is None:
+            return False, None
+        match = self.group_trigger.search(content)
+        if match is None:
+            return False, None
+        return True, match.group(1) if self.group_trigger.groups else None
+
+    def match_single_prefix(self, content):
+        if self.single_prefix is None:
+            return None
+        match = self.single_prefix.match(content)
+        return match.group(0) if match else None
+
+    def match_create_prefix(self, content):
+        """返回(视频前缀, 画图前缀)，最多只有一个不为None"""
+        if self.create_prefix is None:
+            return None, None
+        match = self.create_prefix.match(content)
+        if match is None:
+            return None, None
+        return match.group(1), match.group(2)
+
+
+_cache = (None, None, None)
+_cache_lock = threading.Lock()
+
+
+def trigger_index():
+    """当前配置对应的触发项索引"""
+    global _cache
+    config = conf()
+    cached_config, cached_version, index = _cache
+    version = getattr(config, "version", 0)
+    if cached_config is config and cached_version == version:
+        return index
+    with _cache_lock:
+        index = TriggerIndex(config)
+        _cache = (config, version, index)
+    return index
+
+
+@lru_cache(maxsize=1024)
+def mention_pattern(name):
+    """@昵称 后跟空格的正则，按昵称缓存"""
+    return re.compile(f"@{re.escape(name)}(\u2005|\u0020)")
+
+
+def remove_mention(name, content):
+    return mention_pattern(name).sub("", content)
+
+
+if __name__ == "__main__":
+    # 微基准(python -m channel.trigger_index)：按_compose_context中的触发判断流程，比较逐项遍历配置列表与预编译索引每秒处理的消息数
+    import random
+    import time
+
+    import config as config_module
+    from config import Config
+
+    random.seed(0)
+    words = ["".join(random.choices("abcdefghijklmnopqrstuvwxyz甲乙丙丁戊己庚辛", k=random.randint(2, 6))) for _ in range(400)]
+    config = Config({
+        "group_name_white_list": [f"group-{i}" for i in range(200)],
+        "group_name_keyword_white_list": words[:50],
+        "group_chat_in_one_session": [f"group-{i}" for i in range(0, 200, 2)],
+        "nick_name_black_list": [f"spam-{i}" for i in range(500)],
+        "group_chat_prefix": ["@bot", "bot", "机器人"] + words[50:80],
+        "group_chat_keyword": words[80:200],
+        "single_chat_prefix": ["bot", "@bot"],
+        "image_create_prefix": ["画", "看", "找"],
+        "video_create_prefix": ["//", "视频"],
+    })
+    messages = []
+    for i in range(2000):
+        text = " ".join(random.choices(words + ["hello", "今天天气怎么样", "帮我写一段代码"] * 50, k=random.randint(3, 30)))
+        if i % 5 == 0:
+            text = random.choice(["bot ", "机器人", "@bot "]) + random.choice(["", "画", "视频"]) + text
+        messages.append((f"group-{random.randint(0, 400)}", f"user-{random.randint(0, 1000)}", text, ["bot"] + [f"u{j}" for j in range(random.randint(0, 3))]))
+
+    def check_prefix(content, prefix_list):
+        if not prefix_list:
+            return None
+        for prefix in prefix_list:
+            if content.startswith(prefix):
+                return prefix
+        return None
+
+    def check_contain(content, keyword_list):
+        if not keyword_list:
+            return None
+        for ky in keyword_list:
+            if content.find(ky) != -1:
+                return True
+        return None
+
+    def legacy(group_name, nick_name, content, at_list):
+        if not any([group_name in config.get("group_name_white_list", []), "ALL_GROUP" in config.get("group_name_white_list", []),
+                    check_contain(group_name, config.get("group_name_keyword_white_list", []))]):
+            return None
+        session = any([group_name in config.get("group_chat_in_one_session", []), "ALL_GROUP" in config.get("group_chat_in_one_session", [])])
+        match_prefix = check_prefix(content, config.get("group_chat_prefix"))
+        match_contain = check_contain(content, config.get("group_chat_keyword"))
+        if match_prefix is None and match_contain is None:
+            return None
+        if match_prefix:
+            content = content.replace(match_prefix, "", 1).strip()
+        if nick_name in config.get("nick_name_black_list", []):
+            return None
+        for at in at_list:
+            content = re.sub(f"@{re.escape(at)}(\u2005|\u0020)", r"", content)
+        content = content.strip()
+        video = check_prefix(content, config.get("video_create_prefix", ["//"]))
+        image = check_prefix(content, config.get("image_create_prefix"))
+        return session, video or None, (image or None) if not video else None, content
+
+    def indexed(group_name, nick_name, content, at_list):
+        triggers = trigger_index()
+        if not triggers.group_allowed(group_name):
+            return None
+        session = triggers.group_in_one_session(group_name)
+        matched, match_prefix = triggers.match_group_trigger(content)
+        if not matched:
+            return None
+        if match_prefix:
+            content = content.replace(match_prefix, "", 1).strip()
+        if triggers.nick_name_blocked(nick_name):
+            return None
+        for at in at_list:
+            content = remove_mention(at, content)
+        content = content.strip()
+        video, image = triggers.match_create_prefix(content)
+        return session, video, image, content
+
+    config_module.config = config
+    for message in messages:
+        assert legacy(*message) == indexed(*message), message
+    for name, func in (("list scan", legacy), ("trigger index", indexed)):
+        start = time.perf_counter()
+        rounds = 0
+        while time.perf_counter() - start < 2:
+            for message in messages:
+                func(*message)
+            rounds += 1
+        elapsed = time.perf_counter() - start
+        print(f"{name:<14} {rounds * len(messages) / elapsed:>10.0f} msg/s")
@@ -0,0 +1,168 @@
+"""
+Web通道的SSE消息分发：每个用户一个阻塞队列，SSE连接阻塞等待新消息，
+有消息时立即推送，并把队列里已积压的消息合并成一次写出；只在空闲超时时发送心跳。
+长时间没有连接、也没有新消息的队列按TTL清理。
+"""
+
+import json
+import threading
+import time
+from queue import Empty, Queue
+
+from common.log import logger
+from config import conf
+
+DEFAULT_HEARTBEAT_INTERVAL = 15  # 空闲多少秒发送一次心跳
+DEFAULT_QUEUE_TTL = 600  # 没有SSE连接的队列闲置多少秒后清理
+MAX_BATCH_MESSAGES = 32  # 一次写出合并的最大消息数
+PRUNE_INTERVAL = 60  # 两次清理之间至少间隔的秒数
+
+
+class UserQueue:
+    __slots__ = ("queue", "last_active", "connections")
+
+    def __init__(self):
+        self.queue = Queue()
+        self.last_active = time.monotonic()
+        self.connections = 0
+
+
+class SSEHub:
+    def __init__(self, heartbeat_interval=None, queue_ttl=None):
+        self.heartbeat_interval = heartbeat_interval or conf().get("web_sse_heartbeat", DEFAULT_HEARTBEAT_INTERVAL)
+        self.queue_ttl = queue_ttl or conf().get("web_queue_ttl", DEFAULT_QUEUE_TTL)
+        self.lock = threading.Lock()
+        self.queues = {}  # user_id -> UserQueue
+        self.last_prune = time.monotonic()
+        self.writes = 0
+        self.messages = 0
+        self.heartbeats = 0
+        self.pruned = 0
+
+    def publish(self, user_id, message):
+        """把消息放入用户的队列，正在等待的SSE连接会立即被唤醒"""
+        user_queue = self._get_queue(user_id)
+        user_queue.queue.put(message)
+        self._maybe_prune()
+
+    def stream(self, user_id):
+        """SSE响应体，每次产出一段要写给浏览器的文本"""
+        user_queue = self._get_queue(user_id, connect=True)
+        try:
+            yield ": connected\n\n"  # 先写出一次，让浏览器尽快建立连接
+            while True:
+                try:
+                    message = user_queue.queue.get(timeout=self.heartbeat_interval)
+                except Empty:
+                    self.heartbeats += 1
+                    yield ": heartbeat\n\n"
+                    continue
+                batch = [message]
+                while len(batch) < MAX_BATCH_MESSAGES:
+                    try:
+                        batch.append(user_queue.queue.get_nowait())
+                    except Empty:
+                        break
+                user_queue.last_active = time.monotonic()
+                self.writes += 1
+                self.messages += len(batch)
+                yield "".join(f"data: {json.dumps(item)}\n\n" for item in batch)
+        finally:
+            with self.lock:
+                user_queue.connections -= 1
+                user_queue.last_active = time.monotonic()
+
+    def prune(self, now=None):
+        """清理没有连接且闲置超过TTL的队列，返回清理的数量"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            expired = [
+                user_id for user_id, user_queue in self.queues.items()
+                if user_queue.connections <= 0 and now - user_queue.last_active >= self.queue_ttl
+            ]
+            for user_id in expired:
+                dropped = self.queues.pop(user_id).queue.qsize()
+                if dropped:
+                    logger.info(f"[WEB] drop {dropped} undelivered messages of idle user {user_id}")
+            self.pruned += len(expired)
+            self.last_prune = now
+        return len(expired)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queues": len(self.queues),
+                "connections": sum(q.connections for q in self.queues.values()),
+                "queued": sum(q.queue.qsize() for q in self.queues.values()),
+                "writes": self.writes,
+                "messages": self.messages,
+                "heartbeats": self.heartbeats,
+                "pruned": self.pruned,
+            }
+
+    def _get_queue(self, user_id, connect=False):
+        with self.lock:
+            user_queue = self.queues.get(user_id)
+            if user_queue is None:
+                user_queue = self.queues[user_id] = UserQueue()
+            user_queue.last_active = time.monotonic()
+            if connect:
+                user_queue.connections += 1
+            return user_queue
+
+    def _maybe_prune(self):
+        if time.monotonic() - self.last_prune >= PRUNE_INTERVAL:
+            self.prune()
+
+
+if __name__ == "__main__":
+    # 负载测试：N个模拟浏览器各自保持一个SSE连接，统计消息从发布到写出的延迟
+    import statistics
+    import sys
+
+    browsers = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    messages_per_browser = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    hub = SSEHub(heartbeat_interval=1, queue_ttl=5)
+    latencies = []
+    latency_lock = threading.Lock()
+    done = threading.Barrier(browsers + 1)
+
+    def browser(user_id):
+        received = 0
+        stream = hub.stream(user_id)
+        for chunk in stream:
+            now = time.monotonic()
+            for line in chunk.split("\n\n"):
+                if line.startswith("data: "):
+                    sent_at = json.loads(line[len("data: "):])["sent_at"]
+                    with latency_lock:
+                        latencies.append(now - sent_at)
+                    received += 1
+            if received >= messages_per_browser:
+                break
+        stream.close()
+        done.wait()
+
+    threads = [threading.Thread(target=browser, args=(f"user-{i}",), daemon=True) for i in range(browsers)]
+    for thread in threads:
+        thread.start()
+    start = time.monotonic()
+    for n in range(messages_per_browser):
+        for i in range(browsers):
+            hub.publish(f"user-{i}", {"type": "TEXT", "content": f"message {n}", "sent_at": time.monotonic()})
+        time.sleep(0.005)
+    done.wait()
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    stats = hub.stats()
+    print(f"browsers={browsers}, messages={len(latencies)}, elapsed={elapsed:.2f}s")
+    print(
+        "latency p50={:.1f}ms p95={:.1f}ms p99={:.1f}ms max={:.1f}ms".format(
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+            latencies[-1] * 1000,
+        )
+    )
+    print(f"writes={stats['writes']} (messages per write {stats['messages'] / max(stats['writes'], 1):.2f}), heartbeats={stats['heartbeats']}")
+    print(f"queues before prune={stats['queues']}, pruned after ttl={hub.prune(now=time.monotonic() + 10)}")
@@ -2,13 +2,14 @@ import sys
 import time
 import web
 import json
-from queue import Queue
 from bridge.context import *
 from bridge.reply import Reply, ReplyType
 from channel.chat_channel import ChatChannel, check_prefix
 from channel.chat_message import ChatMessage
+from channel.web.sse_hub import SSEHub
 from common.log import logger
 from common.singleton import singleton
+from common.http_client import http_client
 from config import conf
 import os
 
@@ -43,7 +44,7 @@ class WebChannel(ChatChannel):
 
     def __init__(self):
         super().__init__()
-        self.message_queues = {}  # 为每个用户存储一个消息队列
+        self.sse_hub = SSEHub()  # 为每个用户存储一个消息队列
         self.msg_id_counter = 0  # 添加消息ID计数器
 
     def _generate_msg_id(self):
@@ -64,12 +65,11 @@ class WebChannel(ChatChannel):
             elif reply.type == ReplyType.IMAGE_URL:
                 import io
 
-                import requests
                 from PIL import Image
 
                 image_urls = reply.content if isinstance(reply.content, list) else [reply.content]
                 for img_url in image_urls:
-                    pic_res = requests.get(img_url, stream=True)
+                    pic_res = http_client("media").get(img_url, stream=True)
                     image_storage = io.BytesIO()
                     for block in pic_res.iter_content(1024):
                         image_storage.write(block)
@@ -83,17 +83,13 @@ class WebChannel(ChatChannel):
             # 获取用户ID，如果没有则使用默认值
             # user_id = getattr(context.get("session", None), "session_id", "default_user")
             user_id = context["receiver"]
-            # 确保用户有对应的消息队列
-            if user_id not in self.message_queues:
-                self.message_queues[user_id] = Queue()
-                
-            # 将消息放入对应用户的队列
+            # 将消息放入对应用户的队列，等待中的SSE连接会立即推送
             message_data = {
                 "type": str(reply.type),
                 "content": reply.content,
                 "timestamp": time.time()
             }
-            self.message_queues[user_id].put(message_data)
+            self.sse_hub.publish(user_id, message_data)
             logger.debug(f"Message queued for user {user_id}")
             
         except Exception as e:
@@ -107,31 +103,8 @@ class WebChannel(ChatChannel):
         web.header('Content-Type', 'text/event-stream')
         web.header('Cache-Control', 'no-cache')
         web.header('Connection', 'keep-alive')
-        
-        # 确保用户有消息队列
-        if user_id not in self.message_queues:
-            self.message_queues[user_id] = Queue()
-        
-        try:    
-            while True:
-                try:
-                    # 发送心跳
-                    yield f": heartbeat\n\n"
-                    
-                    # 非阻塞方式获取消息
-                    if not self.message_queues[user_id].empty():
-                        message = self.message_queues[user_id].get_nowait()
-                        yield f"data: {json.dumps(message)}\n\n"
-                    time.sleep(0.5)
-                except Exception as e:
-                    logger.error(f"SSE Error: {e}")
-                    break
-        finally:
-            # 清理资源
-            if user_id in self.message_queues:
-                # 只有当队列为空时才删除
-                if self.message_queues[user_id].empty():
-                    del self.message_queues[user_id]
+        # 阻塞等待用户队列中的消息，空闲时才发送心跳
+        return self.sse_hub.stream(user_id)
 
     def post_message(self):
         """
@@ -10,7 +10,6 @@ import os
 import threading
 import time
 
-import requests
 
 from bridge.context import *
 from bridge.reply import *
@@ -21,6 +20,7 @@ from common.log import logger
 from common.singleton import singleton
 from common.time_check import time_checker
 from common import const
+from common.http_client import http_client
 from config import conf, get_appdata_dir
 from lib import itchat
 from lib.itchat.content import *
@@ -206,7 +206,7 @@ class WechatChannel(ChatChannel):
             image_urls = reply.content if isinstance(reply.content, list) else [reply.content]
             for img_url in image_urls:
                 logger.debug(f"[WX] start download image, img_url={img_url}")
-                pic_res = requests.get(img_url, stream=True)
+                pic_res = http_client("media").get(img_url, stream=True)
                 image_storage = io.BytesIO()
                 size = 0
                 for block in pic_res.iter_content(1024):
@@ -232,7 +232,7 @@ class WechatChannel(ChatChannel):
         elif reply.type == ReplyType.VIDEO_URL:  # 新增视频URL回复类型
             video_url = reply.content
             logger.debug(f"[WX] start download video, video_url={video_url}")
-            video_res = requests.get(video_url, stream=True)
+            video_res = http_client("media").get(video_url, stream=True)
             video_storage = io.BytesIO()
             size = 0
             for block in video_res.iter_content(1024):
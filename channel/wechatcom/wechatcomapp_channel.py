@@ -2,7 +2,6 @@
 import io
 import time
 
-import requests
 from flask import Flask, request, abort
 from wechatpy.enterprise import parse_message
 from wechatpy.enterprise.crypto import WeChatCrypto
@@ -17,6 +16,7 @@ from channel.wechatcom.wechatcomapp_message import WechatComAppMessage
 from common.log import logger
 from common.singleton import singleton
 from common.utils import compress_imgfile, fsize, split_string_by_utf8_length
+from common.http_client import http_client
 from config import conf
 
 MAX_UTF8_LEN = 2048
@@ -66,7 +66,7 @@ class WechatComAppChannel(ChatChannel):
             logger.info("[wechatcom] Do send text to {}: {}".format(receiver, reply_text))
         elif reply.type == ReplyType.IMAGE_URL:
             img_url = reply.content
-            pic_res = requests.get(img_url, stream=True)
+            pic_res = http_client("media").get(img_url, stream=True)
             image_storage = io.BytesIO()
             for block in pic_res.iter_content(1024):
                 image_storage.write(block)
@@ -6,7 +6,6 @@ import os
 import threading
 import time
 
-import requests
 import web
 from wechatpy.crypto import WeChatCrypto
 from wechatpy.exceptions import WeChatClientException
@@ -20,6 +19,7 @@ from channel.wechatmp.wechatmp_client import WechatMPClient
 from common.log import logger
 from common.singleton import singleton
 from common.utils import split_string_by_utf8_length
+from common.http_client import http_client
 from config import conf
 from voice.audio_convert import any_to_mp3, split_audio
 
@@ -50,6 +50,9 @@ class WechatMPChannel(ChatChannel):
             self.cache_dict = defaultdict(list)
             # Record whether the current message is being processed
             self.running = set()
+            # 每个正在处理的用户一个Event，处理结束时置位，被动回复的请求线程在上面等待
+            self.reply_events = dict()
+            self.reply_lock = threading.Lock()
             # Count the request from wechat official server by message_id
             self.request_cnt = dict()
             # The permanent media need to be deleted to avoid media number limit
@@ -109,7 +112,7 @@ class WechatMPChannel(ChatChannel):
             elif reply.type == ReplyType.IMAGE_URL:  # 从网络下载图片
                 image_urls = reply.content if isinstance(reply.content, list) else [reply.content]
                 for img_url in image_urls:
-                    pic_res = requests.get(img_url, stream=True)
+                    pic_res = http_client("media").get(img_url, stream=True)
                     image_storage = io.BytesIO()
                     for block in pic_res.iter_content(1024):
                         image_storage.write(block)
@@ -193,7 +196,7 @@ class WechatMPChannel(ChatChannel):
                 logger.info("[wechatmp] Do send voice to {}".format(receiver))
             elif reply.type == ReplyType.IMAGE_URL:  # 从网络下载图片
                 img_url = reply.content
-                pic_res = requests.get(img_url, stream=True)
+                pic_res = http_client("media").get(img_url, stream=True)
                 image_storage = io.BytesIO()
                 for block in pic_res.iter_content(1024):
                     image_storage.write(block)
@@ -225,13 +228,36 @@ class WechatMPChannel(ChatChannel):
                 logger.info("[wechatmp] Do send image to {}".format(receiver))
         return
 
+    def begin_passive_reply(self, user):
+        """被动回复模式下，用户的消息开始处理前调用"""
+        with self.reply_lock:
+            self.running.add(user)
+            self.reply_events[user] = threading.Event()
+
+    def wait_passive_reply(self, user, timeout):
+        """等待用户的消息处理结束(回复已进入cache_dict)，超时返回False"""
+        with self.reply_lock:
+            if user not in self.running:
+                return True
+            event = self.reply_events.get(user)
+        if event is None or timeout <= 0:
+            return user not in self.running
+        return event.wait(timeout)
+
+    def _finish_passive_reply(self, user):
+        with self.reply_lock:
+            self.running.remove(user)
+            event = self.reply_events.pop(user, None)
+        if event is not None:
+            event.set()
+
     def _success_callback(self, session_id, context, **kwargs):  # 线程异常结束时的回调函数
         logger.debug("[wechatmp] Success to generate reply, msgId={}".format(context["msg"].msg_id))
         if self.passive_reply:
-            self.running.remove(session_id)
+            self._finish_passive_reply(session_id)
 
     def _fail_callback(self, session_id, exception, context, **kwargs):  # 线程异常结束时的回调函数
         logger.exception("[wechatmp] Fail to generate reply to user, msgId={}, exception={}".format(context["msg"].msg_id, exception))
         if self.passive_reply:
             assert session_id not in self.cache_dict
-            self.running.remove(session_id)
+            self._finish_passive_reply(session_id)
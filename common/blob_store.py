@@ -0,0 +1,341 @@
+"""
+按内容寻址的媒体存储：以SHA-256为键，保存在内存(LRU)和TmpDir下的磁盘目录中。
+会话历史里只保存 blob://{mime_type}/{sha256} 形式的短引用，
+向模型发请求时才通过 materialize / resolve_url 还原成 data URL，
+相同的图片在不同会话之间只存一份，历史越长内存也不会随之增长。
+每次读写都会刷新文件的修改时间，定期清理超过blob_store_max_age未使用的文件，
+总大小超过blob_store_disk_bytes时再从最久未使用的开始删除；仍在会话中引用的文件(register_ref_source)不会删除。
+引用的文件缺失时，materialize把该媒体块换成文字说明，resolve_url返回None，不会把blob://引用发给模型。
+"""
+
+import base64
+import hashlib
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from common.log import logger
+from common.tmp_dir import TmpDir
+from config import conf
+
+BLOB_SCHEME = "blob://"
+DEFAULT_BLOB_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_BLOB_MAX_AGE = 24 * 3600
+DEFAULT_BLOB_DISK_BYTES = 1024 * 1024 * 1024
+SWEEP_INTERVAL_SECONDS = 600
+TMP_FILE_MAX_AGE = 3600
+EXPIRED_MEDIA_TEXT = "[媒体文件已过期]"
+
+
+class BlobStore:
+    def __init__(self, root=None):
+        self._root = root
+        self.lock = threading.Lock()
+        self.memory = OrderedDict()  # sha256 -> bytes，按最近使用排序
+        self.memory_bytes = 0
+        self.hits = 0
+        self.disk_reads = 0
+        self.writes = 0
+        self.dedup = 0
+        self.swept = 0
+        self._last_sweep = time.time()
+
+    @property
+    def root(self):
+        if self._root is None:
+            self._root = os.path.join(TmpDir().path(), "blobs")
+        return self._root
+
+    def put(self, data, mime_type):
+        """保存二进制内容，返回blob引用；内容已存在时直接复用"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if self._touch(path):
+            with self.lock:
+                self.dedup += 1
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.writes += 1
+        self._remember(digest, data)
+        self._maybe_sweep()
+        return f"{BLOB_SCHEME}{mime_type}/{digest}"
+
+    def put_base64(self, b64_data, mime_type):
+        return self.put(base64.b64decode(b64_data), mime_type)
+
+    def get_bytes(self, ref):
+        _, digest = parse_ref(ref)
+        path = self._path(digest)
+        with self.lock:
+            data = self.memory.get(digest)
+            if data is not None:
+                self.memory.move_to_end(digest)
+                self.hits += 1
+        if data is not None:
+            self._touch(path)
+            return data
+        with open(path, "rb") as file:
+            data = file.read()
+        with self.lock:
+            self.disk_reads += 1
+        self._touch(path)
+        self._remember(digest, data)
+        return data
+
+    def path(self, ref):
+        """引用对应的本地文件路径，可直接用于文件上传"""
+        return self._path(parse_ref(ref)[1])
+
+    def to_data_url(self, ref):
+        mime_type, _ = parse_ref(ref)
+        return f"data:{mime_type};base64,{base64.b64encode(self.get_bytes(ref)).decode('utf-8')}"
+
+    def stats(self):
+        with self.lock:
+            return {
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "hits": self.hits,
+                "disk_reads": self.disk_reads,
+                "writes": self.writes,
+                "dedup": self.dedup,
+                "swept": self.swept,
+            }
+
+    def sweep(self, now=None):
+        """
+        删除超过blob_store_max_age未使用的文件，总大小仍超过blob_store_disk_bytes时从最久未使用的开始删除；
+        会话中仍在引用的文件不删除。返回删除的文件数
+        """
+        now = now or time.time()
+        # 不早于会话过期时间删除，会话不过期(expires_in_seconds为0)时只靠引用保护
+        max_age = conf().get("blob_store_max_age", DEFAULT_BLOB_MAX_AGE)
+        if max_age:
+            max_age = max(max_age, conf().get("expires_in_seconds") or 0)
+        max_bytes = conf().get("blob_store_disk_bytes", DEFAULT_BLOB_DISK_BYTES)
+        live = live_digests()  # 收集失败时抛出异常，本次不清理
+        files = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if path.endswith(".tmp") and now - stat.st_mtime < TMP_FILE_MAX_AGE:  # 可能正在写入
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in sorted(files):
+            if not (max_age and now - mtime > max_age) and not (max_bytes and total > max_bytes):
+                break
+            if os.path.basename(path) in live:
+                continue
+            try:
+                if os.stat(path).st_mtime != mtime:  # 扫描后又被使用过
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            self._forget(os.path.basename(path))
+        with self.lock:
+            self.swept += removed
+        if removed:
+            logger.info(f"[BlobStore] swept {removed} blobs, remaining_bytes={total}, live_refs={len(live)}")
+        if max_bytes and total > max_bytes:
+            logger.warning(f"[BlobStore] blobs referenced by live sessions exceed blob_store_disk_bytes, bytes={total}")
+        return removed
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self.lock:
+            if now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+                return
+            self._last_sweep = now
+        threading.Thread(target=self._sweep_quietly, name="blob-sweep", daemon=True).start()
+
+    def _sweep_quietly(self):
+        try:
+            self.sweep()
+        except Exception as e:
+            logger.warning(f"[BlobStore] sweep failed: {e}")
+
+    def _files(self):
+        """blob文件和写入中断残留的临时文件"""
+        if not os.path.isdir(self.root):
+            return
+        for bucket in os.scandir(self.root):
+            if bucket.is_dir():
+                for entry in os.scandir(bucket.path):
+                    yield entry.path
+
+    @staticmethod
+    def _touch(path):
+        """刷新修改时间作为最近使用时间，文件不存在时返回False"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _forget(self, digest):
+        with self.lock:
+            data = self.memory.pop(digest, None)
+            if data is not None:
+                self.memory_bytes -= len(data)
+
+    def _remember(self, digest, data):
+        max_bytes = conf().get("blob_store_memory_bytes", DEFAULT_BLOB_MEMORY_BYTES)
+        if not max_bytes or len(data) > max_bytes:
+            return
+        with self.lock:
+            old = self.memory.pop(digest, None)
+            if old is not None:
+                self.memory_bytes -= len(old)
+            self.memory[digest] = data
+            self.memory_bytes += len(data)
+            while self.memory_bytes > max_bytes and len(self.memory) > 1:
+                _, evicted = self.memory.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def _path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+
+blob_store = BlobStore()
+
+_ref_sources = []  # 返回仍在使用的消息的绑定方法(弱引用)
+_ref_sources_lock = threading.Lock()
+
+
+class BlobMissingError(FileNotFoundError):
+    pass
+
+
+def register_ref_source(method):
+    """
+    注册一个返回仍在使用的消息(可任意嵌套)的绑定方法，清理时跳过其中引用的blob。
+    以弱引用保存，对象被回收后自动失效
+    """
+    with _ref_sources_lock:
+        _ref_sources.append(weakref.WeakMethod(method))
+
+
+def live_digests():
+    with _ref_sources_lock:
+        _ref_sources[:] = [ref for ref in _ref_sources if ref() is not None]
+        sources = [ref() for ref in _ref_sources]
+    digests = set()
+    for source in sources:
+        if source is not None:
+            _collect_digests(source(), digests)
+    return digests
+
+
+def _collect_digests(value, digests):
+    if isinstance(value, str):
+        if is_blob_ref(value):
+            digests.add(value.rpartition("/")[2])
+    elif isinstance(value, dict):
+        for item in list(value.values()):
+            _collect_digests(item, digests)
+    elif isinstance(value, (list, tuple)):
+        for item in list(value):
+            _collect_digests(item, digests)
+
+
+def is_blob_ref(value):
+    return isinstance(value, str) and value.startswith(BLOB_SCHEME)
+
+
+def parse_ref(ref):
+    """blob://{mime_type}/{sha256} -> (mime_type, sha256)"""
+    mime_type, _, digest = ref[len(BLOB_SCHEME):].rpartition("/")
+    if len(digest) != 64:
+        raise ValueError(f"invalid blob ref: {ref[:80]}")
+    return mime_type or "application/octet-stream", digest
+
+
+def store_data_url(url):
+    """把data URL转存为blob引用，其他URL原样返回"""
+    if not isinstance(url, str) or not url.startswith("data:") or ";base64," not in url:
+        return url
+    header, b64_data = url.split(",", 1)
+    mime_type = header[len("data:"):].split(";", 1)[0]
+    return blob_store.put_base64(b64_data, mime_type)
+
+
+def resolve_url(url):
+    """blob引用还原成data URL，其他URL原样返回；引用的文件已被清理时返回None"""
+    if is_blob_ref(url):
+        try:
+            return blob_store.to_data_url(url)
+        except OSError as e:
+            logger.warning(f"[BlobStore] blob missing, skip {url[:80]}: {e}")
+            return None
+    return url
+
+
+def read_media_url(url):
+    """读取blob引用或data URL的内容，返回(mime_type, bytes)"""
+    if is_blob_ref(url):
+        return parse_ref(url)[0], blob_store.get_bytes(url)
+    header, b64_data = url.split(",", 1)
+    mime_type = header.split(":", 1)[1].split(";", 1)[0]
+    return mime_type, base64.b64decode(b64_data)
+
+
+def materialize(value):
+    """
+    把消息中的blob引用还原成data URL，用于序列化模型请求。
+    只复制包含引用的容器，不含引用的部分原样返回，不会修改会话中的消息。
+    引用的文件已被清理时，所在的内容块(带type的dict)换成文字说明
+    """
+    try:
+        return _materialize(value)
+    except BlobMissingError as e:
+        logger.warning(f"[BlobStore] {e}")
+        return EXPIRED_MEDIA_TEXT
+
+
+def _materialize(value):
+    if isinstance(value, str):
+        if is_blob_ref(value):
+            try:
+                return blob_store.to_data_url(value)
+            except OSError as e:
+                raise BlobMissingError(f"blob missing, replace with text: {value[:80]}") from e
+        return value
+    if isinstance(value, dict):
+        result = None
+        for key, item in value.items():
+            try:
+                materialized = _materialize(item)
+            except BlobMissingError as e:
+                if "type" not in value:
+                    raise
+                logger.warning(f"[BlobStore] {e}")
+                return {"type": "text", "text": EXPIRED_MEDIA_TEXT}
+            if materialized is not item:
+                if result is None:
+                    result = dict(value)
+                result[key] = materialized
+        return value if result is None else result
+    if isinstance(value, list):
+        result = None
+        for i, item in enumerate(value):
+            materialized = _materialize(item)
+            if materialized is not item:
+                if result is None:
+                    result = list(value)
+                result[i] = materialized
+        return value if result is None else result
+    return value
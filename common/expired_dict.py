@@ -1,22 +1,85 @@
-from datetime import datetime, timedelta
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
 
+SWEEP_INTERVAL_SECONDS = 60  # 后台清理过期条目的间隔
 
-class ExpiredDict(dict):
-    def __init__(self, expires_in_seconds):
-        super().__init__()
+_MISSING = object()
+
+
+class ExpiredDict(MutableMapping):
+    """
+    带过期时间的字典，读取和写入都会刷新过期时间。
+    所有条目的有效期相同，按最近访问顺序保存就等价于按过期时间排序，
+    所以过期清理只需从头部弹出，均摊O(1)；后台线程会定期清理长时间没人访问的字典。
+    可选 max_entries / max_bytes 上限，超出时淘汰最久未访问的条目。
+    """
+
+    def __init__(self, expires_in_seconds, max_entries=None, max_bytes=None, sizeof=None):
         self.expires_in_seconds = expires_in_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # 只有设置了字节上限或传入了sizeof时才计算条目大小
+        self.sizeof = sizeof or (estimate_size if max_bytes else None)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()  # key -> [value, expiry_time, size]
+        self._lock = threading.RLock()
+        _register(self)
 
     def __getitem__(self, key):
-        value, expiry_time = super().__getitem__(key)
-        if datetime.now() > expiry_time:
-            del self[key]
-            raise KeyError("expired {}".format(key))
-        self.__setitem__(key, value)
-        return value
+        with self._lock:
+            item = self._data.get(key)
+            now = time.monotonic()
+            if item is None or item[1] <= now:
+                if item is not None:
+                    self._pop_item(key)
+                    self.expirations += 1
+                self.misses += 1
+                raise KeyError("expired {}".format(key) if item is not None else key)
+            self.hits += 1
+            item[1] = now + self.expires_in_seconds
+            self._data.move_to_end(key)
+            return item[0]
 
     def __setitem__(self, key, value):
-        expiry_time = datetime.now() + timedelta(seconds=self.expires_in_seconds)
-        super().__setitem__(key, (value, expiry_time))
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            if key in self._data:
+                self._pop_item(key)
+            self._data[key] = [value, time.monotonic() + self.expires_in_seconds, size]
+            self.current_bytes += size
+            self.expire()
+            self._evict()
+        _ensure_sweeper()
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._pop_item(key)
+
+    def __contains__(self, key):
+        # 只检查是否存在，不刷新过期时间
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[1] > time.monotonic()
+
+    def __len__(self):
+        with self._lock:
+            self.expire()
+            return len(self._data)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __repr__(self):
+        return "{}({}, expires_in_seconds={})".format(type(self).__name__, dict(self.items()), self.expires_in_seconds)
 
     def get(self, key, default=None):
         try:
@@ -24,19 +87,137 @@ class ExpiredDict(dict):
         except KeyError:
             return default
 
-    def __contains__(self, key):
-        try:
-            self[key]
-            return True
-        except KeyError:
-            return False
+    def pop(self, key, default=_MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                self._pop_item(key)
+                if item[1] > time.monotonic():
+                    return item[0]
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
 
     def keys(self):
-        keys = list(super().keys())
-        return [key for key in keys if key in self]
+        with self._lock:
+            self.expire()
+            return list(self._data.keys())
+
+    def values(self):
+        with self._lock:
+            self.expire()
+            return [item[0] for item in self._data.values()]
 
     def items(self):
-        return [(key, self[key]) for key in self.keys()]
+        with self._lock:
+            self.expire()
+            return [(key, item[0]) for key, item in self._data.items()]
 
-    def __iter__(self):
-        return self.keys().__iter__()
+    def expire(self):
+        """清理已过期的条目，返回清理的数量"""
+        cnt = 0
+        with self._lock:
+            now = time.monotonic()
+            while self._data:
+                key, item = next(iter(self._data.items()))
+                if item[1] > now:
+                    break
+                self._pop_item(key)
+                cnt += 1
+            self.expirations += cnt
+        return cnt
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _evict(self):
+        # 调用方需持有self._lock，至少保留刚写入的条目
+        while len(self._data) > 1 and (
+            (self.max_entries and len(self._data) > self.max_entries) or (self.max_bytes and self.current_bytes > self.max_bytes)
+        ):
+            key = next(iter(self._data))
+            self._pop_item(key)
+            self.evictions += 1
+
+    def _pop_item(self, key):
+        item = self._data.pop(key)
+        self.current_bytes -= item[2]
+        return item
+
+
+def estimate_size(value, _depth=0):
+    """粗略估算对象占用的字节数，图片按像素计算，容器最多递归三层"""
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, memoryview):
+        return value.nbytes
+    if hasattr(value, "getbands") and hasattr(value, "width") and hasattr(value, "height"):  # PIL.Image
+        return value.width * value.height * len(value.getbands())
+    if _depth < 3:
+        if isinstance(value, dict):
+            return sys.getsizeof(value) + sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items())
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return sys.getsizeof(value) + sum(estimate_size(item, _depth + 1) for item in value)
+    return sys.getsizeof(value)
+
+
+_instances = []  # 所有ExpiredDict的弱引用，供后台线程清理
+_sweeper_lock = threading.Lock()
+_sweeper_started = False
+
+
+def _register(expired_dict):
+    with _sweeper_lock:
+        _instances.append(weakref.ref(expired_dict))
+    _ensure_sweeper()
+
+
+def _ensure_sweeper():
+    global _sweeper_started
+    if _sweeper_started:
+        return
+    with _sweeper_lock:
+        if not _sweeper_started:
+            threading.Thread(target=_sweep_forever, name="ExpiredDict-sweeper", daemon=True).start()
+            _sweeper_started = True
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+        with _sweeper_lock:
+            _instances[:] = [ref for ref in _instances if ref() is not None]
+            instances = [ref() for ref in _instances]
+        for expired_dict in instances:
+            if expired_dict is None:
+                continue
+            try:
+                expired_dict.expire()
+            except Exception:
+                pass
+
+
+def _after_fork_in_child():
+    # fork之后子进程里没有清理线程，下次写入时重新启动
+    global _sweeper_lock, _sweeper_started
+    _sweeper_lock = threading.Lock()
+    _sweeper_started = False
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
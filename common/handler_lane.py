@@ -0,0 +1,108 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HandlerLane:
+    """
+    消息处理通道，每个通道有独立的线程池和排队上限，
+    避免耗时的图片/视频生成任务占满线程后拖慢文字聊天。
+    """
+
+    def __init__(self, name, workers, max_queue=0):
+        self.name = name
+        self.workers = max(int(workers or 1), 1)
+        self.max_queue = max(int(max_queue or 0), 0)  # 0 表示不限制排队数量
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"handler-{name}")
+        self.lock = threading.Lock()
+        self.queued = 0  # 已分发但还未开始处理
+        self.running = 0  # 正在处理
+        self.dispatched = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    def enter(self):
+        """登记一个待处理任务，排队已满时返回None"""
+        with self.lock:
+            if self.max_queue and self.queued >= self.max_queue:
+                self.rejected += 1
+                return None
+            self.queued += 1
+            self.dispatched += 1
+        return LaneTicket(self)
+
+    def submit(self, ticket, fn, *args, **kwargs):
+        """在本通道线程池中执行fn，开始执行时统计排队等待时间"""
+
+        def run():
+            ticket.start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                ticket.finish()
+
+        future = self.pool.submit(run)
+        future.add_done_callback(lambda f: ticket.cancel())
+        return future
+
+    def stats(self):
+        with self.lock:
+            started = self.dispatched - self.queued
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "dispatched": self.dispatched,
+                "rejected": self.rejected,
+                "avg_wait": self.total_wait / started if started > 0 else 0.0,
+                "max_wait": self.max_wait,
+                "last_wait": self.last_wait,
+            }
+
+    def _on_start(self, wait):
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            self.total_wait += wait
+            self.last_wait = wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+
+    def _on_finish(self):
+        with self.lock:
+            self.running -= 1
+
+    def _on_cancel(self):
+        with self.lock:
+            self.queued -= 1
+            self.dispatched -= 1
+
+
+class LaneTicket:
+    """一个任务在通道中的状态，start/finish/cancel都只生效一次"""
+
+    PENDING, STARTED, DONE = 0, 1, 2
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.created_at = time.monotonic()
+        self.state = self.PENDING
+
+    def start(self):
+        if self.state == self.PENDING:
+            self.state = self.STARTED
+            self.lane._on_start(time.monotonic() - self.created_at)
+
+    def finish(self):
+        if self.state == self.STARTED:
+            self.state = self.DONE
+            self.lane._on_finish()
+
+    def cancel(self):
+        # 还未开始就被取消(或出错)时归还排队名额
+        if self.state == self.PENDING:
+            self.state = self.DONE
+            self.lane._on_cancel()
@@ -0,0 +1,132 @@
+"""
+共享的HTTP客户端：每个服务商一个requests.Session，
+同一主机的连接保持长连接复用，不必每次请求都重新握手；
+统一默认超时，并按服务商配置重试和退避策略。
+用法：
+    from common.http_client import http_client
+    resp = http_client("kling").post(url, json=payload)
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common.log import logger
+from config import conf
+
+DEFAULT_TIMEOUT = (5, 60)  # (连接超时, 读取超时)
+DEFAULT_POOL_CONNECTIONS = 16  # 每个客户端缓存的主机连接池数量
+DEFAULT_POOL_MAXSIZE = 32  # 每个主机连接池保持的最大连接数
+
+# 各服务商的重试策略，未列出的使用default
+# - methods: 允许重试的请求方法，提交任务的POST默认不重试，避免重复创建任务
+# - status: 遇到这些状态码时重试
+DEFAULT_RETRY_POLICIES = {
+    "default": {"total": 2, "backoff_factor": 0.5, "status": [502, 503, 504], "methods": ["GET", "HEAD"]},
+    "kling": {"total": 3, "backoff_factor": 1, "status": [429, 500, 502, 503, 504], "methods": ["GET"]},
+    "openai_image": {"total": 3, "backoff_factor": 1, "status": [429, 502, 503, 504], "methods": ["GET"]},
+    "media": {"total": 3, "backoff_factor": 0.5, "status": [429, 500, 502, 503, 504], "methods": ["GET", "HEAD"]},
+}
+
+
+class HttpClient(requests.Session):
+    """带默认超时和请求计数的Session"""
+
+    def __init__(self, name, timeout, retry, pool_connections, pool_maxsize):
+        super().__init__()
+        self.name = name
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount("https://", self.adapter)
+        self.mount("http://", self.adapter)
+        self.stats_lock = threading.Lock()
+        self.requests_count = 0
+        self.errors = 0
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        with self.stats_lock:
+            self.requests_count += 1
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.RequestException:
+            with self.stats_lock:
+                self.errors += 1
+            raise
+
+    def stats(self):
+        """按主机统计连接池：已建立的连接数、发出的请求数、空闲连接数"""
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            idle = pool.pool.qsize() if getattr(pool, "pool", None) is not None else 0
+            hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": idle,
+            }
+        with self.stats_lock:
+            return {"requests": self.requests_count, "errors": self.errors, "hosts": hosts}
+
+
+_lock = threading.Lock()
+_clients = {}
+_clients_pid = None
+
+
+def http_client(provider="default"):
+    """获取服务商对应的共享客户端，首次使用时创建"""
+    global _clients_pid
+    client = _clients.get(provider)
+    if client is not None and _clients_pid == os.getpid():
+        return client
+    with _lock:
+        if _clients_pid != os.getpid():
+            # fork出的子进程不能复用父进程的连接
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(provider)
+        if client is None:
+            client = _clients[provider] = _build_client(provider)
+        return client
+
+
+def http_stats():
+    with _lock:
+        clients = dict(_clients)
+    return {name: client.stats() for name, client in clients.items()}
+
+
+def _build_client(provider):
+    policy = _get_retry_policy(provider)
+    retry = Retry(
+        total=policy.get("total", 0),
+        connect=policy.get("total", 0),  # 连接失败时请求还没发出，任何方法都可以安全重试
+        backoff_factor=policy.get("backoff_factor", 0),
+        status_forcelist=policy.get("status") or [],
+        allowed_methods=frozenset(m.upper() for m in policy.get("methods") or []),
+        raise_on_status=False,  # 重试用完后返回最后一次的响应，由调用方判断状态码
+    )
+    timeout = conf().get("http_timeout", DEFAULT_TIMEOUT)
+    client = HttpClient(
+        provider,
+        tuple(timeout) if isinstance(timeout, (list, tuple)) else timeout,
+        retry,
+        conf().get("http_pool_connections", DEFAULT_POOL_CONNECTIONS),
+        conf().get("http_pool_maxsize", DEFAULT_POOL_MAXSIZE),
+    )
+    logger.debug(f"[HttpClient] client created, provider={provider}, retry={policy}")
+    return client
+
+
+def _get_retry_policy(provider):
+    policies = dict(DEFAULT_RETRY_POLICIES)
+    policies.update(conf().get("http_retry_policies") or {})
+    return policies.get(provider) or policies["default"]
@@ -0,0 +1,186 @@
+"""
+生成任务日志：job_poller接手的任务在提交时追加一条记录(服务商、task_id、会话、接收者、通道)，
+结束时再追加一条完成记录。进程重启后从日志中找出未完成的任务，重新轮询并发送结果，
+已付费生成的视频不会因为部署或OOM重启而丢失。
+
+日志为JSONL格式，只追加写入；完成的任务累计到一定数量后重写文件，只保留未完成的任务。
+多个进程(如gunicorn的多个worker)共用同一个日志时，通过独立的锁文件串行读写，
+每个未完成任务只会被一个存活的进程接手。
+"""
+
+import json
+import os
+import threading
+import time
+
+from common.log import logger
+from config import conf, get_appdata_dir
+
+try:
+    import fcntl
+except ImportError:  # Windows下只有进程内互斥
+    fcntl = None
+
+DEFAULT_COMPACT_EVERY = 100  # 完成多少个任务后重写一次日志
+DEFAULT_MAX_AGE = 7 * 24 * 3600  # 超过该秒数仍未完成的任务在重写时丢弃
+JOURNAL_FILE_NAME = "job_journal.jsonl"
+
+
+class JobJournal:
+    def __init__(self, path=None):
+        self._path = path
+        self.lock = threading.Lock()
+        self.finished_since_compact = 0
+
+    @property
+    def path(self):
+        if self._path is None:
+            self._path = conf().get("job_journal_path") or os.path.join(get_appdata_dir(), JOURNAL_FILE_NAME)
+        return self._path
+
+    @property
+    def enabled(self):
+        return bool(conf().get("job_journal", True))
+
+    def record_submit(self, record):
+        record = dict(record, op="submit", pid=os.getpid(), ts=time.time())
+        self._append([record])
+
+    def record_finish(self, job_id, status):
+        self._append([{"op": "finish", "job_id": job_id, "status": status, "ts": time.time()}])
+        with self.lock:
+            self.finished_since_compact += 1
+            need_compact = self.finished_since_compact >= conf().get("job_journal_compact_every", DEFAULT_COMPACT_EVERY)
+        if need_compact:
+            self.compact()
+
+    def claim_unfinished(self, channel_type):
+        """
+        接手指定通道下未完成、且不属于其他存活进程的任务，返回其提交记录。
+        接手的同时重写日志，清理已完成和过期的任务
+        """
+        with self._locked():
+            jobs = self._load_unfinished()
+            pid = os.getpid()
+            claimed = []
+            for record in jobs.values():
+                if record.get("channel_type") != channel_type:
+                    continue
+                owner = record.get("pid")
+                if owner and owner != pid and _pid_alive(owner):
+                    continue
+                record["pid"] = pid
+                claimed.append(record)
+            self._rewrite(jobs)
+        return claimed
+
+    def compact(self):
+        with self._locked():
+            jobs = self._load_unfinished()
+            self._rewrite(jobs)
+        logger.info(f"[JobJournal] compacted, unfinished={len(jobs)}, path={self.path}")
+
+    def _load_unfinished(self):
+        """读取日志，返回 job_id -> 提交记录，跳过已完成和过期的任务"""
+        jobs = {}
+        if not os.path.exists(self.path):
+            return jobs
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # 进程在写入时被杀会留下不完整的最后一行
+                    logger.warning(f"[JobJournal] skip broken line: {line[:80]}")
+                    continue
+                op = record.get("op")
+                if op == "submit":
+                    jobs[record["job_id"]] = record
+                elif op == "finish":
+                    jobs.pop(record.get("job_id"), None)
+        max_age = conf().get("job_journal_max_age", DEFAULT_MAX_AGE)
+        if max_age:
+            expired_before = time.time() - max_age
+            for job_id in [job_id for job_id, record in jobs.items() if record.get("created_at", 0) < expired_before]:
+                logger.warning(f"[JobJournal] drop expired job, job_id={job_id}, provider={jobs[job_id].get('provider')}")
+                jobs.pop(job_id)
+        return jobs
+
+    def _rewrite(self, jobs):
+        # 调用方持有锁
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for record in jobs.values():
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+        self.finished_since_compact = 0
+
+    def _append(self, records):
+        try:
+            with self._locked():
+                with open(self.path, "a", encoding="utf-8") as file:
+                    for record in records:
+                        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    file.flush()
+                    os.fsync(file.fileno())
+        except Exception as e:
+            # 日志只用于重启恢复，写入失败不影响任务本身
+            logger.warning(f"[JobJournal] append failed: {e}")
+
+    def _locked(self):
+        return _JournalLock(self)
+
+
+class _JournalLock:
+    """进程内用threading.Lock，进程间对锁文件加flock；日志文件会被重写替换，所以不能直接锁日志文件"""
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.file = None
+
+    def __enter__(self):
+        self.journal.lock.acquire()
+        try:
+            directory = os.path.dirname(self.journal.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        except Exception:
+            self.journal.lock.release()
+            raise
+        if fcntl is not None:
+            try:
+                self.file = open(self.journal.path + ".lock", "a")
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+            except Exception:
+                self.__exit__(None, None, None)
+                raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.file is not None:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+                self.file.close()
+                self.file = None
+        finally:
+            self.journal.lock.release()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+job_journal = JobJournal()
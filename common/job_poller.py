@@ -0,0 +1,319 @@
+"""
+图片/视频生成任务的统一轮询：提交任务后把任务ID交给job_poller，处理线程立即返回，
+由一个后台线程按各服务商的轮询间隔(逐步拉长并带随机抖动)统一查询状态，
+任务完成后通过消息所属通道的send_async_reply把结果发给用户。
+
+服务商bot实现以下方法即可接入：
+    poll_job(job) -> (status, value)   查询一次状态，status为PENDING/BACKOFF/DONE/FAILED
+    complete_job(job, value) -> Reply  任务成功，value为poll_job返回的结果
+    fail_job(job, message) -> Reply    可选，任务失败或超时，默认返回ERROR回复
+用法：
+    job = Job("kling_video", task_id, context, data={"model": model})
+    if job_poller.can_deliver(context):
+        job_poller.submit(self, job)
+        return None
+    return job_poller.run_sync(self, job)   # 没有可用的通道时在当前线程轮询
+
+交给后台的任务会写入job_journal，进程重启后由resume(channel)接着轮询并回复。
+"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from bridge.context import Context, ContextType
+from bridge.reply import Reply, ReplyType
+from common.job_journal import job_journal
+from common.log import logger
+from config import conf
+
+PENDING = "pending"  # 任务仍在进行
+BACKOFF = "backoff"  # 服务商限流，加倍等待后再查
+DONE = "done"
+FAILED = "failed"
+
+DEFAULT_POLLER_WORKERS = 4
+TIMEOUT_MESSAGE = "任务超时，请稍后重试"
+
+# 各服务商的轮询策略，未列出的使用default
+# - initial: 提交后第一次查询的等待秒数；之后每次乘以factor，不超过max
+# - jitter: 在间隔上叠加的随机比例，避免同时提交的任务总在同一时刻查询
+# - backoff_max: 限流退避时的最长间隔
+# - timeout: 超过该秒数仍未完成则按超时失败处理
+DEFAULT_POLL_POLICIES = {
+    "default": {"initial": 5, "max": 30, "factor": 1.5, "jitter": 0.2, "backoff_max": 60, "timeout": 1800},
+    "kling_video": {"initial": 5, "max": 20, "factor": 1.3, "jitter": 0.2, "backoff_max": 30, "timeout": 600},
+    "kling_image": {"initial": 3, "max": 10, "factor": 1.3, "jitter": 0.2, "backoff_max": 30, "timeout": 600},
+    "doubao_video": {"initial": 15, "max": 30, "factor": 1.3, "jitter": 0.2, "backoff_max": 60, "timeout": 3600},
+    "luma_image": {"initial": 2, "max": 8, "factor": 1.5, "jitter": 0.2, "backoff_max": 30, "timeout": 240},
+    "gemini_video": {"initial": 10, "max": 20, "factor": 1.2, "jitter": 0.2, "backoff_max": 60, "timeout": 1800},
+}
+DEFAULT_RESUME_DELAY = 10  # 重启后等待通道就绪再开始轮询恢复的任务
+# 日志中只保存可以JSON序列化的上下文字段，msg、channel等对象在恢复时不可用
+_UNSERIALIZABLE_CONTEXT_KEYS = {"channel", "msg"}
+
+
+class Job:
+    def __init__(self, provider, task_id, context=None, data=None):
+        """
+        :param provider: 服务商名称，对应轮询策略
+        :param task_id: 服务商返回的任务ID
+        :param context: 触发任务的消息上下文，完成后按它回复
+        :param data: 查询和生成回复需要的其他信息，如model
+        """
+        self.job_id = uuid.uuid4().hex[:12]
+        self.provider = provider
+        self.task_id = task_id
+        self.context = context
+        self.data = dict(data or {})
+        self.session_id = context.get("session_id") if context else None
+        self.created_at = time.time()
+        self.started = time.monotonic()
+        self.attempts = 0
+        self.interval = None
+        self.handler = None  # 提交该任务的bot，查询和生成回复都用它，不写入任务日志
+
+    @property
+    def model(self):
+        return self.data.get("model") or self.provider
+
+    def to_record(self):
+        """写入任务日志的内容，恢复时用于重建任务和回复用的上下文"""
+        context = self.context
+        channel = context.get("channel")
+        kwargs = {
+            key: value for key, value in context.kwargs.items()
+            if key not in _UNSERIALIZABLE_CONTEXT_KEYS and (value is None or isinstance(value, (str, int, float, bool)))
+        }
+        return {
+            "job_id": self.job_id,
+            "provider": self.provider,
+            "task_id": self.task_id,
+            "session_id": self.session_id,
+            "receiver": context.get("receiver"),
+            "channel_type": getattr(channel, "channel_type", None) or conf().get("channel_type"),
+            "created_at": self.created_at,
+            "data": self.data,
+            "context": {"type": context.type.name, "content": context.content, "kwargs": kwargs},
+        }
+
+    @classmethod
+    def from_record(cls, record, channel):
+        saved = record["context"]
+        context = Context(ContextType[saved["type"]], saved.get("content"), dict(saved.get("kwargs") or {}))
+        context["channel"] = channel
+        job = cls(record["provider"], record["task_id"], context, record.get("data"))
+        job.job_id = record["job_id"]
+        job.created_at = record.get("created_at") or job.created_at
+        # 停机期间也计入超时
+        job.started -= max(time.time() - job.created_at, 0)
+        return job
+
+    def __repr__(self):
+        return f"Job(provider={self.provider}, task_id={self.task_id}, session_id={self.session_id}, attempts={self.attempts})"
+
+
+class JobPoller:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []  # (下次查询时间, 序号, job)
+        self.seq = itertools.count()
+        self.thread = None
+        self.poll_executor = None
+        self.deliver_executor = None
+        self.counters = {"submitted": 0, "polls": 0, "completed": 0, "failed": 0, "timeout": 0, "errors": 0, "resumed": 0}
+        self.resumed_channels = set()
+
+    def can_deliver(self, context):
+        """消息所属通道支持异步回复时，任务可以交给后台轮询"""
+        if not conf().get("async_job_polling", True) or context is None:
+            return False
+        return callable(getattr(context.get("channel"), "send_async_reply", None))
+
+    def submit(self, handler, job, delay=None, journal=True):
+        """
+        :param delay: 第一次查询前等待的秒数，默认为轮询策略的initial
+        :param journal: 是否写入任务日志，从日志恢复的任务不再重复写入
+        """
+        job.handler = handler
+        job.interval = self._policy(job.provider)["initial"]
+        if journal and job_journal.enabled:
+            job_journal.record_submit(job.to_record())
+        with self.cond:
+            self._ensure_started()
+            self.counters["submitted"] += 1
+            self._schedule(job, job.interval if delay is None else delay)
+        logger.info(
+            f"[JobPoller] job submitted, provider={job.provider}, task_id={job.task_id}, "
+            f"session_id={job.session_id}, pending={len(self.heap)}"
+        )
+        return job
+
+    def resume(self, channel):
+        """接手任务日志中属于该通道的未完成任务，继续轮询并通过该通道回复，每个通道只恢复一次"""
+        channel_type = getattr(channel, "channel_type", None) or conf().get("channel_type")
+        if not job_journal.enabled or channel_type in self.resumed_channels:
+            return 0
+        self.resumed_channels.add(channel_type)
+        try:
+            records = job_journal.claim_unfinished(channel_type)
+        except Exception as e:
+            logger.warning(f"[JobPoller] read job journal failed: {e}")
+            return 0
+        delay = conf().get("job_resume_delay", DEFAULT_RESUME_DELAY)
+        for record in records:
+            try:
+                job = Job.from_record(record, channel)
+                handler = _create_handler(job)
+            except Exception as e:
+                logger.warning(f"[JobPoller] drop unrecoverable job, job_id={record.get('job_id')}, provider={record.get('provider')}: {e}")
+                job_journal.record_finish(record.get("job_id"), "dropped")
+                continue
+            self.submit(handler, job, delay=delay, journal=False)
+            self._count("resumed")
+            logger.info(
+                f"[JobPoller] job resumed, provider={job.provider}, task_id={job.task_id}, "
+                f"session_id={job.session_id}, age={time.time() - job.created_at:.0f}s"
+            )
+        return len(records)
+
+    def run_sync(self, handler, job):
+        """在当前线程轮询直到任务结束，返回回复"""
+        job.interval = self._policy(job.provider)["initial"]
+        while True:
+            time.sleep(self._jitter(job.provider, job.interval))
+            result = self._step(handler, job)
+            if result is not None:
+                return self._finish(handler, job, *result)
+
+    def stats(self):
+        with self.cond:
+            by_provider = {}
+            for _, _, job in self.heap:
+                by_provider[job.provider] = by_provider.get(job.provider, 0) + 1
+            return dict(self.counters, pending=len(self.heap), by_provider=by_provider)
+
+    def _ensure_started(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        workers = max(int(conf().get("job_poller_workers", DEFAULT_POLLER_WORKERS)), 1)
+        self.poll_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-poll")
+        self.deliver_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-deliver")
+        self.thread = threading.Thread(target=self._run, name="job-poller", daemon=True)
+        self.thread.start()
+
+    def _schedule(self, job, delay):
+        # 调用方持有self.cond
+        heapq.heappush(self.heap, (time.monotonic() + self._jitter(job.provider, delay), next(self.seq), job))
+        self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.heap:
+                    self.cond.wait()
+                due, _, job = self.heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+            self.poll_executor.submit(self._poll, job)
+
+    def _poll(self, job):
+        handler = job.handler
+        result = self._step(handler, job)
+        if result is None:
+            with self.cond:
+                self._schedule(job, job.interval)
+            return
+        # 下载结果、写入会话和发送可能较慢，放到单独的线程池，不占用查询线程
+        self.deliver_executor.submit(self._deliver, handler, job, *result)
+
+    def _step(self, handler, job):
+        """查询一次，任务结束时返回(DONE/FAILED, value)，否则更新job.interval并返回None"""
+        policy = self._policy(job.provider)
+        job.attempts += 1
+        self._count("polls")
+        try:
+            status, value = handler.poll_job(job)
+        except Exception as e:
+            # 未识别的异常按临时错误处理，由超时兜底
+            self._count("errors")
+            logger.warning(f"[JobPoller] poll error, provider={job.provider}, task_id={job.task_id}: {e}")
+            status, value = PENDING, None
+
+        if status in (DONE, FAILED):
+            return status, value
+        if time.monotonic() - job.started >= policy["timeout"]:
+            self._count("timeout")
+            logger.error(f"[JobPoller] job timeout, provider={job.provider}, task_id={job.task_id}")
+            return FAILED, TIMEOUT_MESSAGE
+
+        if status == BACKOFF:
+            job.interval = min(job.interval * 2, policy["backoff_max"])
+            logger.warning(f"[JobPoller] provider busy, provider={job.provider}, task_id={job.task_id}, retry after {job.interval}s")
+        else:
+            job.interval = min(job.interval * policy["factor"], policy["max"])
+        return None
+
+    def _finish(self, handler, job, status, value):
+        """根据最终状态生成回复"""
+        if status == DONE:
+            self._count("completed")
+            logger.info(
+                f"[JobPoller] job done, provider={job.provider}, task_id={job.task_id}, "
+                f"attempts={job.attempts}, elapsed={time.monotonic() - job.started:.1f}s"
+            )
+            try:
+                return handler.complete_job(job, value)
+            except Exception as e:
+                logger.exception(f"[JobPoller] complete job error, provider={job.provider}, task_id={job.task_id}: {e}")
+                return Reply(ReplyType.ERROR, f"[{job.model.upper()}] {e}")
+        self._count("failed")
+        fail_job = getattr(handler, "fail_job", None)
+        if fail_job is not None:
+            return fail_job(job, value)
+        return Reply(ReplyType.ERROR, f"[{job.model.upper()}] {value}")
+
+    def _deliver(self, handler, job, status, value):
+        try:
+            reply = self._finish(handler, job, status, value)
+            job.context["channel"].send_async_reply(job.context, reply)
+        except Exception as e:
+            logger.exception(f"[JobPoller] deliver reply error, provider={job.provider}, task_id={job.task_id}: {e}")
+        job.handler = None
+        if job_journal.enabled:
+            job_journal.record_finish(job.job_id, status)
+
+    def _jitter(self, provider, delay):
+        jitter = self._policy(provider).get("jitter") or 0
+        return max(delay * random.uniform(1 - jitter, 1 + jitter), 0)
+
+    def _policy(self, provider):
+        policies = dict(DEFAULT_POLL_POLICIES)
+        for name, override in (conf().get("job_poll_policies") or {}).items():
+            policies[name] = dict(policies.get(name) or policies["default"], **override)
+        return dict(policies["default"], **(policies.get(provider) or {}))
+
+    def _count(self, name):
+        with self.cond:
+            self.counters[name] += 1
+
+
+def _create_handler(job):
+    """恢复任务时按模型重新创建对应的bot"""
+    if job.provider.endswith("_image"):
+        from image.image_factory import create_image
+
+        return create_image(job.data["model"])
+    from video.video_factory import create_video
+
+    return create_video(job.data["model"])
+
+
+job_poller = JobPoller()
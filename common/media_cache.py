@@ -0,0 +1,262 @@
+"""
+媒体缓存：USER_IMAGE_CACHE / USER_FILE_CACHE 等只保存文件路径和可延迟解码的句柄，
+在构建模型请求时才读取文件、解码图片或生成base64。
+解码结果受全局字节预算约束，超出时按LRU释放，下次使用时再从磁盘读取。
+"""
+
+import base64
+import mimetypes
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+from common.log import logger
+from config import conf
+
+DEFAULT_MEDIA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+
+class MediaBudget:
+    """所有媒体句柄共享的解码内容字节预算"""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.entries = OrderedDict()  # id(handle) -> (weakref(handle), nbytes)，句柄被回收时自动移除
+        self.current_bytes = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        return conf().get("media_cache_max_bytes", DEFAULT_MEDIA_CACHE_MAX_BYTES)
+
+    def charge(self, handle, nbytes):
+        with self.lock:
+            self._discharge(id(handle))
+            key = id(handle)
+            self.entries[key] = (weakref.ref(handle, lambda ref: self.discharge_key(key)), nbytes)
+            self.current_bytes += nbytes
+            max_bytes = self.max_bytes
+            while max_bytes and self.current_bytes > max_bytes and len(self.entries) > 1:
+                victim_key, (victim_ref, _) = next(iter(self.entries.items()))
+                victim = victim_ref()
+                if victim is handle:
+                    break
+                if victim is not None:
+                    victim.release()
+                else:
+                    self._discharge(victim_key)
+                self.evictions += 1
+
+    def touch(self, handle):
+        with self.lock:
+            if id(handle) in self.entries:
+                self.entries.move_to_end(id(handle))
+
+    def discharge(self, handle):
+        self.discharge_key(id(handle))
+
+    def discharge_key(self, key):
+        with self.lock:
+            self._discharge(key)
+
+    def stats(self):
+        """当前解码内容占用的字节数，按缓存类型统计"""
+        with self.lock:
+            by_type = {}
+            for handle_ref, nbytes in self.entries.values():
+                handle = handle_ref()
+                if handle is not None:
+                    by_type[handle.cache_type] = by_type.get(handle.cache_type, 0) + nbytes
+            return {
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "entries": len(self.entries),
+                "evictions": self.evictions,
+                "by_type": by_type,
+            }
+
+    def _discharge(self, key):
+        entry = self.entries.pop(key, None)
+        if entry:
+            self.current_bytes -= entry[1]
+
+
+media_budget = MediaBudget()
+
+
+class MediaHandle:
+    """
+    一个缓存的媒体文件，只保存路径，内容在使用时才加载
+    - image(): 解码后的PIL图片
+    - read_bytes(): 原始字节，不缓存
+    - data(): 与旧缓存格式一致的数据，pdf为base64字符串，docx/txt为文本
+    """
+
+    def __init__(self, path, mime_type=None, cache_type="image"):
+        self.path = path
+        self.cache_type = cache_type
+        self._mime_type = mime_type
+        self._value = None
+
+    @property
+    def mime_type(self):
+        if not self._mime_type:
+            self._mime_type = _guess_mime_type(self.path)
+        return self._mime_type
+
+    @property
+    def file_size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def image(self):
+        from PIL import Image
+
+        return self._materialize(lambda: _load_image(Image, self.path), lambda img: img.width * img.height * len(img.getbands()))
+
+    def read_bytes(self):
+        with open(self.path, "rb") as file:
+            return file.read()
+
+    def data(self):
+        subtype = self.mime_type.split("/", 1)[-1]
+        if subtype == "pdf":
+            return self._materialize(lambda: base64.b64encode(self.read_bytes()).decode("utf-8"), len)
+        if subtype == "docx":
+            return self._materialize(lambda: _read_docx_text(self.path), len)
+        return self._materialize(lambda: _read_text(self.path), len)
+
+    def release(self):
+        """释放已解码的内容，下次使用时重新从磁盘读取"""
+        with media_budget.lock:
+            self._value = None
+            media_budget.discharge(self)
+
+    def _materialize(self, loader, sizeof):
+        value = self._value
+        if value is not None:
+            media_budget.touch(self)
+            return value
+        value = loader()
+        with media_budget.lock:
+            self._value = value
+            media_budget.charge(self, sizeof(value))
+        return value
+
+    def __repr__(self):
+        return f"MediaHandle(path={self.path!r}, mime_type={self._mime_type!r}, cache_type={self.cache_type!r})"
+
+
+class LazyImageList(list):
+    """
+    图片缓存的files列表，内部保存MediaHandle，
+    按下标或迭代访问时返回PIL图片，兼容直接使用PIL图片的旧代码
+    """
+
+    def __getitem__(self, index):
+        item = super().__getitem__(index)
+        if isinstance(index, slice):
+            return [_materialize_image(i) for i in item]
+        return _materialize_image(item)
+
+    def __iter__(self):
+        for item in super().__iter__():
+            yield _materialize_image(item)
+
+    def handles(self):
+        """返回未解码的原始条目"""
+        return list(super().__iter__())
+
+
+class LazyFileItem(dict):
+    """文档缓存条目，data字段在读取时才从文件生成，其余字段与旧格式一致"""
+
+    def __init__(self, path, mime_type, cache_type="file", **kwargs):
+        super().__init__(path=path, mime_type=mime_type, **kwargs)
+        self.handle = MediaHandle(path, mime_type, cache_type)
+
+    def __getitem__(self, key):
+        if key == "data" and not super().__contains__("data"):
+            return self.handle.data()
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        return key == "data" or super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key == "data" and not super().__contains__("data"):
+            try:
+                return self.handle.data()
+            except Exception as e:
+                logger.warning(f"[MediaCache] failed to load {self.handle.path}: {e}")
+                return default
+        return super().get(key, default)
+
+    def read_bytes(self):
+        return self.handle.read_bytes()
+
+
+def image_cache_entry(paths, cache_type="image"):
+    """构建图片缓存条目，格式与旧的 {"path": [...], "files": [...]} 一致"""
+    paths = list(paths)
+    return {
+        "path": paths,
+        "files": LazyImageList(MediaHandle(path, cache_type=cache_type) for path in paths),
+    }
+
+
+def raw_media_items(files):
+    """返回缓存files中的原始条目(MediaHandle或旧的PIL图片等)，不触发解码"""
+    if isinstance(files, LazyImageList):
+        return files.handles()
+    return list(files or [])
+
+
+def get_image_mime_type(image_file):
+    """MediaHandle按文件内容判断，PIL图片按类型判断"""
+    if isinstance(image_file, MediaHandle):
+        return image_file.mime_type
+    if type(image_file).__name__ == "PngImageFile":
+        return "image/png"
+    return "image/jpeg"
+
+
+def _materialize_image(item):
+    return item.image() if isinstance(item, MediaHandle) else item
+
+
+def _load_image(image_module, path):
+    img = image_module.open(path)
+    img.load()  # 读入像素并关闭文件句柄
+    return img
+
+
+def _read_docx_text(path):
+    import docx
+
+    doc = docx.Document(path)
+    return "\n".join(paragraph.text for paragraph in doc.paragraphs)
+
+
+def _read_text(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as file:
+        return file.read()
+
+
+def _guess_mime_type(path):
+    mime_type, _ = mimetypes.guess_type(path)
+    if mime_type:
+        return mime_type
+    # 飞书下载的图片没有后缀，读取文件头判断格式
+    try:
+        from PIL import Image
+
+        with Image.open(path) as img:
+            if img.format:
+                return Image.MIME.get(img.format, f"image/{img.format.lower()}")
+    except Exception:
+        pass
+    return "application/octet-stream"
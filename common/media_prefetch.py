@@ -0,0 +1,85 @@
+"""
+媒体预取：通道收到消息后把下载引用媒体、上传对象存储等阻塞I/O交给专用线程池并行执行，
+事件回调只提交任务就返回；context中对应字段先保存Future，处理消息时真正用到文件才通过resolve_media等待结果。
+用法：
+    context["quoted_image_path"] = media_prefetcher().submit(cmsg.get_quoted_image_path)
+    ...
+    quoted_image_path = resolve_media(context, "quoted_image_path")   # 下载未完成时在这里等待
+"""
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from common.log import logger
+from config import conf
+
+DEFAULT_PREFETCH_WORKERS = 8
+DEFAULT_PREFETCH_TIMEOUT = 300
+
+
+class MediaPrefetcher:
+    def __init__(self, max_workers=DEFAULT_PREFETCH_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max(int(max_workers), 1), thread_name_prefix="media-io")
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        return self.executor.submit(func, *args, **kwargs)
+
+    def then(self, future: Future, func) -> Future:
+        """future完成后再把func(结果)提交到线程池，如下载完成后再上传；用回调衔接，不占用线程等待"""
+        chained = Future()
+
+        def run(value):
+            try:
+                chained.set_result(func(value))
+            except Exception as e:
+                chained.set_exception(e)
+
+        def start(done):
+            try:
+                value = done.result()
+            except Exception as e:
+                chained.set_exception(e)
+                return
+            self.executor.submit(run, value)
+
+        future.add_done_callback(start)
+        return chained
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def media_prefetcher() -> MediaPrefetcher:
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = MediaPrefetcher(conf().get("media_prefetch_workers", DEFAULT_PREFETCH_WORKERS))
+    return _prefetcher
+
+
+def resolve(value, timeout=None):
+    """value为Future时等待并返回结果，失败或超时返回None；其他值原样返回"""
+    if not isinstance(value, Future):
+        return value
+    if timeout is None:
+        timeout = conf().get("media_prefetch_timeout", DEFAULT_PREFETCH_TIMEOUT)
+    try:
+        return value.result(timeout=timeout)
+    except Exception as e:
+        logger.warning(f"[MediaPrefetch] prefetch failed: {e!r}")
+        return None
+
+
+def resolve_media(context, key, timeout=None):
+    """读取context中可能尚未完成的媒体字段，完成后把结果写回context，之后的读取不再等待"""
+    value = context.get(key)
+    if not isinstance(value, Future):
+        return value
+    value = resolve(value, timeout)
+    if value:
+        context[key] = value
+    else:
+        del context[key]
+    return value
@@ -7,3 +7,21 @@ USER_VIDEO_CACHE = ExpiredDict(60 * 10)
 USER_QUOTED_IMAGE_CACHE = ExpiredDict(60 * 5)
 USER_QUOTED_FILE_CACHE = ExpiredDict(60 * 10)
 USER_QUOTED_VIDEO_CACHE = ExpiredDict(60 * 5)
+
+
+def media_cache_stats():
+    """各缓存的条目数，以及已解码媒体内容按缓存类型统计的字节数"""
+    from common.media_cache import media_budget
+
+    caches = {
+        "image": USER_IMAGE_CACHE,
+        "file": USER_FILE_CACHE,
+        "video": USER_VIDEO_CACHE,
+        "quoted_image": USER_QUOTED_IMAGE_CACHE,
+        "quoted_file": USER_QUOTED_FILE_CACHE,
+        "quoted_video": USER_QUOTED_VIDEO_CACHE,
+    }
+    return {
+        "caches": {name: cache.stats() for name, cache in caches.items()},
+        "decoded": media_budget.stats(),
+    }
@@ -1,73 +1,66 @@
 """聊天窗口中的模型状态"""
 
+from common.shared_state import SharedStateMap
 from config import conf
 
 class UserModelState:
     def __init__(self):
-        self._model_states = {}
+        # 多worker部署时保存在共享状态中，修改后需要save
+        self._model_states = SharedStateMap("model_state", self.__default_state__)
+
+    def __default_state__(self):
+        return {
+            'model': conf().get('model'),
+            'text_to_image': conf().get('text_to_image'),
+            'image_mode': conf().get('image_mode', 'Generation'),
+            'image_size': conf().get('image_create_size', '1k'),
+            'image_quality': conf().get('image_create_quality', 'low'),
+            'text_to_voice': conf().get('text_to_voice'),
+            'text_to_video': conf().get('text_to_video'),
+            'video_mode': conf().get('video_mode', 'FirstLast')
+        }
     
     def __get_model_state__(self, user_id):
         """获取用户模型状态,如果不存在则创建新的"""
-        if user_id not in self._model_states:
-            self._model_states[user_id] = {
-                'model': conf().get('model'),
-                'text_to_image': conf().get('text_to_image'),
-                'image_mode': conf().get('image_mode', 'Generation'),
-                'image_size': conf().get('image_create_size', '1k'),
-                'image_quality': conf().get('image_create_quality', 'low'),
-                'text_to_voice': conf().get('text_to_voice'),
-                'text_to_video': conf().get('text_to_video'),
-                'video_mode': conf().get('video_mode', 'FirstLast')
-            }
-        return self._model_states[user_id]
+        return self._model_states.load(user_id)
+
+    def __set_model_state__(self, user_id, key, value):
+        state = self.__get_model_state__(user_id)
+        state[key] = value
+        self._model_states.save(user_id, state)
+        return state[key]
     
     def toggle_basic_model(self, user_id, model):
         """切换用户的基础模型"""
-        state = self.__get_model_state__(user_id)
-        state['model'] = model
-        return state['model']
+        return self.__set_model_state__(user_id, 'model', model)
     
     def toggle_image_model(self, user_id, image_model):
         """切换用户的图像模型"""
-        state = self.__get_model_state__(user_id)
-        state['text_to_image'] = image_model
-        return state['text_to_image']
+        return self.__set_model_state__(user_id, 'text_to_image', image_model)
 
     def toggle_image_mode(self, user_id, image_mode):
         """切换用户的出图模式"""
-        state = self.__get_model_state__(user_id)
-        state['image_mode'] = image_mode
-        return state['image_mode']
+        return self.__set_model_state__(user_id, 'image_mode', image_mode)
 
     def toggle_image_size(self, user_id, image_size):
         """切换用户的图片尺寸状态"""
-        state = self.__get_model_state__(user_id)
-        state['image_size'] = image_size
-        return state['image_size']
+        return self.__set_model_state__(user_id, 'image_size', image_size)
 
     def toggle_image_quality(self, user_id, image_quality):
         """切换用户的图片质量状态"""
-        state = self.__get_model_state__(user_id)
-        state['image_quality'] = image_quality
-        return state['image_quality']
+        return self.__set_model_state__(user_id, 'image_quality', image_quality)
     
     def toggle_voice_model(self, user_id, voice_model):
         """切换用户的语音模型"""
-        state = self.__get_model_state__(user_id)
-        state['text_to_voice'] = voice_model
-        return state['text_to_voice']
+        return self.__set_model_state__(user_id, 'text_to_voice', voice_model)
     
     def toggle_video_model(self, user_id, video_model):
         """切换用户的视频模型"""
-        state = self.__get_model_state__(user_id)
-        state['text_to_video'] = video_model
-        return state['text_to_video']
+        return self.__set_model_state__(user_id, 'text_to_video', video_model)
 
     def toggle_video_mode(self, user_id, video_mode):
         """切换用户的视频模式状态"""
-        state = self.__get_model_state__(user_id)
-        state['video_mode'] = video_mode
-        return state['video_mode']
+        return self.__set_model_state__(user_id, 'video_mode', video_mode)
 
     def get_basic_state(self, user_id):
         """获取用户基础模型状态"""
@@ -103,8 +96,7 @@ class UserModelState:
     
     def clear_model_state(self, user_id):
         """清除用户状态"""
-        if user_id in self._model_states:
-            del self._model_states[user_id]
+        self._model_states.delete(user_id)
 
 # 创建全局实例
 model_state = UserModelState()
@@ -0,0 +1,150 @@
+import threading
+import time
+from collections import deque
+
+
+class _SessionState:
+    __slots__ = ("queue", "running", "limit")
+
+    def __init__(self, limit):
+        self.queue = deque()  # 该会话待处理的消息
+        self.running = 0  # 该会话正在处理中的消息数
+        self.limit = max(int(limit or 1), 1)  # 该会话最多同时处理的消息数
+
+
+class SessionScheduler:
+    """
+    按会话调度消息的就绪队列。
+    只有"有待处理消息且未达到并发上限"的会话才会进入就绪队列，消费者通过条件变量阻塞等待，
+    不再需要定时轮询所有会话。
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.sessions = {}  # session_id -> _SessionState
+        self.ready = deque()  # 就绪的session_id，按进入顺序轮流调度
+        self._ready_set = set()
+
+    def put(self, session_id, item, left=False, limit=1):
+        """
+        放入一条消息
+        - left: 为True时插到队首，优先处理
+        - limit: 会话首次创建时使用的并发上限
+        """
+        with self.cond:
+            state = self.sessions.get(session_id)
+            if state is None:
+                state = self.sessions[session_id] = _SessionState(limit)
+            if left:
+                state.queue.appendleft(item)
+            else:
+                state.queue.append(item)
+            self._mark_ready(session_id, state)
+
+    def get(self, timeout=None):
+        """
+        阻塞获取下一条可以处理的消息，返回(session_id, item)，超时返回None
+        取出后该会话的处理数加一，处理完毕必须调用task_done
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                while not self.ready:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return None
+                    self.cond.wait(remaining)
+                session_id = self.ready.popleft()
+                self._ready_set.discard(session_id)
+                state = self.sessions.get(session_id)
+                if state is None or not state.queue or state.running >= state.limit:
+                    continue
+                item = state.queue.popleft()
+                state.running += 1
+                self._mark_ready(session_id, state)
+                return session_id, item
+
+    def task_done(self, session_id):
+        """一条消息处理完毕，释放会话的并发名额；会话没有剩余消息时清理掉"""
+        with self.cond:
+            state = self.sessions.get(session_id)
+            if state is None:
+                return
+            state.running = max(state.running - 1, 0)
+            if state.queue:
+                self._mark_ready(session_id, state)
+            elif state.running == 0:
+                del self.sessions[session_id]
+
+    def cancel(self, session_id):
+        """丢弃会话中排队的消息，正在处理的不受影响，返回丢弃的数量"""
+        with self.cond:
+            state = self.sessions.get(session_id)
+            if state is None:
+                return 0
+            cnt = len(state.queue)
+            state.queue.clear()
+            if state.running == 0:
+                del self.sessions[session_id]
+            return cnt
+
+    def cancel_all(self):
+        """丢弃所有会话中排队的消息，返回{session_id: 丢弃的数量}"""
+        with self.cond:
+            session_ids = list(self.sessions.keys())
+        return {session_id: self.cancel(session_id) for session_id in session_ids}
+
+    def qsize(self, session_id=None):
+        with self.cond:
+            if session_id is not None:
+                state = self.sessions.get(session_id)
+                return len(state.queue) if state else 0
+            return sum(len(state.queue) for state in self.sessions.values())
+
+    def __contains__(self, session_id):
+        with self.cond:
+            return session_id in self.sessions
+
+    def _mark_ready(self, session_id, state):
+        # 调用方需持有self.cond
+        if session_id in self._ready_set or not state.queue or state.running >= state.limit:
+            return
+        self.ready.append(session_id)
+        self._ready_set.add(session_id)
+        self.cond.notify()
+
+
+if __name__ == "__main__":
+    # 基准测试：10k个会话各投递一条消息，统计从入队到被调度出队的延迟
+    session_count = 10000
+    worker_count = 16
+    scheduler = SessionScheduler()
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def worker():
+        while len(latencies) < session_count:
+            got = scheduler.get(timeout=0.1)
+            if got is None:
+                continue
+            session_id, enqueue_time = got
+            latency = time.perf_counter() - enqueue_time
+            with latencies_lock:
+                latencies.append(latency)
+            scheduler.task_done(session_id)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(worker_count)]
+    for t in threads:
+        t.start()
+    start = time.perf_counter()
+    for i in range(session_count):
+        scheduler.put(f"session-{i}", time.perf_counter(), left=(i % 100 == 0))
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"sessions={session_count}, dispatched={len(latencies)}, elapsed={elapsed:.3f}s")
+    print(f"enqueue-to-dispatch p50={p50:.3f}ms, p99={p99:.3f}ms")
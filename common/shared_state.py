@@ -0,0 +1,509 @@
+"""
+跨进程共享状态：gunicorn多worker部署飞书webhook时，事件去重、用户的模型/工具开关需要所有worker可见。
+会话的媒体缓存、对话上下文等保存对象的状态不共享，而是由common.worker_affinity把同一会话固定交给一个worker处理。
+
+后端由shared_state_backend选择：
+    memory  进程内字典(默认，单进程部署，行为与原来一致)
+    sqlite  本机多进程共享的SQLite文件(WAL + mmap)，路径为shared_state_path，默认在数据目录下
+    redis   Redis兼容协议(RESP)，地址为shared_state_url，如 redis://:password@127.0.0.1:6379/0；
+            RespServer是一个进程内的替身服务，可在本地调试、测试时代替Redis
+接口(值均为字符串，调用方自行JSON编码)：
+    get(key) / set(key, value, ttl=None) / delete(key)
+    set_if_absent(key, value, ttl) -> bool   键不存在(或已过期)时写入，用于去重、占用槽位
+    keys(prefix) -> list                     前缀匹配的未过期键
+    push(queue, value) / pop(queue, timeout) -> value | None
+"""
+
+import json
+import os
+import re
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import unquote, urlparse
+
+from common.log import logger
+from config import conf, get_appdata_dir
+
+SQLITE_FILE_NAME = "shared_state.db"
+SQLITE_MMAP_SIZE = 64 * 1024 * 1024
+SQLITE_SWEEP_EVERY = 1000  # 每写入多少次清理一次过期键
+POP_POLL_INTERVAL = (0.02, 0.5)  # SQLite没有阻塞读取，pop按指数退避轮询
+
+
+class MemoryBackend:
+    """进程内后端，也是RespServer的存储"""
+
+    local = True
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at或None)
+        self._queues = defaultdict(deque)
+        self._cond = threading.Condition()
+        self._sweep_at = 1024
+
+    def _alive(self, key, now):
+        item = self._data.get(key)
+        if item is not None and item[1] is not None and item[1] <= now:
+            del self._data[key]
+            return None
+        return item
+
+    def _sweep(self, now):
+        if len(self._data) < self._sweep_at:
+            return
+        for key in [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[key]
+        self._sweep_at = max(1024, len(self._data) * 2)
+
+    def get(self, key):
+        with self._cond:
+            item = self._alive(key, time.time())
+            return item[0] if item else None
+
+    def set(self, key, value, ttl=None):
+        with self._cond:
+            now = time.time()
+            self._sweep(now)
+            self._data[key] = (value, now + ttl if ttl else None)
+
+    def set_if_absent(self, key, value, ttl=None):
+        with self._cond:
+            now = time.time()
+            if self._alive(key, now) is not None:
+                return False
+            self._sweep(now)
+            self._data[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._cond:
+            return self._data.pop(key, None) is not None
+
+    def keys(self, prefix=""):
+        with self._cond:
+            now = time.time()
+            return [key for key in list(self._data) if key.startswith(prefix) and self._alive(key, now)]
+
+    def push(self, queue, value):
+        with self._cond:
+            self._queues[queue].append(value)
+            self._cond.notify_all()
+
+    def pop(self, queue, timeout=None):
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while not self._queues.get(queue):
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self._queues[queue].popleft()
+
+    def flush(self):
+        with self._cond:
+            self._data.clear()
+            self._queues.clear()
+
+
+class SQLiteBackend:
+    """同一台机器上多个进程共享的SQLite文件；每个线程一个连接，fork后自动重连"""
+
+    local = False
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, value TEXT)")
+            conn.execute("CREATE INDEX IF NOT EXISTS queue_name ON queue (name, id)")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _after_write(self, conn, now):
+        self._writes += 1
+        if self._writes % SQLITE_SWEEP_EVERY == 0:
+            conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)", (key, value, now + ttl if ttl else None))
+        self._after_write(conn, now)
+
+    def set_if_absent(self, key, value, ttl=None):
+        conn = self._conn()
+        now = time.time()
+        # 键已过期时覆盖写入，否则不修改；rowcount为0说明键仍然有效
+        cursor = conn.execute(
+            "INSERT INTO kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+            "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+            (key, value, now + ttl if ttl else None, now),
+        )
+        self._after_write(conn, now)
+        return cursor.rowcount > 0
+
+    def delete(self, key):
+        return self._conn().execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount > 0
+
+    def keys(self, prefix=""):
+        rows = self._conn().execute(
+            "SELECT key FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + "\U0010ffff", time.time()),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def push(self, queue, value):
+        self._conn().execute("INSERT INTO queue (name, value) VALUES (?, ?)", (queue, value))
+
+    def _pop_once(self, conn, queue):
+        # 先用只读查询判断队列是否为空，空队列轮询时不占用写锁
+        if conn.execute("SELECT 1 FROM queue WHERE name = ? LIMIT 1", (queue,)).fetchone() is None:
+            return None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id, value FROM queue WHERE name = ? ORDER BY id LIMIT 1", (queue,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM queue WHERE id = ?", (row[0],))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row[1] if row else None
+
+    def pop(self, queue, timeout=None):
+        conn = self._conn()
+        deadline = None if timeout is None else time.time() + timeout
+        interval = POP_POLL_INTERVAL[0]
+        while True:
+            value = self._pop_once(conn, queue)
+            if value is not None:
+                return value
+            if deadline is not None and time.time() >= deadline:
+                return None
+            time.sleep(interval if deadline is None else max(min(interval, deadline - time.time()), 0))
+            interval = min(interval * 2, POP_POLL_INTERVAL[1])
+
+
+class RespError(Exception):
+    pass
+
+
+def _encode_command(args):
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(f"${len(data)}\r\n".encode())
+        parts.append(data)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+def _read_reply(file):
+    line = file.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload.decode("utf-8")
+    if kind == b"-":
+        raise RespError(payload.decode("utf-8"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = file.read(length + 2)[:-2]
+        return data.decode("utf-8")
+    if kind == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [_read_reply(file) for _ in range(length)]
+    raise RespError(f"unknown reply: {line!r}")
+
+
+def _escape_glob(prefix):
+    return "".join("\\" + c if c in "*?[]\\" else c for c in prefix)
+
+
+class RedisBackend:
+    """Redis兼容协议的最小客户端，只用到GET/SET/DEL/KEYS/RPUSH/BLPOP；每个线程一个连接，阻塞的BLPOP不影响其他线程"""
+
+    local = False
+
+    def __init__(self, url, connect_timeout=5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        file = sock.makefile("rb")
+        self._local.conn = (os.getpid(), sock, file)
+        if self.password:
+            self._send(("AUTH", self.password))
+        if self.db:
+            self._send(("SELECT", self.db))
+        return self._local.conn
+
+    def _send(self, args):
+        _, sock, file = self._local.conn
+        sock.sendall(_encode_command(args))
+        return _read_reply(file)
+
+    def command(self, *args):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or conn[0] != os.getpid():
+            self._connect()
+        try:
+            return self._send(args)
+        except (OSError, ConnectionError):
+            # 连接断开后重连重试一次
+            self._local.conn[1].close()
+            self._connect()
+            return self._send(args)
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self.command("SET", key, value)
+
+    def set_if_absent(self, key, value, ttl=None):
+        if ttl:
+            return self.command("SET", key, value, "PX", int(ttl * 1000), "NX") is not None
+        return self.command("SET", key, value, "NX") is not None
+
+    def delete(self, key):
+        return self.command("DEL", key) > 0
+
+    def keys(self, prefix=""):
+        return self.command("KEYS", _escape_glob(prefix) + "*")
+
+    def push(self, queue, value):
+        self.command("RPUSH", queue, value)
+
+    def pop(self, queue, timeout=None):
+        reply = self.command("BLPOP", queue, 0 if timeout is None else max(timeout, 0.01))
+        return reply[1] if reply else None
+
+
+class _Status(str):
+    """RESP简单字符串回复(+OK)，与批量字符串回复区分"""
+
+
+_OK = _Status("OK")
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """Redis兼容协议的进程内替身：用MemoryBackend实现RedisBackend用到的命令，供本地调试和测试代替Redis
+        server = RespServer(("127.0.0.1", 0)); server.start()
+        backend = RedisBackend(f"redis://127.0.0.1:{server.server_address[1]}")
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, backend=None):
+        self.backend = backend or MemoryBackend()
+        super().__init__(address, _RespHandler)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="resp-server", daemon=True).start()
+        return self
+
+    def execute(self, args):
+        backend = self.backend
+        name = args[0].upper()
+        if name == "PING":
+            return _Status("PONG")
+        if name in ("AUTH", "SELECT"):
+            return _OK
+        if name == "GET":
+            return backend.get(args[1])
+        if name == "SET":
+            key, value, options = args[1], args[2], [option.upper() for option in args[3:]]
+            ttl = None
+            if "PX" in options:
+                ttl = int(args[3 + options.index("PX") + 1]) / 1000
+            elif "EX" in options:
+                ttl = int(args[3 + options.index("EX") + 1])
+            if "NX" in options:
+                return _OK if backend.set_if_absent(key, value, ttl) else None
+            backend.set(key, value, ttl)
+            return _OK
+        if name == "DEL":
+            return sum(backend.delete(key) for key in args[1:])
+        if name == "KEYS":
+            pattern = args[1]
+            if not pattern.endswith("*"):
+                raise RespError("ERR only prefix patterns are supported")
+            return backend.keys(re.sub(r"\\(.)", r"\1", pattern[:-1]))
+        if name == "RPUSH":
+            for value in args[2:]:
+                backend.push(args[1], value)
+            return len(args) - 2
+        if name == "BLPOP":
+            timeout = float(args[-1])
+            value = backend.pop(args[1], None if timeout == 0 else timeout)
+            return None if value is None else [args[1], value]
+        if name == "FLUSHDB":
+            backend.flush()
+            return _OK
+        raise RespError(f"ERR unknown command '{name}'")
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                args = _read_reply(self.rfile)
+            except (ConnectionError, OSError):
+                return
+            try:
+                reply = self.server.execute(args)
+            except RespError as e:
+                self.wfile.write(f"-{e}\r\n".encode())
+                continue
+            self.wfile.write(_encode_reply(reply))
+
+
+def _encode_reply(reply):
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b"".join(_encode_reply(item) for item in reply)
+    if isinstance(reply, _Status):
+        return f"+{reply}\r\n".encode()
+    data = reply.encode("utf-8")
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+class SharedStateMap:
+    """按用户保存的小字典状态(如模型、工具开关)：进程内后端直接保存字典对象，共享后端以JSON保存，修改后需调用save"""
+
+    def __init__(self, namespace, factory):
+        self.namespace = namespace
+        self.factory = factory
+        self._states = {}
+
+    def load(self, user_id):
+        backend = shared_state()
+        if backend.local:
+            state = self._states.get(user_id)
+            if state is None:
+                state = self._states[user_id] = self.factory()
+            return state
+        value = backend.get(f"{self.namespace}:{user_id}")
+        return json.loads(value) if value else self.factory()
+
+    def save(self, user_id, state):
+        backend = shared_state()
+        if not backend.local:
+            backend.set(f"{self.namespace}:{user_id}", json.dumps(state, ensure_ascii=False))
+
+    def delete(self, user_id):
+        self._states.pop(user_id, None)
+        backend = shared_state()
+        if not backend.local:
+            backend.delete(f"{self.namespace}:{user_id}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name=None):
+    name = str(name or conf().get("shared_state_backend", "memory") or "memory").strip().lower()
+    if name == "sqlite":
+        path = conf().get("shared_state_path") or os.path.join(get_appdata_dir(), SQLITE_FILE_NAME)
+        return SQLiteBackend(path)
+    if name == "redis":
+        return RedisBackend(conf().get("shared_state_url") or "redis://127.0.0.1:6379/0")
+    if name != "memory":
+        logger.warning(f"[SharedState] unknown shared_state_backend: {name}, use memory")
+    return MemoryBackend()
+
+
+def shared_state():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend()
+                logger.info(f"[SharedState] backend={type(_backend).__name__}")
+    return _backend
+
+
+if __name__ == "__main__":
+    # 自检和微基准(python -m common.shared_state)：三种后端跑同一组用例，并比较去重、读写的单次耗时
+    import tempfile
+
+    server = RespServer(("127.0.0.1", 0)).start()
+    backends = {
+        "memory": MemoryBackend(),
+        "sqlite": SQLiteBackend(os.path.join(tempfile.mkdtemp(), SQLITE_FILE_NAME)),
+        "resp": RedisBackend(f"redis://127.0.0.1:{server.server_address[1]}"),
+    }
+    for name, backend in backends.items():
+        assert backend.set_if_absent("event:1", "a", ttl=0.2)
+        assert not backend.set_if_absent("event:1", "b", ttl=0.2)
+        assert backend.get("event:1") == "a"
+        time.sleep(0.25)
+        assert backend.get("event:1") is None
+        assert backend.set_if_absent("event:1", "c", ttl=10)
+        backend.set("state:u*1", json.dumps({"model": "gemini"}))
+        assert json.loads(backend.get("state:u*1")) == {"model": "gemini"}
+        assert backend.keys("state:u*") == ["state:u*1"]
+        assert backend.delete("state:u*1") and backend.get("state:u*1") is None
+        backend.push("queue", "1")
+        backend.push("queue", "2")
+        assert backend.pop("queue", 1) == "1" and backend.pop("queue", 1) == "2"
+        assert backend.pop("queue", 0.1) is None
+        threading.Timer(0.1, backend.push, ("queue", "late")).start()
+        assert backend.pop("queue", 2) == "late"
+
+        rounds = 2000
+        start = time.perf_counter()
+        for i in range(rounds):
+            backend.set_if_absent(f"bench:{i}", "1", ttl=60)
+        dedupe = (time.perf_counter() - start) / rounds
+        start = time.perf_counter()
+        for i in range(rounds):
+            backend.get(f"bench:{i}")
+        read = (time.perf_counter() - start) / rounds
+        print(f"{name:<7} set_if_absent={dedupe * 1e6:7.1f}us get={read * 1e6:7.1f}us")
+    server.shutdown()
@@ -0,0 +1,166 @@
+"""
+流式回复的合并渲染：把模型逐块返回的文本合并成少量的消息编辑，与具体通道无关。
+通道只负责把渲染结果发出去：
+    renderer = StreamRenderer(chat_id, max_chars=4096)
+    for chunk in generator:
+        renderer.feed(chunk)
+        for segment in renderer.take_segments():   # 已写满一条消息的文本，作为完整消息发出
+            send_message(segment)
+        if renderer.should_flush():                # 满足时间窗口、增量和频率限制时更新一次
+            edit_message(renderer.pending_text())
+            renderer.mark_flushed()
+    for segment in renderer.finish():              # 剩余文本
+        send_message(segment)
+"""
+
+import threading
+import time
+from collections import deque
+
+from common.log import logger
+from config import conf
+
+DEFAULT_UPDATE_INTERVAL = 0.8  # 两次更新之间至少间隔的秒数
+DEFAULT_MIN_DELTA_CHARS = 40  # 新增文本少于该字数时暂不更新
+DEFAULT_MAX_UPDATES_PER_SECOND = 1  # 每个会话每秒最多更新次数
+
+
+class ChatRateLimiter:
+    """按会话限制每秒的更新次数，同一会话的多个流式回复共享额度"""
+
+    def __init__(self, window=1.0):
+        self.window = window
+        self.lock = threading.Lock()
+        self.history = {}  # chat_id -> deque(最近一个窗口内的更新时间)
+
+    def allow(self, chat_id, limit):
+        """额度未用完时记一次更新并返回True"""
+        if not limit or limit <= 0:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            timestamps = self.history.get(chat_id)
+            if timestamps is None:
+                timestamps = self.history[chat_id] = deque()
+            while timestamps and now - timestamps[0] >= self.window:
+                timestamps.popleft()
+            if len(timestamps) >= limit:
+                return False
+            timestamps.append(now)
+            # 顺带清理长时间没有更新的会话
+            if len(self.history) > 1024:
+                for key in [k for k, v in self.history.items() if not v or now - v[-1] >= self.window]:
+                    del self.history[key]
+            return True
+
+
+chat_rate_limiter = ChatRateLimiter()
+
+
+class StreamRenderer:
+    def __init__(self, chat_id, max_chars=4096, update_interval=None, min_delta_chars=None,
+                 max_updates_per_second=None, rate_limiter=None):
+        """
+        :param chat_id: 频率限制按该值区分会话
+        :param max_chars: 单条消息的最大字数，超出后拆成续写消息
+        """
+        self.chat_id = chat_id
+        self.max_chars = max_chars
+        self.update_interval = update_interval if update_interval is not None else conf().get("stream_update_interval", DEFAULT_UPDATE_INTERVAL)
+        self.min_delta_chars = min_delta_chars if min_delta_chars is not None else conf().get("stream_min_delta_chars", DEFAULT_MIN_DELTA_CHARS)
+        self.max_updates_per_second = max_updates_per_second if max_updates_per_second is not None else conf().get(
+            "stream_max_updates_per_second", DEFAULT_MAX_UPDATES_PER_SECOND
+        )
+        self.rate_limiter = rate_limiter or chat_rate_limiter
+        self.buffer = ""  # 当前这条消息的文本
+        self.segments = []  # 已写满、等待通道发出的文本
+        self.flushed_len = 0  # 上次更新时buffer的长度
+        self.last_flush = 0.0
+        self.started_at = time.monotonic()
+        self.first_flush_at = None
+        self.chunks_in = 0
+        self.chars_in = 0
+        self.edits_out = 0
+        self.messages_out = 0
+        self.finished = False
+
+    def feed(self, text):
+        """追加一块模型输出"""
+        if not text:
+            return
+        self.chunks_in += 1
+        self.chars_in += len(text)
+        self.buffer += text
+        while self.max_chars and len(self.buffer) > self.max_chars:
+            cut = self._find_cut(self.buffer)
+            self.segments.append(self.buffer[:cut])
+            self.buffer = self.buffer[cut:].lstrip("\n")
+            self.flushed_len = 0
+
+    def take_segments(self):
+        """取出已写满一条消息的文本，通道应将其作为完整消息发出"""
+        segments, self.segments = self.segments, []
+        self.messages_out += len(segments)
+        return segments
+
+    def should_flush(self, now=None):
+        """是否应该更新一次正在输出的消息"""
+        delta = len(self.buffer) - self.flushed_len
+        if delta <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+        elapsed = now - self.last_flush
+        if elapsed < self.update_interval:
+            return False
+        # 增量太小时多等一个时间窗口，避免一个字一个字地刷新
+        if delta < self.min_delta_chars and elapsed < self.update_interval * 2:
+            return False
+        return self.rate_limiter.allow(self.chat_id, self.max_updates_per_second)
+
+    def pending_text(self):
+        return self.buffer
+
+    def mark_flushed(self):
+        now = time.monotonic()
+        if self.first_flush_at is None:
+            self.first_flush_at = now
+        self.flushed_len = len(self.buffer)
+        self.last_flush = now
+        self.edits_out += 1
+
+    def finish(self):
+        """流结束，返回剩余需要作为完整消息发出的文本"""
+        self.finished = True
+        if self.buffer:
+            self.segments.append(self.buffer)
+            self.buffer = ""
+        return self.take_segments()
+
+    def stats(self):
+        return {
+            "chunks_in": self.chunks_in,
+            "chars_in": self.chars_in,
+            "edits_out": self.edits_out,
+            "messages_out": self.messages_out,
+            "first_flush": None if self.first_flush_at is None else round(self.first_flush_at - self.started_at, 3),
+            "elapsed": round(time.monotonic() - self.started_at, 3),
+        }
+
+    def log_stats(self, channel):
+        stats = self.stats()
+        logger.info(
+            f"{channel} stream rendered, chat_id={self.chat_id}, chunks_in={stats['chunks_in']}, "
+            f"edits_out={stats['edits_out']}, messages_out={stats['messages_out']}, chars={stats['chars_in']}, "
+            f"first_flush={stats['first_flush']}s, elapsed={stats['elapsed']}s"
+        )
+
+    def _find_cut(self, text):
+        # 优先在换行处拆分，避免拆开HTML标签
+        limit = self.max_chars
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut < limit // 2:
+            cut = limit
+        open_tag = text.rfind("<", 0, cut)
+        if open_tag > text.rfind(">", 0, cut) and open_tag > 0:
+            cut = open_tag
+        return cut
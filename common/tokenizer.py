@@ -0,0 +1,92 @@
+"""
+进程内共享的tiktoken编码注册表。
+- 每个模型的编码只加载一次，首次使用时才加载(可能需要联网下载BPE文件)
+- 文本token数按(编码, 文本hash)缓存，重复出现的人设、角色描述等不必每轮重新编码
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from common.log import logger
+from config import conf
+
+DEFAULT_TOKEN_CACHE_SIZE = 4096
+TOKEN_CACHE_MIN_CHARS = 64  # 短文本直接编码，不进缓存
+
+_lock = threading.Lock()
+_encodings = {}  # model或编码名 -> Encoding
+_token_counts = OrderedDict()  # (编码名, 特殊token规则, hash(text), len(text)) -> token数
+_stats = {"hits": 0, "misses": 0}
+
+
+def get_encoding(name):
+    """按编码名获取编码，如cl100k_base"""
+    key = ("encoding", name)
+    encoding = _encodings.get(key)
+    if encoding is None:
+        import tiktoken
+
+        encoding = _load(key, lambda: tiktoken.get_encoding(name))
+    return encoding
+
+
+def get_encoding_for_model(model, default="cl100k_base"):
+    """按模型名获取编码，tiktoken不认识的模型使用default编码，default为None时抛出KeyError"""
+    key = ("model", model)
+    encoding = _encodings.get(key)
+    if encoding is None:
+        import tiktoken
+
+        def load():
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                if default is None:
+                    raise
+                logger.debug("Warning: model not found. Using {} encoding.".format(default))
+                return get_encoding(default)
+
+        encoding = _load(key, load)
+    return encoding
+
+
+def count_tokens(encoding, text, disallowed_special="all"):
+    """文本的token数，较长的文本会缓存结果"""
+    if len(text) < TOKEN_CACHE_MIN_CHARS:
+        return len(encoding.encode(text, disallowed_special=disallowed_special))
+    key = (encoding.name, disallowed_special, hash(text), len(text))
+    with _lock:
+        count = _token_counts.get(key)
+        if count is not None:
+            _token_counts.move_to_end(key)
+            _stats["hits"] += 1
+            return count
+        _stats["misses"] += 1
+    count = len(encoding.encode(text, disallowed_special=disallowed_special))
+    max_size = conf().get("tokenizer_cache_size", DEFAULT_TOKEN_CACHE_SIZE)
+    with _lock:
+        _token_counts[key] = count
+        while len(_token_counts) > max(max_size, 0):
+            _token_counts.popitem(last=False)
+    return count
+
+
+def stats():
+    with _lock:
+        return {
+            "encodings": sorted(f"{kind}:{name}" for kind, name in _encodings),
+            "cached_texts": len(_token_counts),
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+        }
+
+
+def _load(key, loader):
+    # 加载过程可能较慢，放在锁外执行；并发加载同一编码时只保留先完成的
+    start = time.monotonic()
+    encoding = loader()
+    with _lock:
+        encoding = _encodings.setdefault(key, encoding)
+    logger.debug("[Tokenizer] {} {} loaded, cost={:.3f}s".format(key[0], key[1], time.monotonic() - start))
+    return encoding
@@ -1,50 +1,47 @@
 """聊天窗口中的工具状态"""
 
+from common.shared_state import SharedStateMap
+
 class UserToolState:
     def __init__(self):
-        self._user_states = {}
+        # 多worker部署时保存在共享状态中，修改后需要save
+        self._user_states = SharedStateMap("tool_state", lambda: {
+            'searching': False,
+            'imaging': False,
+            'editing': False,
+            'printing': False,
+            'breakdowning': False
+        })
     
     def get_user_state(self, user_id):
         """获取用户工具状态,如果不存在则创建新的"""
-        if user_id not in self._user_states:
-            self._user_states[user_id] = {
-                'searching': False,
-                'imaging': False,
-                'editing': False,
-                'printing': False,
-                'breakdowning': False
-            }
-        return self._user_states[user_id]
+        return self._user_states.load(user_id)
+
+    def _toggle(self, user_id, key):
+        state = self.get_user_state(user_id)
+        state[key] = not state[key]
+        self._user_states.save(user_id, state)
+        return state[key]
     
     def toggle_searching(self, user_id):
         """切换用户的搜索状态"""
-        state = self.get_user_state(user_id)
-        state['searching'] = not state['searching']
-        return state['searching']
+        return self._toggle(user_id, 'searching')
     
     def toggle_imaging(self, user_id):
         """切换用户的图像生成状态"""
-        state = self.get_user_state(user_id)
-        state['imaging'] = not state['imaging']
-        return state['imaging']
+        return self._toggle(user_id, 'imaging')
     
     def toggle_editing(self, user_id):
         """切换用户的视频生成状态"""
-        state = self.get_user_state(user_id)
-        state['editing'] = not state['editing']
-        return state['editing']
+        return self._toggle(user_id, 'editing')
     
     def toggle_printing(self, user_id):
         """切换剧本排版状态"""
-        state = self.get_user_state(user_id)
-        state['printing'] = not state['printing']
-        return state['printing']
+        return self._toggle(user_id, 'printing')
     
     def toggle_breakdowning(self, user_id):
         """切换顺分场表状态"""
-        state = self.get_user_state(user_id)
-        state['breakdowning'] = not state['breakdowning']
-        return state['breakdowning']
+        return self._toggle(user_id, 'breakdowning')
 
     def get_search_state(self, user_id):
         """获取用户搜索状态"""
@@ -70,12 +67,12 @@ class UserToolState:
         """设置剧本排版状态"""
         state = self.get_user_state(user_id)
         state['printing'] = status
+        self._user_states.save(user_id, state)
         return state['printing']
     
     def clear_user_state(self, user_id):
         """清除用户状态"""
-        if user_id in self._user_states:
-            del self._user_states[user_id]
+        self._user_states.delete(user_id)
 
 # 创建全局实例
 tool_state = UserToolState()
\ No newline at end of file
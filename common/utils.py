@@ -1,12 +1,15 @@
 import io
 import os
-import requests, base64
+import base64
 import re
 import subprocess
 
 from urllib.parse import urlparse
 from PIL import Image
 
+from common.blob_store import resolve_url
+from common.http_client import http_client
+
 
 def fsize(file):
     if isinstance(file, io.BytesIO):
@@ -61,7 +64,7 @@ def get_path_suffix(path):
 
 def url_to_base64(url: str) -> str:
         """下载 URL 内容并转为 base64 字符串"""
-        response = requests.get(url, timeout=30)
+        response = http_client("media").get(url, timeout=30)
         response.raise_for_status()
         return base64.b64encode(response.content).decode('utf-8')
 
@@ -97,7 +100,8 @@ def get_image_urls_from_session(session_id, session_manager=None):
                 continue
             image_info = item.get("image_url", {})
             image_url = image_info.get("url")
-            if isinstance(image_url, str):
+            image_url = resolve_url(image_url) if isinstance(image_url, str) else None
+            if image_url:  # 已清理的媒体跳过
                 images.append(image_url)
     return images
 
@@ -118,7 +122,9 @@ def get_video_urls_from_session(session_id, session_manager=None, include_data_u
             if not isinstance(video_url, str):
                 continue
             if include_data_urls or video_url.startswith(("http://", "https://")):
-                videos.append(video_url)
+                video_url = resolve_url(video_url)
+                if video_url:  # 已清理的媒体跳过
+                    videos.append(video_url)
         if videos:
             return videos
     return []
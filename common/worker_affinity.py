@@ -0,0 +1,117 @@
+"""
+会话→worker亲和：gunicorn多worker部署时，同一会话的消息固定交给一个worker处理，
+会话的媒体缓存、对话上下文(common.memory、ChatChannel.sessions、SessionManager.sessions)只需留在该worker的内存中。
+
+每个worker启动时在共享状态中占用一个编号槽位(带TTL，由心跳续期)，按会话的路由键在存活的槽位上做rendezvous哈希选出所属槽位，
+worker增减时只有涉及的会话迁移。其他worker收到的消息放入所属槽位的队列，由该worker的消费线程取出处理；
+worker重启后会重新占用空出的槽位，接着处理队列中遗留的消息。
+"""
+
+import hashlib
+import os
+import socket
+import threading
+import time
+import uuid
+
+from common.log import logger
+from common.shared_state import shared_state
+
+DEFAULT_SLOT_TTL = 30  # 槽位心跳的过期秒数，worker退出后超过该时间其会话才会迁移
+MAX_SLOTS = 64
+SLOTS_CACHE_SECONDS = 1  # 存活槽位列表的缓存时间，避免每条消息都查询共享状态
+
+
+def _score(route_key, slot):
+    digest = hashlib.blake2b(f"{route_key}:{slot}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class WorkerAffinity:
+    def __init__(self, namespace, handler, backend=None, ttl=DEFAULT_SLOT_TTL, max_slots=MAX_SLOTS):
+        """handler(payload)在本worker的消费线程中处理其他worker转发来的消息"""
+        self.namespace = namespace
+        self.handler = handler
+        self.backend = backend or shared_state()
+        self.ttl = ttl
+        self.max_slots = max_slots
+        self.slot = None
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._slots = ((), 0.0)
+        self._stopped = threading.Event()
+
+    def _slot_key(self, slot):
+        return f"worker:{self.namespace}:{slot}"
+
+    def _queue_key(self, slot):
+        return f"worker-queue:{self.namespace}:{slot}"
+
+    def _claim(self):
+        for slot in range(self.max_slots):
+            if self.backend.set_if_absent(self._slot_key(slot), self.token, self.ttl):
+                return slot
+        raise RuntimeError(f"no free worker slot for {self.namespace}, max_slots={self.max_slots}")
+
+    def start(self):
+        self.slot = self._claim()
+        threading.Thread(target=self._heartbeat, name=f"{self.namespace}-affinity-heartbeat", daemon=True).start()
+        threading.Thread(target=self._consume, name=f"{self.namespace}-affinity-consumer", daemon=True).start()
+        logger.info(f"[WorkerAffinity] {self.namespace} worker slot={self.slot}, token={self.token}")
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self.slot is not None and self.backend.get(self._slot_key(self.slot)) == self.token:
+            self.backend.delete(self._slot_key(self.slot))
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.ttl / 3):
+            try:
+                key = self._slot_key(self.slot)
+                holder = self.backend.get(key)
+                if holder in (None, self.token):
+                    self.backend.set(key, self.token, self.ttl)
+                else:
+                    # 心跳中断期间槽位被其他worker占用，重新占用一个，原槽位的会话和队列归新worker
+                    self.slot = self._claim()
+                    logger.warning(f"[WorkerAffinity] {self.namespace} slot taken by {holder}, moved to slot={self.slot}")
+            except Exception as e:
+                logger.warning(f"[WorkerAffinity] {self.namespace} heartbeat failed: {e}")
+
+    def live_slots(self):
+        slots, expires_at = self._slots
+        now = time.monotonic()
+        if now >= expires_at:
+            prefix = self._slot_key("")
+            slots = {int(key[len(prefix):]) for key in self.backend.keys(prefix)}
+            slots.add(self.slot)
+            slots = tuple(sorted(slots))
+            self._slots = (slots, now + SLOTS_CACHE_SECONDS)
+        return slots
+
+    def owner(self, route_key):
+        return max(self.live_slots(), key=lambda slot: _score(route_key, slot))
+
+    def route(self, route_key, payload):
+        """返回True表示消息归本worker处理；否则已转发到所属worker的队列"""
+        owner = self.owner(route_key)
+        if owner == self.slot:
+            return True
+        self.backend.push(self._queue_key(owner), payload)
+        logger.debug(f"[WorkerAffinity] {self.namespace} route_key={route_key} forwarded to slot={owner}")
+        return False
+
+    def _consume(self):
+        while not self._stopped.is_set():
+            try:
+                payload = self.backend.pop(self._queue_key(self.slot), timeout=self.ttl / 3)
+            except Exception as e:
+                logger.warning(f"[WorkerAffinity] {self.namespace} pop failed: {e}")
+                self._stopped.wait(1)
+                continue
+            if payload is None:
+                continue
+            try:
+                self.handler(payload)
+            except Exception:
+                logger.exception(f"[WorkerAffinity] {self.namespace} handle forwarded message failed")
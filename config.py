@@ -42,6 +42,16 @@ available_setting = {
     "image_create_prefix": ["画", "看", "找"],  # 开启图片回复的前缀
     "video_create_prefix": ["//"], # 开启视频回复的前缀
     "concurrency_in_session": 1,  # 同一会话最多有多少条消息在处理中，大于1可能乱序
+    "handler_mode": "thread",  # 消息处理模式，可选 thread、asyncio。asyncio 模式下实现了 async_reply 的bot(如claude)以协程运行，其他bot在各类请求各自的线程池中执行
+    "async_executor_workers": 64,  # asyncio 模式下文字消息的线程数(异步bot只用于插件、发送等短步骤)，图片、视频、语音的线程数等于其并发上限
+    "async_concurrency": {"chat": 256, "image": 16, "video": 64, "voice": 16},  # asyncio 模式下各类请求最多同时处理的数量
+    # 消息处理通道，文字/图片/视频/语音各自使用独立线程池，workers为线程数，max_queue为最多排队数(0不限制)，排满后直接回复繁忙
+    "handler_lanes": {
+        "chat": {"workers": 16, "max_queue": 0},
+        "image": {"workers": 8, "max_queue": 32},
+        "video": {"workers": 8, "max_queue": 32},
+        "voice": {"workers": 4, "max_queue": 16},
+    },
     "image_create_size": "256x256",  # 图片大小,可选有 1k、2k、4k(seedream4.5不支持1k,seedream5仅支持2k和3k)
     "image_mode": "Generation", # 图片生成模式，可选 Generation、Editing
     "image_aspect_ratio":"16:9", # 图片长宽比例，可选有16:9、9:16、1:1、4:3、3:4、3:2、2:3、21:9、auto
@@ -56,6 +66,8 @@ available_setting = {
     # 人格描述
     "character_desc": "你是ChatGPT, 一个由OpenAI训练的大型语言模型, 你旨在回答并解决人们的任何问题，并且可以使用多种语言与人交流。",
     "conversation_max_tokens": 1000,  # 支持上下文记忆的最多字符数
+    "tokenizer_preload": False,  # 启动时在后台预先加载model对应的tiktoken编码，避免首条消息等待加载
+    "tokenizer_cache_size": 4096,  # 缓存文本token数的条目上限，重复的人设、角色描述不必每轮重新编码
     # chatgpt限流配置
     "rate_limit_chatgpt": 20,  # chatgpt的调用频率限制
     "rate_limit_dalle": 50,  # openai dalle的调用频率限制
@@ -88,6 +100,10 @@ available_setting = {
     # Google Gemini Api Key
     "gemini_api_key": "", # Free tier
     "gemini_api_key_paid": "", # Paid tier 
+    "gemini_chat_max_tokens": 128000,  # Gemini chat历史(含图片、文档)的token预算，超出后丢弃最早的轮次；conversation_max_tokens只约束文本会话
+    "gemini_max_chats": 1000,  # 同时保留的Gemini chat实例上限，超出后淘汰最久未使用的，chat实例与会话一同过期
+    "gemini_base_url": "",  # Gemini API地址，留空使用官方地址，可填写兼容的代理地址
+    "gemini_http_options": {},  # genai.Client的http_options，如 {"timeout": 600000, "api_version": "v1beta"}
     # Volcengine ARK 配置
     "ark_api_key": "",
     "ark_use_responses_api": False,  # Ark 文本/图片/视频理解是否切换到 Responses API
@@ -107,6 +123,9 @@ available_setting = {
     "always_reply_voice": False,  # 是否一直使用语音回复
     "voice_to_text": "openai",  # 语音识别引擎，支持openai,baidu,google,azure
     "voice_to_text_model": "whisper-1",
+    "voice_asr_segment_seconds": 60,  # 超过该时长的语音在静音处切分，各段并行识别后按顺序拼接
+    "voice_asr_workers": 8,  # 分段识别同时发往语音识别服务的最大请求数
+    "voice_asr_partial_reply": True,  # 开启stream时，长语音先逐段流式回复识别出的文字
     "text_to_voice": "openai",  # 语音合成引擎，支持openai,baidu,google,pytts(offline),azure,elevenlabs
     "text_to_voice_model": "tts-1",
     "tts_voice_id": "alloy",
@@ -163,6 +182,13 @@ available_setting = {
     "feishu_webhook_port": 7777, # 本地回调服务器端口
     "feishu_event_dedupe_seconds": 60 * 60 * 24,  # 飞书事件去重缓存时间，避免平台重投导致重复处理
     "feishu_event_max_age_seconds": 60 * 10,  # 飞书消息事件最大允许延迟，超过则视为旧重试丢弃
+    "feishu_async_ingest": True,  # 飞书事件回调去重后立即返回，消息在后台线程解析、入队，避免回调超时触发重投
+    "media_prefetch_workers": 8,  # 预取消息媒体(下载引用的图片/视频/文件、上传TOS)的I/O线程数
+    "media_prefetch_timeout": 300,  # 处理消息时等待媒体预取完成的最长秒数，超时按无该媒体处理
+    "feishu_worker_affinity": False,  # webhook多worker部署时按会话把消息固定交给一个worker处理，需要共享状态后端为sqlite或redis
+    "shared_state_backend": "memory",  # 跨进程共享状态(事件去重、用户模型/工具状态)后端，支持：memory、sqlite、redis
+    "shared_state_path": "",  # sqlite后端的数据库路径，默认为数据目录下的shared_state.db
+    "shared_state_url": "redis://127.0.0.1:6379/0",  # redis后端地址，兼容Redis协议的服务均可
     "media_public_base_url": "",  # 用于对外暴露 tmp 媒体文件的公网根地址，如 https://bot.example.com
     "media_store_provider": "local",  # 媒体对外访问方式，支持：local、tos
     "tos_access_key": "",  # 火山引擎 TOS Access Key
@@ -172,6 +198,22 @@ available_setting = {
     "tos_bucket": "",  # 火山引擎 TOS Bucket
     "tos_public_base_url": "",  # TOS 对外访问域名，如 https://bucket.tos-cn-beijing.volces.com
     "tos_prefix": "bigchao/tmp_media/",  # TOS 对象前缀
+    "http_timeout": [5, 60],  # 共享HTTP客户端的默认超时(连接, 读取)，单位秒
+    "http_pool_connections": 16,  # 共享HTTP客户端每个服务商缓存的主机连接池数量
+    "http_pool_maxsize": 32,  # 共享HTTP客户端每个主机保持的最大长连接数
+    "http_retry_policies": {},  # 按服务商覆盖重试策略，如 {"kling": {"total": 5, "backoff_factor": 1, "status": [429, 503], "methods": ["GET"]}}
+    "media_cache_max_bytes": 256 * 1024 * 1024,  # 缓存中已解码图片/文档内容的总字节上限，超出后按LRU释放，使用时再从磁盘读取
+    "blob_store_memory_bytes": 64 * 1024 * 1024,  # 会话媒体(按内容哈希存储在tmp/blobs)在内存中缓存的字节上限
+    "blob_store_max_age": 24 * 3600,  # tmp/blobs中超过该秒数未使用、且不再被会话引用的媒体文件定期删除，不小于expires_in_seconds
+    "blob_store_disk_bytes": 1024 * 1024 * 1024,  # tmp/blobs的总字节上限，超出后从最久未使用、且不再被会话引用的文件开始删除
+    "async_job_polling": True,  # 图片/视频生成任务提交后交给后台统一轮询，处理线程立即返回，完成后再回复
+    "job_poller_workers": 4,  # 后台轮询查询状态、发送结果的线程数
+    "job_poll_policies": {},  # 按服务商覆盖轮询策略，如 {"kling_video": {"initial": 5, "max": 20, "timeout": 600}}
+    "job_journal": True,  # 后台轮询的生成任务写入任务日志，进程重启后继续轮询并回复
+    "job_journal_path": "",  # 任务日志路径，默认为数据目录下的job_journal.jsonl
+    "job_journal_compact_every": 100,  # 每完成多少个任务重写一次日志，只保留未完成的任务
+    "job_journal_max_age": 7 * 24 * 3600,  # 超过该秒数仍未完成的任务在重写日志时丢弃
+    "job_resume_delay": 10,  # 重启后等待多少秒再开始查询恢复的任务，留出通道登录、连接的时间
 
     # 钉钉配置
     "dingtalk_client_id": "",  # 钉钉机器人Client ID 
@@ -188,6 +230,9 @@ available_setting = {
     "plugin_trigger_prefix": "$",  # 规范插件提供聊天相关指令的前缀，建议不要和管理员指令前缀"#"冲突
     # 是否使用全局插件配置
     "use_global_plugin_config": False,
+    "plugin_lazy_load": True,  # 按插件索引延迟导入插件，插件第一次收到订阅的事件时才加载
+    "plugin_eager_load": ["Godcmd"],  # 不延迟加载、启动时立即导入的插件
+    "plugin_profile_path": "",  # #pstats dump 导出插件耗时统计的文件，默认为数据目录下的plugin_profile.json
     # 知识库平台配置
     "use_linkai": False,
     "linkai_api_key": "",
@@ -200,11 +245,16 @@ available_setting = {
 
     # web channel配置
     "web_port": 9899,  # web channel的端口
+    "web_sse_heartbeat": 15,  # web通道SSE连接空闲多少秒发送一次心跳
+    "web_queue_ttl": 600,  # web通道用户断开后，消息队列保留多少秒
 
     # telegram channel配置
     "telegram_bot_token": "",  # telegram bot token
     "telegram_proxy_url": "",  # telegram bot proxy url
-    "stream": False,           # 是否启用流式响应，目前支持 claude bot + telegram 通道
+    "stream": False,           # 是否启用流式响应，目前支持 claude/gemini bot + telegram/飞书 通道
+    "stream_update_interval": 0.8,  # 流式回复两次更新消息之间的最小间隔(秒)
+    "stream_min_delta_chars": 40,  # 流式回复新增文本少于该字数时推迟更新
+    "stream_max_updates_per_second": 1,  # 流式回复每个会话每秒最多更新消息的次数
 
     # 可灵API配置
     "kling_access_key": "", # 身份密钥
@@ -218,6 +268,8 @@ available_setting = {
 class Config(dict):
     def __init__(self, d=None):
         super().__init__()
+        # 每次修改配置项加1，用于判断按配置预编译的缓存(如触发项索引)是否需要重建
+        self.version = 0
         if d is None:
             d = {}
         for k, v in d.items():
@@ -233,6 +285,7 @@ class Config(dict):
     def __setitem__(self, key, value):
         if key not in available_setting:
             raise Exception("key {} not in available_setting".format(key))
+        self.version += 1
         return super().__setitem__(key, value)
 
     def get(self, key, default=None):
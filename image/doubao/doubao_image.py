@@ -25,6 +25,7 @@ from common import const
 from common import memory
 from common.aspect_ratio import parse_aspect_ratio_from_prompt
 from common.log import logger
+from common.media_cache import raw_media_items
 from common.model_status import model_state
 from common.utils import get_chat_session_manager, url_to_base64
 from config import conf
@@ -95,7 +96,7 @@ class DoubaoImageBot(Bot):
             if quoted_cache:
                 quoted_images = [
                     encode_image(path, file)
-                    for path, file in zip(quoted_cache["path"], quoted_cache["files"])
+                    for path, file in zip(quoted_cache["path"], raw_media_items(quoted_cache["files"]))
                 ]
                 quoted_images = [
                     self._ensure_reference_image_within_limit(image_url, model)
@@ -109,7 +110,7 @@ class DoubaoImageBot(Bot):
             if file_cache:
                 cached_images = [
                     encode_image(path, file)
-                    for path, file in zip(file_cache["path"], file_cache["files"])
+                    for path, file in zip(file_cache["path"], raw_media_items(file_cache["files"]))
                 ]
                 cached_images = [
                     self._ensure_reference_image_within_limit(image_url, model)
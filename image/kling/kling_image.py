@@ -2,7 +2,6 @@ import io
 import re
 import time
 import jwt
-import requests
 import base64
 
 from PIL import Image
@@ -22,6 +21,8 @@ from common.utils import get_chat_session_manager, url_to_base64
 from common import const, memory
 from config import conf
 from common.model_status import model_state
+from common.http_client import http_client
+from common.job_poller import BACKOFF, DONE, FAILED, PENDING, Job, job_poller
 
 class KlingImageBot(Bot):
 
@@ -171,7 +172,7 @@ class KlingImageBot(Bot):
                         f"count={len(aspect_ratio_paths)}"
                     )
 
-            resp = requests.post(
+            resp = http_client("kling").post(
                 f"{self.API_BASE}{endpoint}",
                 headers=self._headers(),
                 json=payload,
@@ -192,31 +193,11 @@ class KlingImageBot(Bot):
 
             logger.info(f"[{model.upper()}] 任务已提交, task_id={task_id}, model={model}, endpoint={endpoint}")
 
-            image_urls, poll_err = self._poll_task(task_id, endpoint, model)
-            if poll_err:
-                return Reply(ReplyType.ERROR, f"[{model.upper()}] {poll_err}")
-
-            # 图片生成结果注入 session 上下文
-            try:
-                for image_url in image_urls:
-                    base64_data = url_to_base64(image_url)
-                    session_manager.session_inject_media(
-                        session_id=session_id,
-                        media_type='image',
-                        data=base64_data,
-                        source_model=model
-                    )
-                logger.info(
-                    f"[{model.upper()}] image injected to session, model={model}, "
-                    f"session_id={session_id}, image_count={len(image_urls)}"
-                )
-            except Exception as e:
-                logger.warning(f"[{model.upper()}] failed to inject image to session: {e}")
-
-            logger.info(f"[{model.upper()}] image generation finished, image_count={len(image_urls)}")
-            if len(image_urls) == 1:
-                return Reply(ReplyType.IMAGE_URL, image_urls[0])
-            return Reply(ReplyType.IMAGE_URL, image_urls)
+            job = Job("kling_image", task_id, context, data={"model": model, "endpoint": endpoint})
+            if job_poller.can_deliver(context):
+                job_poller.submit(self, job)
+                return None
+            return job_poller.run_sync(self, job)
 
         except Exception as e:
             logger.error(f"[{model.upper()}] fetch reply error: {e}")
@@ -310,55 +291,67 @@ class KlingImageBot(Bot):
             logger.warning(f"[{model.upper()}] failed to compress reference image: {e}")
             return image_base64
 
-    def _poll_task(self, task_id: str, endpoint: str, model: str, max_retries=120, interval=5) -> tuple:
-        query_url = f"{self.API_BASE}{endpoint}/{task_id}"
-        retry_delay = interval
-
-        for i in range(max_retries):
-            time.sleep(retry_delay)
-            try:
-                resp = requests.get(query_url, headers=self._headers(), timeout=15)
-                result = self._parse_response_json(resp, model, "poll task")
-                if is_kling_retryable(result):
-                    retry_delay = min(retry_delay * 2, 30)
-                    logger.warning(f"[{model.upper()}] 并发超限，退避重试 {retry_delay}s, task_id={task_id}")
-                    continue
+    def poll_job(self, job):
+        model = job.model
+        query_url = f"{self.API_BASE}{job.data['endpoint']}/{job.task_id}"
+        try:
+            resp = http_client("kling").get(query_url, headers=self._headers(), timeout=15)
+            result = self._parse_response_json(resp, model, "poll task")
+        except Exception as e:
+            http_error = format_kling_http_error(e, service_name="可灵图片")
+            if http_error:
+                logger.warning(f"[{model.upper()}] 轮询异常: {http_error}")
+                return FAILED, http_error
+            raise
+        if is_kling_retryable(result):
+            logger.warning(f"[{model.upper()}] 并发超限，退避重试, task_id={job.task_id}")
+            return BACKOFF, None
+
+        err = format_kling_response_error(result, service_name="可灵图片")
+        if err:
+            logger.error(f"[{model.upper()}] 轮询出错: {err}, task_id={job.task_id}")
+            return FAILED, err
+
+        data = result.get("data", {})
+        status = data.get("task_status")
+        if status == "succeed":
+            images = data.get("task_result", {}).get("images", [])
+            image_urls = [item.get("url") for item in images if item.get("url")]
+            if image_urls:
+                logger.info(f"[{model.upper()}] 图片生成成功, task_id={job.task_id}, image_count={len(image_urls)}")
+                return DONE, image_urls
+        elif status == "failed":
+            task_error = format_kling_task_failure(result, service_name="可灵图片")
+            logger.error(f"[{model.upper()}] 任务失败, task_id={job.task_id}, msg={task_error}")
+            return FAILED, task_error
+
+        logger.debug(f"[{model.upper()}] 轮询中 ({job.attempts}), status={status}, task_id={job.task_id}")
+        return PENDING, None
+
+    def complete_job(self, job, image_urls):
+        model = job.model
+        # 图片生成结果注入 session 上下文
+        try:
+            session_manager = get_chat_session_manager(job.session_id)
+            for image_url in image_urls:
+                base64_data = url_to_base64(image_url)
+                session_manager.session_inject_media(
+                    session_id=job.session_id,
+                    media_type='image',
+                    data=base64_data,
+                    source_model=model
+                )
+            logger.info(
+                f"[{model.upper()}] image injected to session, model={model}, "
+                f"session_id={job.session_id}, image_count={len(image_urls)}"
+            )
+        except Exception as e:
+            logger.warning(f"[{model.upper()}] failed to inject image to session: {e}")
 
-                err = format_kling_response_error(result, service_name="可灵图片")
-                if err:
-                    logger.error(f"[{model.upper()}] 轮询出错: {err}, task_id={task_id}")
-                    return None, err
-
-                data = result.get("data", {})
-                status = data.get("task_status")
-
-                if status == "succeed":
-                    images = data.get("task_result", {}).get("images", [])
-                    if images:
-                        image_urls = [item.get("url") for item in images if item.get("url")]
-                        if image_urls:
-                            logger.info(
-                                f"[{model.upper()}] 图片生成成功, task_id={task_id}, image_count={len(image_urls)}"
-                            )
-                            return image_urls, None
-
-                elif status == "failed":
-                    task_error = format_kling_task_failure(result, service_name="可灵图片")
-                    logger.error(f"[{model.upper()}] 任务失败, task_id={task_id}, msg={task_error}")
-                    return None, task_error
-
-                retry_delay = interval
-                logger.debug(f"[{model.upper()}] 轮询中 ({i+1}/{max_retries}), status={status}, task_id={task_id}")
-
-            except Exception as e:
-                http_error = format_kling_http_error(e, service_name="可灵图片")
-                if http_error:
-                    logger.warning(f"[{model.upper()}] 轮询异常: {http_error}")
-                    return None, http_error
-                logger.warning(f"[{model.upper()}] 轮询异常: {e}")
-
-        logger.error(f"[{model.upper()}] 任务超时, task_id={task_id}")
-        return None, "任务超时，请稍后重试"
+        logger.info(f"[{model.upper()}] image generation finished, image_count={len(image_urls)}")
+        if len(image_urls) == 1:
+            return Reply(ReplyType.IMAGE_URL, image_urls[0])
+        return Reply(ReplyType.IMAGE_URL, image_urls)
 
     def aspect_ratio_calculator(self, paths: list) -> str:
         """根据参考图尺寸推断最佳宽高比"""
@@ -1,6 +1,5 @@
 import base64
 import io
-import time
 
 from PIL import Image
 from luma_agents import APIStatusError, Luma
@@ -10,6 +9,7 @@ from bridge.context import Context
 from bridge.reply import Reply, ReplyType
 from common import const, memory
 from common.aspect_ratio import parse_aspect_ratio_from_prompt
+from common.job_poller import DONE, FAILED, PENDING, Job, job_poller
 from common.log import logger
 from common.model_status import model_state
 from common.utils import get_chat_session_manager, url_to_base64
@@ -68,34 +68,16 @@ class LumaImageBot(Bot):
                 error_message = self._format_sync_api_error(e, model, endpoint="POST")
                 logger.warning(f"[{model.upper()}] Luma create request failed: {error_message}")
                 return Reply(ReplyType.ERROR, error_message)
-            generation = self._poll_generation(generation, model)
-            image_urls = [
-                item.url for item in (getattr(generation, "output", None) or [])
-                if getattr(item, "url", None)
-            ]
-            if not image_urls:
-                raise ValueError("Luma image response missing image url")
-
-            try:
-                for image_url in image_urls:
-                    base64_data = url_to_base64(image_url)
-                    session_manager.session_inject_media(
-                        session_id=session_id,
-                        media_type="image",
-                        data=base64_data,
-                        source_model=model,
-                    )
-                logger.info(
-                    f"[{model.upper()}] image injected to session, model={model}, "
-                    f"session_id={session_id}, image_count={len(image_urls)}"
-                )
-            except Exception as e:
-                logger.warning(f"[{model.upper()}] failed to inject image to session: {e}")
-
-            logger.info(f"[{model.upper()}] image generation finished, image_count={len(image_urls)}")
-            if len(image_urls) == 1:
-                return Reply(ReplyType.IMAGE_URL, image_urls[0])
-            return Reply(ReplyType.IMAGE_URL, image_urls)
+            job = Job("luma_image", generation.id, context, data={"model": model})
+            status, value = self._generation_status(generation, model)
+            if status == DONE:
+                return self.complete_job(job, value)
+            if status == FAILED:
+                return Reply(ReplyType.ERROR, value)
+            if job_poller.can_deliver(context):
+                job_poller.submit(self, job)
+                return None
+            return job_poller.run_sync(self, job)
         except LumaClientFacingError as e:
             logger.warning(f"[{error_model.upper()}] client-facing luma error: {e}")
             return Reply(ReplyType.ERROR, str(e))
@@ -376,31 +358,61 @@ class LumaImageBot(Bot):
             logger.warning(f"[{model.upper()}] failed to compress reference image: {e}")
             return image_data
 
-    def _poll_generation(self, generation, model, max_retries=120, interval=2):
-        last_log_time = 0
-        for i in range(max_retries):
-            state = getattr(generation, "state", None)
-            if state == "completed":
-                return generation
-            if state == "failed":
-                raise LumaClientFacingError(self._format_async_failure(generation, model))
-
-            time.sleep(interval)
-            try:
-                generation = self.client.generations.get(generation.id)
-            except APIStatusError as e:
-                error_message = self._format_sync_api_error(e, model, endpoint="GET")
-                logger.warning(f"[{model.upper()}] Luma poll request failed: {error_message}")
-                raise LumaClientFacingError(error_message)
-            now = time.time()
-            if now - last_log_time >= 10:
-                logger.info(
-                    f"[{model.upper()}] 轮询中 ({i + 1}/{max_retries}), "
-                    f"state={generation.state}, id={generation.id}"
+    def poll_job(self, job):
+        try:
+            generation = self.client.generations.get(job.task_id)
+        except APIStatusError as e:
+            error_message = self._format_sync_api_error(e, job.model, endpoint="GET")
+            logger.warning(f"[{job.model.upper()}] Luma poll request failed: {error_message}")
+            return FAILED, error_message
+        status, value = self._generation_status(generation, job.model)
+        if status == PENDING and job.attempts % 5 == 1:
+            logger.info(f"[{job.model.upper()}] 轮询中 ({job.attempts}), state={generation.state}, id={generation.id}")
+        return status, value
+
+    def complete_job(self, job, image_urls):
+        model = job.model
+        try:
+            session_manager = get_chat_session_manager(job.session_id)
+            for image_url in image_urls:
+                base64_data = url_to_base64(image_url)
+                session_manager.session_inject_media(
+                    session_id=job.session_id,
+                    media_type="image",
+                    data=base64_data,
+                    source_model=model,
                 )
-                last_log_time = now
-
-        raise TimeoutError("任务超时，请稍后重试")
+            logger.info(
+                f"[{model.upper()}] image injected to session, model={model}, "
+                f"session_id={job.session_id}, image_count={len(image_urls)}"
+            )
+        except Exception as e:
+            logger.warning(f"[{model.upper()}] failed to inject image to session: {e}")
+
+        logger.info(f"[{model.upper()}] image generation finished, image_count={len(image_urls)}")
+        if len(image_urls) == 1:
+            return Reply(ReplyType.IMAGE_URL, image_urls[0])
+        return Reply(ReplyType.IMAGE_URL, image_urls)
+
+    def fail_job(self, job, message):
+        # 失败原因已带模型前缀，超时等通用原因补上前缀
+        if message.startswith("["):
+            return Reply(ReplyType.ERROR, message)
+        return Reply(ReplyType.ERROR, f"[{job.model.upper()}] {message}")
+
+    def _generation_status(self, generation, model):
+        state = getattr(generation, "state", None)
+        if state == "completed":
+            image_urls = [
+                item.url for item in (getattr(generation, "output", None) or [])
+                if getattr(item, "url", None)
+            ]
+            if not image_urls:
+                return FAILED, f"[{model.upper()}] Luma image response missing image url"
+            return DONE, image_urls
+        if state == "failed":
+            return FAILED, self._format_async_failure(generation, model)
+        return PENDING, None
 
     def _normalize_resolution(self, resolution, model):
         normalized = str(resolution).strip().lower()
@@ -19,6 +19,7 @@ from common.log import logger
 from common.media_store import build_public_media_url
 from common.model_status import model_state
 from common.utils import get_chat_session_manager
+from common.http_client import http_client
 from config import conf
 
 
@@ -291,7 +292,7 @@ class GPTImageBot(Bot):
             if payload["images"]:
                 debug_payload["first_image_preview"] = payload["images"][0]
         logger.info(f"[{model.upper()}] compatible images api request: action={action}, url={url}, payload={debug_payload}")
-        resp = requests.post(url, headers=headers, json=payload, timeout=120)
+        resp = http_client("openai_image").post(url, headers=headers, json=payload, timeout=120)
 
         try:
             resp.raise_for_status()
@@ -381,7 +382,7 @@ class GPTImageBot(Bot):
 
         for attempt in range(1, 11):
             logger.info(f"[GPT_IMAGE] download image payload attempt={attempt}, url={current_url}")
-            resp = requests.get(current_url, headers=headers, timeout=60)
+            resp = http_client("openai_image").get(current_url, headers=headers, timeout=60)
             resp.raise_for_status()
             mime_type = resp.headers.get("content-type", "image/png").split(";")[0]
             logger.info(
@@ -9,7 +9,7 @@ from bridge.reply import Reply, ReplyType
 from common.log import logger
 from plugins import *
 
-from .lib.WordsSearch import WordsSearch
+from .lib.banword_matcher import BanwordMatcher, keywords_hash
 
 
 @plugins.register(
@@ -35,7 +35,6 @@ class Banwords(Plugin):
                     with open(config_path, "w") as f:
                         json.dump(conf, f, indent=4)
 
-            self.searchr = WordsSearch()
             self.action = conf["action"]
             banwords_path = os.path.join(curdir, "banwords.txt")
             with open(banwords_path, "r", encoding="utf-8") as f:
@@ -44,8 +43,14 @@ class Banwords(Plugin):
                     word = line.strip()
                     if word:
                         words.append(word)
-            self.searchr.SetKeywords(words)
+            self.searchr = self._load_matcher(
+                words,
+                os.path.join(curdir, "banwords.dat") if conf.get("cache", True) else None,
+                conf.get("ignore_case", False),
+                conf.get("normalize_width", False),
+            )
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.content_types[Event.ON_HANDLE_CONTEXT] = [ContextType.TEXT, ContextType.IMAGE_CREATE]
             if conf.get("reply_filter", True):
                 self.handlers[Event.ON_DECORATE_REPLY] = self.on_decorate_reply
                 self.reply_action = conf.get("reply_action", "ignore")
@@ -54,6 +59,25 @@ class Banwords(Plugin):
             logger.warn("[Banwords] init failed, ignore or see https://github.com/zhayujie/chatgpt-on-wechat/tree/master/plugins/banwords .")
             raise e
 
+    def _load_matcher(self, words, cache_path, ignore_case, normalize_width):
+        """优先读取编译好的词库，词库内容或匹配选项变化时重新编译并写回"""
+        source_hash = keywords_hash(words)
+        if cache_path and os.path.exists(cache_path):
+            try:
+                matcher = BanwordMatcher.load(cache_path, source_hash, ignore_case, normalize_width)
+                if matcher:
+                    logger.info("[Banwords] loaded %d words from %s" % (len(matcher.keywords), cache_path))
+                    return matcher
+            except Exception as e:
+                logger.warn("[Banwords] load %s failed: %s" % (cache_path, e))
+        matcher = BanwordMatcher(ignore_case, normalize_width).build(words)
+        if cache_path:
+            try:
+                matcher.save(cache_path, source_hash)
+            except Exception as e:
+                logger.warn("[Banwords] save %s failed: %s" % (cache_path, e))
+        return matcher
+
     def on_handle_context(self, e_context: EventContext):
         if e_context["context"].type not in [
             ContextType.TEXT,
@@ -64,14 +88,14 @@ class Banwords(Plugin):
         content = e_context["context"].content
         logger.debug("[Banwords] on_handle_context. content: %s" % content)
         if self.action == "ignore":
-            f = self.searchr.FindFirst(content)
+            f = self.searchr.find_first(content)
             if f:
                 logger.info("[Banwords] %s in message" % f["Keyword"])
                 e_context.action = EventAction.BREAK_PASS
                 return
         elif self.action == "replace":
-            if self.searchr.ContainsAny(content):
-                reply = Reply(ReplyType.INFO, "发言中包含敏感词，请重试: \n" + self.searchr.Replace(content))
+            if self.searchr.contains_any(content):
+                reply = Reply(ReplyType.INFO, "发言中包含敏感词，请重试: \n" + self.searchr.replace(content))
                 e_context["reply"] = reply
                 e_context.action = EventAction.BREAK_PASS
                 return
@@ -83,15 +107,15 @@ class Banwords(Plugin):
         reply = e_context["reply"]
         content = reply.content
         if self.reply_action == "ignore":
-            f = self.searchr.FindFirst(content)
+            f = self.searchr.find_first(content)
             if f:
                 logger.info("[Banwords] %s in reply" % f["Keyword"])
                 e_context["reply"] = None
                 e_context.action = EventAction.BREAK_PASS
                 return
         elif self.reply_action == "replace":
-            if self.searchr.ContainsAny(content):
-                reply = Reply(ReplyType.INFO, "已替换回复中的敏感词: \n" + self.searchr.Replace(content))
+            if self.searchr.contains_any(content):
+                reply = Reply(ReplyType.INFO, "已替换回复中的敏感词: \n" + self.searchr.replace(content))
                 e_context["reply"] = reply
                 e_context.action = EventAction.CONTINUE
                 return
@@ -0,0 +1,406 @@
+# encoding:utf-8
+"""
+基于双数组(double-array)的Aho-Corasick敏感词匹配。
+与WordsSearch的每个节点一个对象、一个dict不同，整个自动机由几个定长整数数组组成：
+- 字符先映射为紧凑的字符编号，词库中没有的字符编号为0，扫描时直接回到根状态
+- 状态s经编号c的转移为 t = base[s] + c，当 check[t] == s 时转移存在
+- fail为失配指针；word为以该状态结尾的词(没有为-1)；link指向失配链上下一个有词的状态；
+  longest为以该状态结尾的最长词的长度，用于替换
+编译结果可以保存到文件，启动时直接读入数组，不必重新构建。
+"""
+
+import hashlib
+import json
+import os
+import struct
+from array import array
+from collections import deque
+
+FORMAT_VERSION = 1
+_MAGIC = b"BWDA"
+_ARRAY_NAMES = ("base", "check", "fail", "word", "link", "longest")
+
+
+def _variants(ch, ignore_case, normalize_width):
+    """与ch匹配同一个字符编号的写法：大小写、全角半角"""
+    chars = {ch}
+    if normalize_width:
+        for c in list(chars):
+            code = ord(c)
+            if 0x21 <= code <= 0x7E:
+                chars.add(chr(code + 0xFEE0))
+            elif c == " ":
+                chars.add("　")
+    if ignore_case:
+        for c in list(chars):
+            if c.upper() != c and len(c.upper()) == 1:
+                chars.add(c.upper())
+    return chars
+
+
+def _normalize_char(ch, ignore_case, normalize_width):
+    if normalize_width:
+        code = ord(ch)
+        if 0xFF01 <= code <= 0xFF5E:
+            ch = chr(code - 0xFEE0)
+        elif ch == "　":
+            ch = " "
+    if ignore_case:
+        lower = ch.lower()
+        if len(lower) == 1:
+            ch = lower
+    return ch
+
+
+class BanwordMatcher:
+    def __init__(self, ignore_case=False, normalize_width=False):
+        """
+        :param ignore_case: 忽略大小写
+        :param normalize_width: 全角字母、数字、符号与半角视为相同
+        """
+        self.ignore_case = ignore_case
+        self.normalize_width = normalize_width
+        self.keywords = []
+        self.char_codes = {}  # 字符 -> 编号，从1开始
+        for name in _ARRAY_NAMES:
+            setattr(self, name, array("i", [-1] if name == "check" else [0]))
+        self.word[0] = -1
+
+    # ---------- 构建 ----------
+
+    def build(self, keywords):
+        """编译词库，归一化后重复的词只保留第一个"""
+        self.keywords, normalized, seen = [], [], set()
+        for keyword in keywords:
+            key = "".join(_normalize_char(ch, self.ignore_case, self.normalize_width) for ch in keyword)
+            if key and key not in seen:
+                seen.add(key)
+                self.keywords.append(keyword)
+                normalized.append(key)
+
+        # 出现次数多的字符编号小，子节点更集中，双数组更紧凑
+        frequency = {}
+        for key in normalized:
+            for ch in key:
+                frequency[ch] = frequency.get(ch, 0) + 1
+        self.char_codes = {}
+        for code, ch in enumerate(sorted(frequency, key=lambda c: (-frequency[c], c)), start=1):
+            for variant in _variants(ch, self.ignore_case, self.normalize_width):
+                self.char_codes.setdefault(variant, code)
+        codes = [tuple(self.char_codes[ch] for ch in key) for key in normalized]
+        order = sorted(range(len(codes)), key=lambda i: codes[i])
+        self._build_arrays([codes[i] for i in order], order)
+        return self
+
+    def _build_arrays(self, sorted_codes, word_ids):
+        base, check = [0], [0]
+        word, depth, parent_code = [-1], [0], [0]
+        # 空闲位置按下标顺序串成双向链表，找base时只遍历空闲位置
+        free_next, free_prev = [-1], [-1]
+        free_head = free_tail = -1
+
+        def ensure(size):
+            nonlocal free_head, free_tail
+            old = len(check)
+            if size <= old:
+                return
+            new = size + 4096
+            base.extend([0] * (new - old))
+            check.extend([-1] * (new - old))
+            word.extend([-1] * (new - old))
+            depth.extend([0] * (new - old))
+            parent_code.extend([0] * (new - old))
+            free_next.extend(range(old + 1, new + 1))
+            free_next[new - 1] = -1
+            free_prev.extend(range(old - 1, new - 1))
+            free_prev[old] = free_tail
+            if free_tail >= 0:
+                free_next[free_tail] = old
+            else:
+                free_head = old
+            free_tail = new - 1
+
+        def occupy(slot, owner):
+            nonlocal free_head, free_tail
+            prev, next_ = free_prev[slot], free_next[slot]
+            if prev >= 0:
+                free_next[prev] = next_
+            else:
+                free_head = next_
+            if next_ >= 0:
+                free_prev[next_] = prev
+            else:
+                free_tail = prev
+            check[slot] = owner
+
+        multi_start = 1
+        bfs = []  # 按广度优先顺序记录的状态，计算fail时保证父状态先处理
+        queue = deque([(0, 0, len(sorted_codes), 0)])  # (状态, 词的起始下标, 结束下标, 深度)
+        while queue:
+            state, lo, hi, d = queue.popleft()
+            bfs.append(state)
+            if lo < hi and len(sorted_codes[lo]) == d:
+                word[state] = word_ids[lo]
+                lo += 1
+            if lo >= hi:
+                continue
+            # 按字符编号分组子节点
+            children = []
+            i = lo
+            while i < hi:
+                c = sorted_codes[i][d]
+                j = i + 1
+                while j < hi and sorted_codes[j][d] == c:
+                    j += 1
+                children.append((c, i, j))
+                i = j
+            # 沿空闲链表找一个base，使所有子节点的位置都空闲
+            first_code, last_code = children[0][0], children[-1][0]
+            # base可以为负数，只要求子节点位置为正；扫描时base+c为负数会落到末尾的填充区
+            # 只有一个子节点时任何空闲位置都可以，从链表头开始填补空洞；
+            # 多个子节点的搜索从上次多次尝试后找到的位置开始，不反复遍历放不下的空洞
+            if len(children) == 1:
+                slot = free_head
+            else:
+                slot = multi_start
+                while slot < len(check) and check[slot] != -1:
+                    slot += 1
+                if slot >= len(check):
+                    slot = -1
+            steps = 0
+            while True:
+                if slot < 0:
+                    slot = len(check)
+                    ensure(slot + 1)
+                b = slot - first_code
+                ensure(b + last_code + 1)
+                if all(check[b + c] == -1 for c, _, _ in children):
+                    break
+                slot = free_next[slot]
+                steps += 1
+            if steps > 16:
+                multi_start = slot
+            base[state] = b
+            for c, i, j in children:
+                t = b + c
+                occupy(t, state)
+                depth[t] = d + 1
+                parent_code[t] = c
+                queue.append((t, i, j, d + 1))
+        check[0] = -1
+
+        size = max(bfs) + 1
+        fail = [0] * size
+        link = [0] * size
+        longest = [0] * size
+        for state in bfs:
+            if state == 0:
+                continue
+            parent = check[state]
+            c = parent_code[state]
+            if parent != 0:
+                f = fail[parent]
+                while True:
+                    t = base[f] + c
+                    if 0 < t < len(check) and check[t] == f:
+                        fail[state] = t
+                        break
+                    if f == 0:
+                        break
+                    f = fail[f]
+            f = fail[state]
+            link[state] = f if word[f] >= 0 else link[f]
+            longest[state] = depth[state] if word[state] >= 0 else longest[f]
+
+        # 数组末尾按最大字符编号留出填充区，扫描时base[s] + c不会越界，为负数时也只会落在填充区
+        padded = size + len(set(self.char_codes.values())) + 1
+        self.base = array("i", base[:size] + [0] * (padded - size))
+        self.check = array("i", check[:size] + [-1] * (padded - size))
+        self.fail = array("i", fail + [0] * (padded - size))
+        self.word = array("i", word[:size] + [-1] * (padded - size))
+        self.link = array("i", link + [0] * (padded - size))
+        self.longest = array("i", longest + [0] * (padded - size))
+
+    # ---------- 匹配 ----------
+
+    def _scan(self, text):
+        """逐个产出(结束下标, 状态)，只产出有词结尾的状态"""
+        base, check, fail, longest = self.base, self.check, self.fail, self.longest
+        get_code = self.char_codes.get
+        state = 0
+        for index, ch in enumerate(text):
+            c = get_code(ch)
+            if c is None:
+                state = 0
+                continue
+            while True:
+                t = base[state] + c
+                if check[t] == state:
+                    state = t
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            if longest[state]:
+                yield index, state
+
+    def contains_any(self, text):
+        for _ in self._scan(text):
+            return True
+        return False
+
+    def find_first(self, text):
+        """第一个匹配的词，格式与WordsSearch.FindFirst一致"""
+        for index, state in self._scan(text):
+            if self.word[state] < 0:
+                state = self.link[state]
+            return self._result(self.word[state], index)
+        return None
+
+    def find_all(self, text):
+        """所有匹配的词(包括互相重叠的)，按结束位置排序"""
+        results = []
+        word, link = self.word, self.link
+        for index, state in self._scan(text):
+            s = state if word[state] >= 0 else link[state]
+            while s:
+                results.append(self._result(word[s], index))
+                s = link[s]
+        return results
+
+    def replace(self, text, replace_char="*"):
+        """把匹配到的词替换为replace_char，每个位置按以该位置结尾的最长词替换"""
+        spans = [(index + 1 - self.longest[state], index + 1) for index, state in self._scan(text)]
+        if not spans:
+            return text
+        chars = list(text)
+        for start, end in spans:
+            chars[start:end] = replace_char * (end - start)
+        return "".join(chars)
+
+    def _result(self, word_id, end):
+        keyword = self.keywords[word_id]
+        return {"Keyword": keyword, "Success": True, "End": end, "Start": end + 1 - len(keyword), "Index": word_id}
+
+    # ---------- 持久化 ----------
+
+    def save(self, path, source_hash=""):
+        header = json.dumps({
+            "version": FORMAT_VERSION,
+            "source_hash": source_hash,
+            "ignore_case": self.ignore_case,
+            "normalize_width": self.normalize_width,
+            "keywords": self.keywords,
+            "char_codes": self.char_codes,
+            "size": len(self.base),
+        }, ensure_ascii=False).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(_MAGIC + struct.pack("<I", len(header)) + header)
+            for name in _ARRAY_NAMES:
+                getattr(self, name).tofile(file)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, source_hash=None, ignore_case=None, normalize_width=None):
+        """读取编译结果；版本、词库hash或匹配选项不一致时返回None"""
+        with open(path, "rb") as file:
+            if file.read(4) != _MAGIC:
+                return None
+            header = json.loads(file.read(struct.unpack("<I", file.read(4))[0]).decode("utf-8"))
+            if header.get("version") != FORMAT_VERSION:
+                return None
+            if source_hash is not None and header.get("source_hash") != source_hash:
+                return None
+            if ignore_case is not None and header.get("ignore_case") != ignore_case:
+                return None
+            if normalize_width is not None and header.get("normalize_width") != normalize_width:
+                return None
+            matcher = cls(header["ignore_case"], header["normalize_width"])
+            matcher.keywords = header["keywords"]
+            matcher.char_codes = header["char_codes"]
+            for name in _ARRAY_NAMES:
+                values = array("i")
+                values.fromfile(file, header["size"])
+                setattr(matcher, name, values)
+        return matcher
+
+
+def keywords_hash(keywords):
+    digest = hashlib.sha256()
+    for keyword in keywords:
+        digest.update(keyword.encode("utf-8") + b"\n")
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    # 基准测试：与WordsSearch比较构建时间、内存占用、扫描吞吐量，以及从文件加载的时间
+    # 用法: python banword_matcher.py [词库文件或词数]，不指定词库时随机生成中文词
+    import random
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+
+    from WordsSearch import WordsSearch
+
+    random.seed(0)
+    chars = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)] + list("abcdefghijklmnopqrstuvwxyz0123456789")
+    arg = sys.argv[1] if len(sys.argv) > 1 else "20000"
+    if os.path.isfile(arg):
+        with open(arg, "r", encoding="utf-8") as f:
+            words = [line.strip() for line in f if line.strip()]
+    else:
+        words = list({"".join(random.choices(chars, k=random.randint(2, 6))) for _ in range(int(arg))})
+
+    def build_words_search():
+        search = WordsSearch()
+        search.SetKeywords(words)
+        return search
+
+    def build_matcher():
+        return BanwordMatcher().build(words)
+
+    def measure(build):
+        start = time.perf_counter()
+        engine = build()
+        elapsed = time.perf_counter() - start
+        del engine
+        tracemalloc.start()
+        engine = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return engine, elapsed, size
+
+    def scan_rate(func, text):
+        start = time.perf_counter()
+        rounds = 0
+        while time.perf_counter() - start < 1:
+            func(text)
+            rounds += 1
+        return rounds * len(text) / (time.perf_counter() - start)
+
+    search, ws_build, ws_memory = measure(build_words_search)
+    matcher, bm_build, bm_memory = measure(build_matcher)
+    # 含敏感词的文本测替换，不含敏感词的文本测检测(聊天消息大多不含敏感词，需要扫描全文)
+    text = "".join(random.choices(chars + [" ", "，", "。"] * 200, k=100000))
+    clean_text = matcher.replace(text)
+    assert search.Replace(text) == clean_text and not search.ContainsAny(clean_text)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "banwords.dat")
+        matcher.save(path)
+        start = time.perf_counter()
+        BanwordMatcher.load(path)
+        load_time = time.perf_counter() - start
+
+    print(f"words={len(words)}, states={len(matcher.base)}, text={len(text)} chars")
+    print(f"{'':<16}{'build(s)':>10}{'memory(MB)':>12}{'contains(Kchar/s)':>20}{'replace(Kchar/s)':>18}")
+    for name, build_time, memory, contains, replace in (
+        ("WordsSearch", ws_build, ws_memory, search.ContainsAny, search.Replace),
+        ("BanwordMatcher", bm_build, bm_memory, matcher.contains_any, matcher.replace),
+    ):
+        print(
+            f"{name:<16}{build_time:>10.2f}{memory / 1024 / 1024:>12.1f}"
+            f"{scan_rate(contains, clean_text) / 1000:>20.0f}{scan_rate(replace, text) / 1000:>18.0f}"
+        )
+    print(f"BanwordMatcher load from file: {load_time * 1000:.1f}ms")
@@ -37,6 +37,7 @@ class BDunit(Plugin):
             self.secret_key = conf["secret_key"]
             self.access_token = self.get_token()
             self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+            self.content_types[Event.ON_HANDLE_CONTEXT] = [ContextType.TEXT]
             logger.info("[BDunit] inited")
         except Exception as e:
             logger.warn("[BDunit] init failed, ignore ")
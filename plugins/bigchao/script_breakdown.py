@@ -27,6 +27,7 @@ from common.tool_button import tool_state
 from common.model_status import model_state
 from common.log import logger
 from common.tmp_dir import TmpDir, create_user_dir
+from common.media_cache import LazyImageList
 
 
 def get_model_id(session_id):
@@ -714,7 +715,7 @@ def cache_media(media_path, media_file, context):
         if session_id not in memory.USER_IMAGE_CACHE:
             memory.USER_IMAGE_CACHE[session_id] = {
                 "path": [media_path],
-                "files": [media_file]
+                "files": LazyImageList([media_file])
             }
         else:
             memory.USER_IMAGE_CACHE[session_id]["path"].append(media_path)
@@ -20,6 +20,7 @@ class Finish(Plugin):
     def __init__(self):
         super().__init__()
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+        self.content_types[Event.ON_HANDLE_CONTEXT] = [ContextType.TEXT]
         logger.info("[Finish] inited")
 
     def on_handle_context(self, e_context: EventContext):
@@ -190,6 +190,11 @@ ADMIN_COMMANDS = {
         "alias": ["debug", "调试模式", "DEBUG"],
         "desc": "开启机器调试日志",
     },
+    "pstats": {
+        "alias": ["pstats", "插件耗时"],
+        "args": ["reset|dump"],
+        "desc": "查看各插件处理消息的耗时，reset清空统计，dump导出为JSON文件",
+    },
 }
 
 
@@ -214,8 +219,11 @@ def get_help_text(isadmin, isgroup):
     for plugin in plugins:
         if plugins[plugin].enabled and not plugins[plugin].hidden:
             namecn = plugins[plugin].namecn
+            instance = PluginManager().get_instance(plugin)
+            if instance is None:
+                continue
             help_text += "\n%s:" % namecn
-            help_text += PluginManager().instances[plugin].get_help_text(verbose=False).strip()
+            help_text += instance.get_help_text(verbose=False).strip()
 
     if ADMIN_COMMANDS and isadmin:
         help_text += "\n\n管理员指令：\n"
@@ -317,7 +325,9 @@ class Godcmd(Plugin):
                             if not plugincls.enabled:
                                 continue
                             if query_name == name or query_name == plugincls.namecn:
-                                ok, result = True, PluginManager().instances[name].get_help_text(isgroup=isgroup, isadmin=isadmin, verbose=True)
+                                instance = PluginManager().get_instance(name)
+                                if instance is not None:
+                                    ok, result = True, instance.get_help_text(isgroup=isgroup, isadmin=isadmin, verbose=True)
                                 break
                         if not ok:
                             result = "插件不存在或未启用"
@@ -565,6 +575,8 @@ class Godcmd(Plugin):
                             else:
                                 logger.setLevel(logging.DEBUG)
                                 ok, result = True, "DEBUG模式已开启"
+                        elif cmd == "pstats":
+                            ok, result = self.plugin_stats(args)
                         elif cmd == "plist":
                             plugins = PluginManager().list_plugins()
                             ok = True
@@ -678,6 +690,30 @@ class Godcmd(Plugin):
         return get_help_text(isadmin, isgroup)
 
 
+    def plugin_stats(self, args, limit=10):
+        manager = PluginManager()
+        if args and args[0] == "reset":
+            manager.reset_handler_stats()
+            return True, "插件耗时统计已清空"
+        if args and args[0] == "dump":
+            try:
+                return True, "插件耗时统计已导出到 " + manager.dump_handler_stats()
+            except Exception as e:
+                logger.error("[Godcmd] dump plugin stats failed: {}".format(e))
+                return False, "导出失败: " + str(e)
+        if args:
+            return False, "请发送 #pstats 查看统计，#pstats reset 清空，#pstats dump 导出"
+        stats = [item for item in manager.get_handler_stats() if item["calls"]]
+        if not stats:
+            return True, "暂无插件耗时统计"
+        lines = ["插件耗时(按总耗时排序，单位ms)："]
+        for item in stats[:limit]:
+            lines.append(
+                f"{item['plugin']} {item['event']}\n"
+                f"  次数{item['calls']} 平均{item['avg_ms']} p50 {item['p50_ms']} p95 {item['p95_ms']} p99 {item['p99_ms']} 最大{item['max_ms']}"
+            )
+        return True, "\n".join(lines)
+
     def is_admin_in_group(self, context):
         if context["isgroup"]:
             return context.kwargs.get("msg").actual_user_id in global_config["admin_users"]
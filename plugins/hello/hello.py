@@ -21,6 +21,7 @@ class Hello(Plugin):
     def __init__(self):
         super().__init__()
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+        self.content_types[Event.ON_HANDLE_CONTEXT] = [ContextType.TEXT, ContextType.JOIN_GROUP, ContextType.PATPAT, ContextType.EXIT_GROUP]
         logger.info("[Hello] inited")
         self.config = super().load_config()
 
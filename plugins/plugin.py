@@ -7,6 +7,8 @@ from common.log import logger
 class Plugin:
     def __init__(self):
         self.handlers = {}
+        # 事件 -> 只处理这些类型的context，其他类型的消息不会调用该事件的handler；未设置的事件不过滤
+        self.content_types = {}
 
     def load_config(self) -> dict:
         """
@@ -3,17 +3,76 @@
 import importlib
 import importlib.util
 import json
+import logging
 import os
 import sys
+import threading
+import time
+from functools import partial
 
+from bridge.context import ContextType
+from common.latency_histogram import LatencyHistogram
 from common.log import logger
 from common.singleton import singleton
 from common.sorted_dict import SortedDict
-from config import conf, write_plugin_config
+from config import conf, get_appdata_dir, write_plugin_config
 
 from .event import *
 
 
+class HandlerStats:
+    """单个插件在单个事件上的调用次数、耗时直方图，只在emit_event中累加，不加锁"""
+
+    __slots__ = ("histogram", "breaks", "skipped", "errors")
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.breaks = 0
+        self.skipped = 0  # 因context类型不匹配而跳过的次数
+        self.errors = 0
+
+    def to_dict(self):
+        histogram = self.histogram
+        p50, p95, p99 = (histogram.percentile(q) for q in (50, 95, 99))
+        return {
+            "calls": histogram.count,
+            "total_ms": round(histogram.total * 1000, 3),
+            "avg_ms": round(histogram.total * 1000 / histogram.count, 3) if histogram.count else 0.0,
+            "p50_ms": round(p50 * 1000, 3),
+            "p95_ms": round(p95 * 1000, 3),
+            "p99_ms": round(p99 * 1000, 3),
+            "max_ms": round(histogram.max * 1000, 3),
+            "breaks": self.breaks,
+            "skipped": self.skipped,
+            "errors": self.errors,
+        }
+
+
+class LazyPlugin:
+    """
+    插件索引中记录的插件元数据(名称、优先级、订阅的事件和消息类型)，启动时代替插件类注册，
+    插件第一次收到订阅的事件时才导入模块、创建实例，并用真正的插件类替换
+    """
+
+    lazy_stub = True
+    events = None  # 订阅的事件，None表示未知，启用时需要立即加载
+    content_types = {}
+
+
+def _plugin_signature(plugin_path):
+    """插件目录下所有.py文件的数量、总大小和最新修改时间，代码变化后索引失效"""
+    count = size = mtime = 0
+    for root, dirs, files in os.walk(plugin_path):
+        dirs[:] = [d for d in dirs if d != "__pycache__" and not d.startswith(".")]
+        for file in files:
+            if file.endswith(".py"):
+                stat = os.stat(os.path.join(root, file))
+                count += 1
+                size += stat.st_size
+                mtime = max(mtime, stat.st_mtime_ns)
+    return f"{count}-{size}-{mtime}"
+
+
 @singleton
 class PluginManager:
     def __init__(self, session_id=None):
@@ -23,6 +82,14 @@ class PluginManager:
         self.pconf = {}
         self.current_plugin_path = None
         self.loaded = {}
+        # 每个事件预先排好的处理链: (插件名, handler, 处理的context类型或None, 统计)，只在插件开关、重载、调整优先级时重建
+        self.handler_chains = {}
+        self.handler_stats = {}  # (插件名, 事件) -> HandlerStats
+        self.lazy_lock = threading.RLock()
+        self.plugin_index = {}  # 插件目录 -> 上次加载时记录的元数据
+        self.signatures = {}  # 插件目录 -> 本次扫描时的代码签名
+        self.import_stats = {}  # 插件目录名 -> 导入耗时、新导入的模块数
+        self.startup_time = None
 
     def register(self, name: str, desire_priority: int = 0, **kwargs):
         def wrapper(plugincls):
@@ -88,30 +155,49 @@ class PluginManager:
         logger.info("Scaning plugins ...")
         plugins_dir = "./plugins"
         raws = [self.plugins[name] for name in self.plugins]
-        for plugin_name in os.listdir(plugins_dir):
-            plugin_path = os.path.join(plugins_dir, plugin_name)
-            if os.path.isdir(plugin_path):
-                # 判断插件是否包含同名__init__.py文件
-                main_module_path = os.path.join(plugin_path, "__init__.py")
-                if os.path.isfile(main_module_path):
-                    # 导入插件
-                    import_path = "plugins.{}".format(plugin_name)
-                    try:
-                        self.current_plugin_path = plugin_path
-                        if plugin_path in self.loaded:
-                            if self.loaded[plugin_path] == None:
-                                logger.info("reload module %s" % plugin_name)
-                                self.loaded[plugin_path] = importlib.reload(sys.modules[import_path])
-                                dependent_module_names = [name for name in sys.modules.keys() if name.startswith(import_path + ".")]
-                                for name in dependent_module_names:
-                                    logger.info("reload module %s" % name)
-                                    importlib.reload(sys.modules[name])
-                        else:
-                            self.loaded[plugin_path] = importlib.import_module(import_path)
-                        self.current_plugin_path = None
-                    except Exception as e:
-                        logger.warning("Failed to import plugin %s: %s" % (plugin_name, e))
-                        continue
+        self.plugin_index = self._load_index()
+        lazy_load = conf().get("plugin_lazy_load", True)
+        eager_names = {name.upper() for name in conf().get("plugin_eager_load", ["Godcmd"]) or []}
+        stubbed = {plugincls.path for plugincls in self.plugins.values() if getattr(plugincls, "lazy_stub", False)}
+        with self.lazy_lock:
+            for plugin_name in os.listdir(plugins_dir):
+                plugin_path = os.path.join(plugins_dir, plugin_name)
+                if os.path.isdir(plugin_path):
+                    # 判断插件是否包含同名__init__.py文件
+                    main_module_path = os.path.join(plugin_path, "__init__.py")
+                    if os.path.isfile(main_module_path):
+                        if plugin_path in stubbed:
+                            continue
+                        self.signatures[plugin_path] = _plugin_signature(plugin_path)
+                        # 索引中有记录且代码未变化的插件只注册元数据，推迟导入
+                        entry = self.plugin_index.get(plugin_path)
+                        if (
+                            lazy_load
+                            and plugin_path not in self.loaded
+                            and entry
+                            and entry.get("signature") == self.signatures[plugin_path]
+                            and entry["name"].upper() not in eager_names
+                        ):
+                            self._register_stub(plugin_path, entry)
+                            continue
+                        # 导入插件
+                        import_path = "plugins.{}".format(plugin_name)
+                        try:
+                            self.current_plugin_path = plugin_path
+                            if plugin_path in self.loaded:
+                                if self.loaded[plugin_path] == None:
+                                    logger.info("reload module %s" % plugin_name)
+                                    self.loaded[plugin_path] = importlib.reload(sys.modules[import_path])
+                                    dependent_module_names = [name for name in sys.modules.keys() if name.startswith(import_path + ".")]
+                                    for name in dependent_module_names:
+                                        logger.info("reload module %s" % name)
+                                        importlib.reload(sys.modules[name])
+                            else:
+                                self.loaded[plugin_path] = self._import_plugin(plugin_name, import_path, lazy=False)
+                            self.current_plugin_path = None
+                        except Exception as e:
+                            logger.warning("Failed to import plugin %s: %s" % (plugin_name, e))
+                            continue
         pconf = self.pconf
         news = [self.plugins[name] for name in self.plugins]
         new_plugins = list(set(news) - set(raws))
@@ -136,27 +222,229 @@ class PluginManager:
     def refresh_order(self):
         for event in self.listening_plugins.keys():
             self.listening_plugins[event].sort(key=lambda name: self.plugins[name].priority, reverse=True)
+        self.rebuild_handler_chains()
+
+    def rebuild_handler_chains(self):
+        chains = {}
+        for event, names in self.listening_plugins.items():
+            chain = []
+            for name in names:
+                plugincls = self.plugins.get(name)
+                if plugincls is None or not plugincls.enabled:
+                    continue
+                instance = self.instances.get(name)
+                if instance is not None:
+                    handler = instance.handlers.get(event)
+                    content_types = getattr(instance, "content_types", {}).get(event)
+                elif getattr(plugincls, "lazy_stub", False):
+                    # 未加载的插件先放一个代理，第一次调用时导入插件再转交
+                    handler = partial(self._dispatch_lazy, name, event)
+                    content_types = plugincls.content_types.get(event)
+                else:
+                    continue
+                if handler is None:
+                    continue
+                stats = self.handler_stats.get((name, event))
+                if stats is None:
+                    stats = self.handler_stats[(name, event)] = HandlerStats()
+                chain.append((name, handler, frozenset(content_types) if content_types else None, stats))
+            chains[event] = tuple(chain)
+        # 整体替换，emit_event拿到的始终是完整的一份处理链
+        self.handler_chains = chains
 
     def activate_plugins(self):  # 生成新开启的插件实例
         failed_plugins = []
         for name, plugincls in self.plugins.items():
             if plugincls.enabled:
                 if name not in self.instances:
-                    try:
-                        instance = plugincls()
-                    except Exception as e:
-                        logger.warn("Failed to init %s, diabled. %s" % (name, e))
-                        self.disable_plugin(name)
-                        failed_plugins.append(name)
+                    if getattr(plugincls, "lazy_stub", False):
+                        if plugincls.events is not None:
+                            self._listen(name, plugincls.events)
+                            continue
+                        # 索引中没有订阅的事件，只能立即加载
+                        if self._load_stub(name) is None:
+                            failed_plugins.append(name)
                         continue
-                    self.instances[name] = instance
-                    for event in instance.handlers:
-                        if event not in self.listening_plugins:
-                            self.listening_plugins[event] = []
-                        self.listening_plugins[event].append(name)
+                    instance = self._create_instance(name, plugincls)
+                    if instance is None:
+                        failed_plugins.append(name)
         self.refresh_order()
+        self._save_index()
         return failed_plugins
 
+    def _create_instance(self, name, plugincls):
+        try:
+            instance = plugincls()
+        except Exception as e:
+            logger.warn("Failed to init %s, diabled. %s" % (name, e))
+            self.disable_plugin(name)
+            return None
+        self.instances[name] = instance
+        self._listen(name, instance.handlers)
+        return instance
+
+    def _listen(self, name, events):
+        for names in self.listening_plugins.values():
+            if name in names:
+                names.remove(name)
+        for event in events:
+            if event not in self.listening_plugins:
+                self.listening_plugins[event] = []
+            self.listening_plugins[event].append(name)
+
+    def get_instance(self, name: str):
+        """插件实例，未加载的插件在这里加载"""
+        name = name.upper()
+        instance = self.instances.get(name)
+        if instance is None and getattr(self.plugins.get(name), "lazy_stub", False):
+            instance = self._load_stub(name)
+        return instance
+
+    def _dispatch_lazy(self, name, event, e_context, *args, **kwargs):
+        instance = self._load_stub(name)
+        if instance is None:
+            return
+        handler = instance.handlers.get(event)
+        if handler is not None:
+            handler(e_context, *args, **kwargs)
+
+    def _register_stub(self, plugin_path, entry):
+        events = entry.get("events")
+        stub = type(
+            "Lazy" + entry["name"],
+            (LazyPlugin,),
+            {
+                "name": entry["name"],
+                "priority": entry.get("priority", 0),
+                "desc": entry.get("desc"),
+                "author": entry.get("author"),
+                "path": plugin_path,
+                "version": entry.get("version", "1.0"),
+                "namecn": entry.get("namecn") or entry["name"],
+                "hidden": entry.get("hidden", False),
+                "enabled": True,
+                "events": None if events is None else tuple(Event[e] for e in events if e in Event.__members__),
+                "content_types": {
+                    Event[e]: [ContextType[t] for t in types if t in ContextType.__members__]
+                    for e, types in (entry.get("content_types") or {}).items()
+                    if e in Event.__members__
+                },
+            },
+        )
+        self.plugins[entry["name"].upper()] = stub
+        logger.info("Plugin %s_v%s registered (lazy), path=%s" % (stub.name, stub.version, plugin_path))
+
+    def _load_stub(self, name):
+        """导入未加载的插件并创建实例，失败时禁用插件"""
+        with self.lazy_lock:
+            instance = self.instances.get(name)
+            if instance is not None:
+                return instance
+            stub = self.plugins.get(name)
+            if stub is None or not getattr(stub, "lazy_stub", False) or not stub.enabled:
+                return None
+            plugin_name = os.path.basename(stub.path)
+            try:
+                self.current_plugin_path = stub.path
+                self.loaded[stub.path] = self._import_plugin(plugin_name, "plugins.{}".format(plugin_name), lazy=True)
+            except Exception as e:
+                logger.warning("Failed to import plugin %s: %s" % (plugin_name, e))
+                self.disable_plugin(name)
+                return None
+            finally:
+                self.current_plugin_path = None
+            plugincls = self.plugins.get(name)
+            if plugincls is stub:
+                logger.warning("Plugin %s not registered by %s, diabled" % (name, stub.path))
+                self.disable_plugin(name)
+                return None
+            plugincls.enabled = stub.enabled
+            plugincls.priority = stub.priority
+            self.plugins._update_heap(name)
+            instance = self._create_instance(name, plugincls)
+            self.refresh_order()
+            self._save_index()
+            return instance
+
+    def _import_plugin(self, plugin_name, import_path, lazy):
+        before = set(sys.modules)
+        start = time.perf_counter()
+        module = importlib.import_module(import_path)
+        elapsed = time.perf_counter() - start
+        new_modules = set(sys.modules) - before
+        self.import_stats[plugin_name] = {
+            "plugin": plugin_name,
+            "import_ms": round(elapsed * 1000, 1),
+            "modules": len(new_modules),
+            # 新导入的顶层包，用于找出拖慢启动的依赖
+            "packages": sorted({module_name.split(".")[0] for module_name in new_modules} - {"plugins"}),
+            "lazy": lazy,
+        }
+        if lazy:
+            logger.info("[PluginManager] lazy loaded plugin %s in %.1fms, %d new modules" % (plugin_name, elapsed * 1000, len(new_modules)))
+        return module
+
+    def get_import_report(self):
+        """插件导入耗时报告：启动耗时、各插件导入耗时(从高到低)以及仍未加载的插件"""
+        return {
+            "startup_ms": self.startup_time,
+            "imports": sorted(self.import_stats.values(), key=lambda item: item["import_ms"], reverse=True),
+            "deferred": [plugincls.name for plugincls in self.plugins.values() if getattr(plugincls, "lazy_stub", False)],
+        }
+
+    def _index_path(self):
+        return os.path.join(get_appdata_dir(), "plugin_index.json")
+
+    def _load_index(self):
+        try:
+            if os.path.exists(self._index_path()):
+                with open(self._index_path(), "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.warning("[PluginManager] load plugin index failed: %s" % e)
+        return {}
+
+    def _save_index(self):
+        """记录已加载插件的元数据和订阅的事件，下次启动时据此延迟加载"""
+        index = dict(self.plugin_index)
+        for name, plugincls in self.plugins.items():
+            if getattr(plugincls, "lazy_stub", False) or plugincls.path not in self.signatures:
+                continue
+            previous = index.get(plugincls.path) or {}
+            entry = {
+                "name": plugincls.name,
+                "priority": plugincls.priority,
+                "desc": plugincls.desc,
+                "author": plugincls.author,
+                "version": plugincls.version,
+                "namecn": plugincls.namecn,
+                "hidden": plugincls.hidden,
+                "signature": self.signatures[plugincls.path],
+                "events": None,
+                "content_types": {},
+            }
+            instance = self.instances.get(name)
+            if instance is not None:
+                entry["events"] = [event.name for event in instance.handlers]
+                entry["content_types"] = {
+                    event.name: [t.name for t in types] for event, types in getattr(instance, "content_types", {}).items() if types
+                }
+            elif previous.get("signature") == entry["signature"]:
+                entry["events"] = previous.get("events")
+                entry["content_types"] = previous.get("content_types", {})
+            index[plugincls.path] = entry
+        if index == self.plugin_index:
+            return
+        self.plugin_index = index
+        try:
+            path = self._index_path()
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index, f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("[PluginManager] save plugin index failed: %s" % e)
+
     def reload_plugin(self, name: str):
         name = name.upper()
         if name in self.instances:
@@ -166,9 +454,13 @@ class PluginManager:
             del self.instances[name]
             self.activate_plugins()
             return True
+        if getattr(self.plugins.get(name), "lazy_stub", False):
+            # 还未加载，首次加载时会读取最新配置
+            return True
         return False
 
     def load_plugins(self):
+        start = time.perf_counter()
         self.load_config()
         self.scan_plugins()
         # 加载全量插件配置
@@ -179,19 +471,76 @@ class PluginManager:
             if name.upper() not in self.plugins:
                 logger.error("Plugin %s not found, but found in plugins.json" % name)
         self.activate_plugins()
+        self.startup_time = round((time.perf_counter() - start) * 1000, 1)
+        report = self.get_import_report()
+        logger.info(
+            "[PluginManager] plugins loaded in %.1fms, imported: %s, deferred: %s"
+            % (
+                self.startup_time,
+                ", ".join("%s %.1fms" % (item["plugin"], item["import_ms"]) for item in report["imports"]) or "none",
+                ", ".join(report["deferred"]) or "none",
+            )
+        )
 
     def emit_event(self, e_context: EventContext, *args, **kwargs):
-        if e_context.event in self.listening_plugins:
-            for name in self.listening_plugins[e_context.event]:
-                if self.plugins[name].enabled and e_context.action == EventAction.CONTINUE:
-                    logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
-                    instance = self.instances[name]
-                    instance.handlers[e_context.event](e_context, *args, **kwargs)
-                    if e_context.is_break():
-                        e_context["breaked_by"] = name
-                        logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
+        chain = self.handler_chains.get(e_context.event)
+        if not chain:
+            return e_context
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for name, handler, content_types, stats in chain:
+            if e_context.action != EventAction.CONTINUE:
+                break
+            if content_types is not None:
+                context = e_context.econtext.get("context")
+                if context is None or context.type not in content_types:
+                    stats.skipped += 1
+                    continue
+            if debug:
+                logger.debug("Plugin %s triggered by event %s" % (name, e_context.event))
+            start = time.perf_counter()
+            try:
+                handler(e_context, *args, **kwargs)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.histogram.record(time.perf_counter() - start)
+            if e_context.is_break():
+                stats.breaks += 1
+                e_context["breaked_by"] = name
+                if debug:
+                    logger.debug("Plugin %s breaked event %s" % (name, e_context.event))
         return e_context
 
+    def get_handler_stats(self):
+        """各插件在各事件上的调用次数、耗时分位数，按总耗时从高到低排序"""
+        stats = [
+            {"plugin": name, "event": event.name, **handler_stats.to_dict()}
+            for (name, event), handler_stats in list(self.handler_stats.items())
+        ]
+        return sorted(stats, key=lambda item: item["total_ms"], reverse=True)
+
+    def reset_handler_stats(self):
+        for handler_stats in list(self.handler_stats.values()):
+            handler_stats.histogram.reset()
+            handler_stats.breaks = handler_stats.skipped = handler_stats.errors = 0
+
+    def dump_handler_stats(self, path=None):
+        """把插件耗时统计写入JSON文件，返回文件路径"""
+        path = path or conf().get("plugin_profile_path") or os.path.join(get_appdata_dir(), "plugin_profile.json")
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        report = {
+            "pid": os.getpid(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "handlers": self.get_handler_stats(),
+            "imports": self.get_import_report(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+        return path
+
     def set_plugin_priority(self, name: str, priority: int):
         name = name.upper()
         if name not in self.plugins:
@@ -231,6 +580,7 @@ class PluginManager:
             rawname = self.plugins[name].name
             self.pconf["plugins"][rawname]["enabled"] = False
             self.save_config()
+            self.rebuild_handler_chains()
             return True
         return True
 
@@ -332,6 +682,7 @@ class PluginManager:
             del self.pconf["plugins"][rawname]
             self.loaded[dirname] = None
             self.save_config()
+            self.rebuild_handler_chains()
             return True, "卸载插件成功"
         except Exception as e:
             logger.error("Failed to uninstall plugin, {}".format(e))
@@ -25,6 +25,7 @@ class Tool(Plugin):
     def __init__(self):
         super().__init__()
         self.handlers[Event.ON_HANDLE_CONTEXT] = self.on_handle_context
+        self.content_types[Event.ON_HANDLE_CONTEXT] = [ContextType.TEXT]
 
         self.app = self._reset_app()
 
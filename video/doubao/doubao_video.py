@@ -1,5 +1,3 @@
-import time
-
 from volcenginesdkarkruntime import Ark
 
 from bot.bot import Bot
@@ -15,6 +13,7 @@ from bridge.context import Context
 from bridge.reply import Reply, ReplyType
 from common.aspect_ratio import parse_aspect_ratio_from_prompt
 from common import const, memory
+from common.job_poller import DONE, FAILED, PENDING, Job, job_poller
 from common.log import logger
 from common.model_status import model_state
 from common.utils import (
@@ -176,46 +175,56 @@ class DoubaoVideoBot(Bot):
                     logger.warning(f"[{model.upper()}] Ark video task create failed: {error_message}")
                     return Reply(ReplyType.ERROR, error_message)
                 raise
-            video_duration, video_url = self.get_video_info(response.id, model)
-
-            try:
-                base64_data = url_to_base64(video_url)
-                session_manager.session_inject_media(
-                    session_id=session_id,
-                    media_type="video",
-                    data=base64_data,
-                    source_model=model,
-                    remote_url=video_url
-                )
-                logger.info(f"[{model.upper()}] video injected to session, model={model}, session_id={session_id}")
-            except Exception as e:
-                logger.warning(f"[{model.upper()}] failed to inject video to session: {e}")
-
-            return Reply(ReplyType.VIDEO_URL, (video_duration, video_url))
+            logger.info(f"[{model.upper()}] 任务已提交, task_id={response.id}")
+            job = Job("doubao_video", response.id, context, data={"model": model})
+            if job_poller.can_deliver(context):
+                job_poller.submit(self, job)
+                return None
+            return job_poller.run_sync(self, job)
         except Exception as e:
             logger.error(f"[{model.upper()}] fetch reply error: {e}")
             return Reply(ReplyType.ERROR, self._format_error_message(model, e))
 
-    def get_video_info(self, task_id, model):
-        logger.info(f"[{model.upper()}] polling task status, task_id={task_id}")
-        while True:
-            try:
-                get_result = self.client.content_generation.tasks.get(task_id=task_id)
-            except Exception as e:
-                error_message = self._format_ark_exception(model, e, service_name="豆包视频")
-                if error_message:
-                    logger.warning(f"[{model.upper()}] Ark video task poll failed: {error_message}")
-                    raise RuntimeError(error_message)
-                raise
-            status = get_result.status
-            if status == "succeeded":
-                logger.info(f"[{model.upper()}] task succeeded, task_id={task_id}")
-                return get_result.duration, get_result.content.video_url
-            if status == "failed":
-                logger.error(f"[{model.upper()}] task failed, task_id={task_id}, error={get_result.error}")
-                raise RuntimeError(get_result.error)
-            logger.info(f"[{model.upper()}] current status={status}, task_id={task_id}, retry after 30 seconds")
-            time.sleep(30)
+    def poll_job(self, job):
+        model = job.model
+        try:
+            get_result = self.client.content_generation.tasks.get(task_id=job.task_id)
+        except Exception as e:
+            error_message = self._format_ark_exception(model, e, service_name="豆包视频")
+            if error_message:
+                logger.warning(f"[{model.upper()}] Ark video task poll failed: {error_message}")
+                return FAILED, error_message
+            raise
+        status = get_result.status
+        if status == "succeeded":
+            logger.info(f"[{model.upper()}] task succeeded, task_id={job.task_id}")
+            return DONE, (get_result.duration, get_result.content.video_url)
+        if status == "failed":
+            logger.error(f"[{model.upper()}] task failed, task_id={job.task_id}, error={get_result.error}")
+            return FAILED, str(get_result.error)
+        logger.info(f"[{model.upper()}] current status={status}, task_id={job.task_id}, attempts={job.attempts}")
+        return PENDING, None
+
+    def complete_job(self, job, value):
+        model = job.model
+        video_duration, video_url = value
+        try:
+            base64_data = url_to_base64(video_url)
+            get_chat_session_manager(job.session_id).session_inject_media(
+                session_id=job.session_id,
+                media_type="video",
+                data=base64_data,
+                source_model=model,
+                remote_url=video_url
+            )
+            logger.info(f"[{model.upper()}] video injected to session, model={model}, session_id={job.session_id}")
+        except Exception as e:
+            logger.warning(f"[{model.upper()}] failed to inject video to session: {e}")
+
+        return Reply(ReplyType.VIDEO_URL, (video_duration, video_url))
+
+    def fail_job(self, job, message):
+        return Reply(ReplyType.ERROR, self._format_error_message(job.model, message))
 
     def _build_task_params(self, *, model, content, resolution, ratio, duration_seconds):
         generate_audio = self._should_enable_audio(model)
@@ -4,11 +4,13 @@ from bot.bot import Bot
 from bot.gemini.gemini_common import (
     GeminiVideoGenerationError,
     data_url_to_pil_image,
-    generate_video,
+    download_generated_video,
     get_gemini_video_settings,
     get_paid_client,
     infer_gemini_aspect_ratio_from_data_urls,
     infer_gemini_aspect_ratio_from_images,
+    get_video_operation,
+    submit_video_generation,
 )
 from bot.gemini.gemini_error import format_gemini_error, is_gemini_sdk_error
 from bot.gemini.google_gemini_session import _gemini_sessions
@@ -16,6 +18,7 @@ from bridge.context import Context
 from bridge.reply import Reply, ReplyType
 from common.aspect_ratio import parse_aspect_ratio_from_prompt
 from common import const, memory
+from common.job_poller import DONE, PENDING, Job, job_poller
 from common.log import logger
 from common.model_status import model_state
 from common.utils import get_chat_session_manager, get_image_urls_from_session
@@ -61,8 +64,7 @@ class GoogleGeminiVideoBot(Bot):
                 f"[{model.upper()}] 请求参数: resolution={resolution}, "
                 f"ratio={aspect_ratio}, duration={duration_seconds}, sound={request_meta['sound_state']}"
             )
-            logger.info(f"[{model.upper()}] polling task status via SDK")
-            response = generate_video(
+            operation = submit_video_generation(
                 paid_client=self.paid_client,
                 session_id=session_id,
                 video_model=model,
@@ -74,29 +76,56 @@ class GoogleGeminiVideoBot(Bot):
                 resolution=resolution,
                 duration_seconds=duration_seconds
             )
+            logger.info(f"[{model.upper()}] 任务已提交, operation={operation.name}")
+            job = Job("gemini_video", operation.name, context, data={"model": model})
+            if job_poller.can_deliver(context):
+                job_poller.submit(self, job)
+                return None
+            return job_poller.run_sync(self, job)
+        except GeminiVideoGenerationError as e:
+            logger.error(f"[GoogleGeminiVideo] business error: {e}")
+            return Reply(ReplyType.ERROR, format_gemini_error(e, model, service_name="Gemini 视频"))
+        except Exception as e:
+            logger.error(f"[GoogleGeminiVideo] fetch reply error: {e}")
+            if is_gemini_sdk_error(e):
+                return Reply(ReplyType.ERROR, format_gemini_error(e, model, service_name="Gemini 视频"))
+            return Reply(ReplyType.ERROR, "Gemini 视频生成失败，请稍后重试。")
 
-            try:
-                session_manager.session_inject_media(
-                    session_id=session_id,
-                    media_type="video",
-                    data=base64.b64encode(response.video_bytes).decode("utf-8"),
-                    source_model=model,
-                    mime_type="video/mp4"
-                )
-                logger.info(f"[GoogleGeminiVideo] video injected to session, model={model}, session_id={session_id}")
-            except Exception as e:
-                logger.warning(f"[GoogleGeminiVideo] failed to inject video to session: {e}")
+    def poll_job(self, job):
+        operation = get_video_operation(self.paid_client, job.task_id)
+        if not operation.done:
+            logger.info(f"[{job.model.upper()}] current status=running, operation={job.task_id}, attempts={job.attempts}")
+            return PENDING, None
+        return DONE, operation
 
-            return Reply(ReplyType.VIDEO, response)
+    def complete_job(self, job, operation):
+        model = job.model
+        try:
+            response = download_generated_video(self.paid_client, model, operation)
         except GeminiVideoGenerationError as e:
             logger.error(f"[GoogleGeminiVideo] business error: {e}")
             return Reply(ReplyType.ERROR, format_gemini_error(e, model, service_name="Gemini 视频"))
         except Exception as e:
-            logger.error(f"[GoogleGeminiVideo] fetch reply error: {e}")
+            logger.error(f"[GoogleGeminiVideo] download video error: {e}")
             if is_gemini_sdk_error(e):
                 return Reply(ReplyType.ERROR, format_gemini_error(e, model, service_name="Gemini 视频"))
             return Reply(ReplyType.ERROR, "Gemini 视频生成失败，请稍后重试。")
 
+        try:
+            session_manager = get_chat_session_manager(job.session_id) or _gemini_sessions
+            session_manager.session_inject_media(
+                session_id=job.session_id,
+                media_type="video",
+                data=base64.b64encode(response.video_bytes).decode("utf-8"),
+                source_model=model,
+                mime_type="video/mp4"
+            )
+            logger.info(f"[GoogleGeminiVideo] video injected to session, model={model}, session_id={job.session_id}")
+        except Exception as e:
+            logger.warning(f"[GoogleGeminiVideo] failed to inject video to session: {e}")
+
+        return Reply(ReplyType.VIDEO, response)
+
     def _get_video_inputs(self, query, session_id, model, session_manager):
         video_mode = model_state.get_video_mode(session_id)
         prompt_aspect_ratio = self._parse_aspect_ratio_from_prompt(query)
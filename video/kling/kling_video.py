@@ -3,7 +3,6 @@
 import io
 import time
 import jwt
-import requests
 import base64
 
 from PIL import Image
@@ -24,6 +23,8 @@ from common import const, memory
 from config import conf
 from common.model_status import model_state
 from common.video_status import video_state
+from common.http_client import http_client
+from common.job_poller import BACKOFF, DONE, FAILED, PENDING, Job, job_poller
 
 
 class KlingVideoBot(Bot):
@@ -135,7 +136,7 @@ class KlingVideoBot(Bot):
                 f"aspect_ratio={payload.get('aspect_ratio')}, duration={payload.get('duration')}, sound={payload.get('sound')}"
             )
 
-            resp = requests.post(
+            resp = http_client("kling").post(
                 f"{self.API_BASE}{self.ENDPOINT_OMNI}",
                 headers=self._headers(),
                 json=payload,
@@ -155,25 +156,11 @@ class KlingVideoBot(Bot):
 
             logger.info(f"[{model.upper()}] 任务已提交, task_id={task_id}, model={model}")
 
-            video_url, video_duration, poll_err = self._poll_task(task_id, model)
-            if poll_err:
-                return Reply(ReplyType.ERROR, f"[{model.upper()}] {poll_err}")
-
-            # 视频结果注入 session
-            try:
-                base64_data = url_to_base64(video_url)
-                session_manager.session_inject_media(
-                    session_id=session_id,
-                    media_type='video',
-                    data=base64_data,
-                    source_model=model,
-                    remote_url=video_url
-                )
-                logger.info(f"[{model.upper()}] video injected to session, model={model}, session_id={session_id}")
-            except Exception as e:
-                logger.warning(f"[{model.upper()}] failed to inject video to session: {e}")
-
-            return Reply(ReplyType.VIDEO_URL, (video_duration, video_url))
+            job = Job("kling_video", task_id, context, data={"model": model})
+            if job_poller.can_deliver(context):
+                job_poller.submit(self, job)
+                return None
+            return job_poller.run_sync(self, job)
 
         except Exception as e:
             logger.error(f"[{model.upper()}] fetch reply error: {e}")
@@ -182,53 +169,60 @@ class KlingVideoBot(Bot):
                 return Reply(ReplyType.ERROR, f"[{model.upper()}] {error_message}")
             return Reply(ReplyType.ERROR, f"[{model.upper()}] {e}")
 
-    def _poll_task(self, task_id: str, model: str, max_retries=120, interval=5) -> tuple:
-        query_url = f"{self.API_BASE}{self.ENDPOINT_OMNI}/{task_id}"
-        retry_delay = interval
-        logger.info(f"[{model.upper()}] polling task status, task_id={task_id}")
-
-        for i in range(max_retries):
-            time.sleep(retry_delay)
-            try:
-                resp = requests.get(query_url, headers=self._headers(), timeout=15)
-                resp.raise_for_status()
-                result = resp.json()
-                if is_kling_retryable(result):
-                    retry_delay = min(retry_delay * 2, 30)
-                    logger.warning(f"[{model.upper()}] 并发超限，退避重试 {retry_delay}s")
-                    continue
-
-                err = format_kling_response_error(result, service_name="可灵视频")
-                if err:
-                    return None, None, err
-
-                data = result.get("data", {})
-                status = data.get("task_status")
-
-                if status == "succeed":
-                    videos = data.get("task_result", {}).get("videos", [])
-                    if videos:
-                        url = videos[0].get("url")
-                        duration = float(videos[0].get("duration", 5))
-                        logger.info(f"[{model.upper()}] task succeeded, task_id={task_id}")
-                        return url, duration, None
-
-                elif status == "failed":
-                    task_error = format_kling_task_failure(result, service_name="可灵视频")
-                    logger.error(f"[{model.upper()}] task failed, task_id={task_id}, error={task_error}")
-                    return None, None, task_error
-
-                retry_delay = interval
-                logger.info(f"[{model.upper()}] current status={status}, task_id={task_id}, retry after {retry_delay} seconds")
-
-            except Exception as e:
-                http_error = format_kling_http_error(e, service_name="可灵视频")
-                if http_error:
-                    logger.warning(f"[{model.upper()}] 轮询异常: {http_error}")
-                    return None, None, http_error
-                logger.warning(f"[{model.upper()}] 轮询异常: {e}")
-
-        return None, None, "任务超时，请稍后重试"
+    def poll_job(self, job):
+        model = job.model
+        query_url = f"{self.API_BASE}{self.ENDPOINT_OMNI}/{job.task_id}"
+        try:
+            resp = http_client("kling").get(query_url, headers=self._headers(), timeout=15)
+            resp.raise_for_status()
+            result = resp.json()
+        except Exception as e:
+            http_error = format_kling_http_error(e, service_name="可灵视频")
+            if http_error:
+                logger.warning(f"[{model.upper()}] 轮询异常: {http_error}")
+                return FAILED, http_error
+            raise
+        if is_kling_retryable(result):
+            logger.warning(f"[{model.upper()}] 并发超限，退避重试, task_id={job.task_id}")
+            return BACKOFF, None
+
+        err = format_kling_response_error(result, service_name="可灵视频")
+        if err:
+            return FAILED, err
+
+        data = result.get("data", {})
+        status = data.get("task_status")
+        if status == "succeed":
+            videos = data.get("task_result", {}).get("videos", [])
+            if videos:
+                logger.info(f"[{model.upper()}] task succeeded, task_id={job.task_id}")
+                return DONE, (videos[0].get("url"), float(videos[0].get("duration", 5)))
+        elif status == "failed":
+            task_error = format_kling_task_failure(result, service_name="可灵视频")
+            logger.error(f"[{model.upper()}] task failed, task_id={job.task_id}, error={task_error}")
+            return FAILED, task_error
+
+        logger.info(f"[{model.upper()}] current status={status}, task_id={job.task_id}, attempts={job.attempts}")
+        return PENDING, None
+
+    def complete_job(self, job, value):
+        model = job.model
+        video_url, video_duration = value
+        # 视频结果注入 session
+        try:
+            base64_data = url_to_base64(video_url)
+            get_chat_session_manager(job.session_id).session_inject_media(
+                session_id=job.session_id,
+                media_type='video',
+                data=base64_data,
+                source_model=model,
+                remote_url=video_url
+            )
+            logger.info(f"[{model.upper()}] video injected to session, model={model}, session_id={job.session_id}")
+        except Exception as e:
+            logger.warning(f"[{model.upper()}] failed to inject video to session: {e}")
+
+        return Reply(ReplyType.VIDEO_URL, (video_duration, video_url))
 
     def _normalize_duration(self, duration, model) -> str:
         normalized = str(duration).strip()
@@ -9,6 +9,8 @@ except ImportError:
     logger.warn("import pysilk failed, wechaty voice message will not be supported.")
 
 from pydub import AudioSegment
+from pydub.silence import detect_silence
+from pydub.utils import mediainfo
 
 sil_supports = [8000, 12000, 16000, 24000, 32000, 44100, 48000]  # slk转wav时，支持的采样率
 
@@ -131,3 +133,62 @@ def split_audio(file_path, max_segment_length_ms=60000):
         segment.export(path, format=format)
         files.append(path)
     return audio_length_ms, files
+
+
+def get_audio_duration_ms(file_path):
+    """
+    读取音频时长(毫秒)，不解码音频内容：wav读文件头，其他格式用ffprobe；读取失败返回None
+    """
+    try:
+        if file_path.lower().endswith(".wav"):
+            with wave.open(file_path, "rb") as wav:
+                return int(wav.getnframes() * 1000 / wav.getframerate())
+        duration = mediainfo(file_path).get("duration")
+        return int(float(duration) * 1000) if duration else None
+    except Exception as e:
+        logger.debug(f"read audio duration failed, file={file_path}, error={e}")
+        return None
+
+
+def _find_cut(audio, target_ms, lower_ms, min_silence_len, silence_thresh, frame_ms=20):
+    """
+    在(lower_ms, target_ms]内找切分点：优先取最靠后的一段静音的中点，没有静音时取音量最低的一帧
+    """
+    window = audio[lower_ms:target_ms]
+    silences = detect_silence(window, min_silence_len=min_silence_len, silence_thresh=silence_thresh, seek_step=10)
+    if silences:
+        start, end = silences[-1]
+        return lower_ms + (start + end) // 2
+    if len(window) <= frame_ms:
+        return target_ms
+    quietest = min(range(0, len(window) - frame_ms + 1, frame_ms), key=lambda t: (window[t : t + frame_ms].rms, -t))  # 音量相同时取靠后的，分段尽量长
+    return lower_ms + quietest + frame_ms // 2
+
+
+def split_audio_on_silence(file_path, max_segment_length_ms=60000, search_window_ms=5000, min_silence_len=300, silence_thresh_offset=16):
+    """
+    分割音频文件，切分点选在每段上限前search_window_ms内的静音处，避免把一个字词切成两半分别识别
+    """
+    duration_ms = get_audio_duration_ms(file_path)
+    if duration_ms is not None and duration_ms <= max_segment_length_ms:
+        # 短语音是常见情况，先读时长，不必为此解码整段音频
+        return duration_ms, [file_path]
+    audio = AudioSegment.from_file(file_path)
+    audio_length_ms = len(audio)
+    if audio_length_ms <= max_segment_length_ms:
+        return audio_length_ms, [file_path]
+    silence_thresh = audio.dBFS - silence_thresh_offset  # 相对整段平均音量判断静音，适应不同的录音电平
+    search_window_ms = min(search_window_ms, max_segment_length_ms // 2)
+    cuts = [0]
+    while audio_length_ms - cuts[-1] > max_segment_length_ms:
+        target_ms = cuts[-1] + max_segment_length_ms
+        cuts.append(_find_cut(audio, target_ms, target_ms - search_window_ms, min_silence_len, silence_thresh))
+    cuts.append(audio_length_ms)
+    file_prefix = file_path[: file_path.rindex(".")]
+    format = file_path[file_path.rindex(".") + 1 :]
+    files = []
+    for i, (start_ms, end_ms) in enumerate(zip(cuts, cuts[1:])):
+        path = f"{file_prefix}_{i+1}" + f".{format}"
+        audio[start_ms:end_ms].export(path, format=format)
+        files.append(path)
+    return audio_length_ms, files
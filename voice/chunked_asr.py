@@ -0,0 +1,177 @@
+"""
+长语音分段并行识别：语音识别服务的耗时随音频时长增长，几分钟的语音整段识别要等很久。
+超过voice_asr_segment_seconds的语音在静音处切成多段(split_audio_on_silence)，各段同时提交给当前配置的语音识别服务(voice_to_text)，
+结果按原顺序拼接，总耗时接近最慢的一段；也可以用iter_text按顺序逐段取出已识别的文字，先展示给用户。
+用法：
+    transcription = ChunkedTranscription(wav_path, Bridge().fetch_voice_to_text)
+    for text in transcription.iter_text():  # 可选，逐段取出
+        ...
+    reply = transcription.result()
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bridge.reply import Reply, ReplyType
+from common.log import logger
+from config import conf
+from voice.audio_convert import split_audio_on_silence
+
+DEFAULT_SEGMENT_SECONDS = 60
+DEFAULT_ASR_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def asr_executor():
+    """各会话共用的识别线程池，大小由voice_asr_workers配置，限制同时发往识别服务的请求数"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = conf().get("voice_asr_workers", DEFAULT_ASR_WORKERS)
+                _executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="voice-asr")
+    return _executor
+
+
+def _needs_space(left, right):
+    """英文等以空格分词的语言在段与段之间补一个空格，中文直接相连"""
+    return left.isascii() and left.isalnum() and right.isascii() and right.isalnum()
+
+
+def join_segments(texts):
+    result = ""
+    for text in texts:
+        text = (text or "").strip()
+        if not text:
+            continue
+        if result and _needs_space(result[-1], text[0]):
+            result += " "
+        result += text
+    return result
+
+
+class ChunkedTranscription:
+    def __init__(self, file_path, voice_to_text, segment_seconds=None):
+        """voice_to_text(path) -> Reply，调用语音识别服务；不超过一段长度的语音不切分，直接整段识别"""
+        self.file_path = file_path
+        self.voice_to_text = voice_to_text
+        segment_seconds = segment_seconds or conf().get("voice_asr_segment_seconds", DEFAULT_SEGMENT_SECONDS)
+        self.started_at = time.time()
+        try:
+            self.duration_ms, self.files = split_audio_on_silence(file_path, int(segment_seconds * 1000))
+        except Exception as e:
+            logger.warning(f"[ASR] split audio failed, recognize as a whole, file={file_path}, error={e}")
+            self.duration_ms, self.files = None, [file_path]
+        self.chunked = len(self.files) > 1
+        if self.chunked:
+            executor = asr_executor()
+            self.futures = [executor.submit(voice_to_text, path) for path in self.files]
+            logger.info(f"[ASR] {file_path} duration={self.duration_ms}ms split into {len(self.files)} segments")
+        self._single_reply = None
+        self._single_lock = threading.Lock()
+
+    def _reply_at(self, index):
+        if not self.chunked:
+            with self._single_lock:  # iter_text和result可能在不同线程调用，整段只识别一次
+                if self._single_reply is None:
+                    self._single_reply = self._recognize(self.voice_to_text, self.file_path)
+                return self._single_reply
+        try:
+            return self.futures[index].result()
+        except Exception as e:
+            logger.warning(f"[ASR] segment {index + 1}/{len(self.files)} failed: {e}")
+            return Reply(ReplyType.ERROR, str(e))
+
+    @staticmethod
+    def _recognize(voice_to_text, path):
+        try:
+            return voice_to_text(path)
+        except Exception as e:
+            logger.warning(f"[ASR] recognize {path} failed: {e}")
+            return Reply(ReplyType.ERROR, str(e))
+
+    def iter_replies(self):
+        """按原顺序产出各段的识别结果，前面的段识别完成即可取出，不必等后面的段"""
+        for index in range(len(self.files)):
+            yield self._reply_at(index)
+
+    def iter_text(self, prefix=""):
+        """按原顺序逐段产出识别出的文字(增量，含段间空格)，识别失败的段跳过"""
+        text = ""
+        if prefix:
+            yield prefix
+        for reply in self.iter_replies():
+            if not reply or reply.type != ReplyType.TEXT:
+                continue
+            joined = join_segments([text, reply.content])
+            delta, text = joined[len(text):], joined
+            if delta:
+                yield delta
+
+    def result(self) -> Reply:
+        """等待全部分段识别完成，拼接为完整文本；所有段都失败时返回第一段的错误，并清理分段文件"""
+        try:
+            replies = list(self.iter_replies())
+        finally:
+            self._cleanup()
+        texts = [reply.content for reply in replies if reply and reply.type == ReplyType.TEXT]
+        if self.chunked:
+            logger.info(
+                f"[ASR] {self.file_path} {len(texts)}/{len(replies)} segments recognized, "
+                f"cost={time.time() - self.started_at:.2f}s"
+            )
+        if not texts:
+            return replies[0] if replies and replies[0] else Reply(ReplyType.ERROR, "语音识别失败")
+        return Reply(ReplyType.TEXT, join_segments(texts))
+
+    def _cleanup(self):
+        if not self.chunked:
+            return
+        for path in self.files:
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+
+
+if __name__ == "__main__":
+    # 用模拟的识别服务对比整段识别与分段并行识别的耗时：python -m voice.chunked_asr [音频文件]
+    import sys
+
+    from pydub import AudioSegment
+    from pydub.generators import Sine
+
+    REALTIME_FACTOR = 0.01  # 模拟识别耗时：每秒音频0.01秒
+
+    def fake_voice_to_text(path):
+        seconds = len(AudioSegment.from_file(path)) / 1000
+        time.sleep(seconds * REALTIME_FACTOR)
+        return Reply(ReplyType.TEXT, f"[{os.path.basename(path)} {seconds:.1f}s]")
+
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        # 5分钟测试音频：每句7秒音调+0.6秒停顿
+        path = "tmp/chunked_asr_bench.wav"
+        os.makedirs("tmp", exist_ok=True)
+        sentence = Sine(440).to_audio_segment(duration=7000, volume=-20) + AudioSegment.silent(600)
+        audio = AudioSegment.empty()
+        while len(audio) < 300000:
+            audio += sentence
+        audio[:300000].export(path, format="wav")
+
+    start = time.time()
+    whole = fake_voice_to_text(path)
+    print(f"whole: {time.time() - start:.2f}s {whole.content}")
+
+    start = time.time()
+    transcription = ChunkedTranscription(path, fake_voice_to_text)
+    first = None
+    for delta in transcription.iter_text():
+        first = first or time.time() - start
+    reply = transcription.result()
+    print(f"chunked: {time.time() - start:.2f}s first_text={first:.2f}s segments={len(transcription.files)} {reply.content}")